@@ -0,0 +1,121 @@
+"""
+常驻爬虫 agent 客户端 (节点上的 spiders/crawler_agent.py)
+- 通过已有 SSH 连接开 direct-tcpip 隧道到节点 127.0.0.1:AGENT_PORT，不额外开放端口
+- agent 没在跑就用 nohup 拉起，等它能响应 ping
+- 提交任务后返回隧道 channel，后端沿用 pump_channel 转发日志和 @@EVENT；结束时 agent 发 @@EXIT <退出码>
+- 提交时带上 agent 生成的令牌 (节点上 <代码目录>/.crawler_agent_token，0600)，用同一个 SSH 账号读取
+"""
+import json
+import logging
+import os
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+AGENT_PORT = int(os.environ.get("CRAWLER_AGENT_PORT", "8765"))
+AGENT_WARM = int(os.environ.get("CRAWLER_AGENT_WARM", "2"))
+HANDSHAKE_PREFIX = "@@AGENT "
+EXIT_PREFIX = "@@EXIT "
+TOKEN_FILE = ".crawler_agent_token"
+
+
+class AgentUnavailable(Exception):
+    """agent 连不上或拒绝任务，调用方回退到一次性启动"""
+
+
+def read_token(client, remote_code_dir):
+    """读取节点上的 agent 令牌；agent 还没启动过时返回空串"""
+    _, stdout, _ = client.exec_command(f"cat {remote_code_dir.rstrip('/')}/{TOKEN_FILE} 2>/dev/null")
+    token = stdout.read().decode("utf-8", "ignore").strip()
+    stdout.channel.recv_exit_status()
+    return token
+
+
+def open_channel(client, port=AGENT_PORT, timeout=5):
+    transport = client.get_transport()
+    if transport is None:
+        return None
+    try:
+        return transport.open_channel("direct-tcpip", ("127.0.0.1", port), ("127.0.0.1", 0), timeout=timeout)
+    except Exception:
+        return None
+
+
+def _read_line(channel, timeout=10):
+    """读到第一个换行为止，返回 (该行, 之后已经收到的字节)"""
+    channel.settimeout(timeout)
+    data = b""
+    while b"\n" not in data:
+        try:
+            chunk = channel.recv(4096)
+        except socket.timeout:
+            break
+        if not chunk:
+            break
+        data += chunk
+    line, _, rest = data.partition(b"\n")
+    return line.decode("utf-8", "replace").strip(), rest
+
+
+def _request(client, payload, port=AGENT_PORT):
+    channel = open_channel(client, port)
+    if channel is None:
+        return None, None, b""
+    channel.sendall((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+    reply, rest = _read_line(channel)
+    return channel, reply, rest
+
+
+def ping(client, port=AGENT_PORT):
+    channel, reply, _ = _request(client, {"op": "ping"}, port)
+    if channel is not None:
+        channel.close()
+    return bool(reply) and reply.startswith(HANDSHAKE_PREFIX + "pong")
+
+
+def start_agent(client, remote_code_dir, port=AGENT_PORT, warm=AGENT_WARM, wait=20):
+    """在节点上后台拉起 agent，等到能 ping 通"""
+    cmd = (f"cd {remote_code_dir} && export PYTHONPATH=$PYTHONPATH:. && "
+           f"nohup python3 crawler_agent.py --port {port} --warm {warm} > crawler_agent.log 2>&1 < /dev/null &")
+    _, stdout, _ = client.exec_command(cmd)
+    stdout.channel.recv_exit_status()
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        if ping(client, port):
+            return True
+        time.sleep(0.5)
+    return False
+
+
+def submit(client, remote_code_dir, payload, port=AGENT_PORT, retries=3):
+    """
+    提交任务，返回 (channel, 握手之后已收到的输出字节)
+    - 第一次连不上: 拉起 agent 后重试
+    - agent 回复 reload (代码已更新，正在重启): 等它重新就绪后重试
+    """
+    payload = dict(payload, op="submit", token=read_token(client, remote_code_dir))
+    started = False
+    for _ in range(retries):
+        channel, reply, rest = _request(client, payload, port)
+        if channel is None:
+            if started:
+                break
+            logger.info(f" agent 未运行，正在启动 (端口 {port})")
+            started = True
+            if not start_agent(client, remote_code_dir, port):
+                break
+            # 令牌由刚启动的 agent 生成
+            payload["token"] = read_token(client, remote_code_dir)
+            continue
+        if reply.startswith(HANDSHAKE_PREFIX + "accepted"):
+            return channel, rest
+        channel.close()
+        if reply == HANDSHAKE_PREFIX + "reload":
+            time.sleep(1)
+            deadline = time.time() + 20
+            while time.time() < deadline and not ping(client, port):
+                time.sleep(0.5)
+            continue
+        raise AgentUnavailable(reply or "agent 无响应")
+    raise AgentUnavailable("无法连接常驻 agent")
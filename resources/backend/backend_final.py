@@ -4,14 +4,39 @@ Flask Backend API - 完美适配 main.py
 import sys
 import os
 import logging
-from queue import Queue
 import threading
 import time
 import json
-import paramiko
 from flask import Flask, request, jsonify, Response, send_from_directory
 from flask_cors import CORS
 
+# ==================== 后端子模块导入 ====================
+try:
+    # 打包 EXE / launcher 模式
+    from resources.backend.file_sync import sync_files
+    from resources.backend.ssh_pool import SSHConnectionPool
+    from resources.backend.log_bus import LogBus
+    from resources.backend.log_shipper import LogBatcher, pump_channel
+    from resources.backend.job_registry import JobRegistry, PGID_PREFIX
+    from resources.backend import results_export
+    from resources.backend.results_index import ResultsIndex
+    from resources.backend import metrics
+    from resources.backend.job_registry import PHASE_BUCKETS
+    from resources.backend import agent_client
+except ImportError:
+    # 单独运行 backend_final.py 模式
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from file_sync import sync_files
+    from ssh_pool import SSHConnectionPool
+    from log_bus import LogBus
+    from log_shipper import LogBatcher, pump_channel
+    from job_registry import JobRegistry, PGID_PREFIX
+    import results_export
+    from results_index import ResultsIndex
+    import metrics
+    from job_registry import PHASE_BUCKETS
+    import agent_client
+
 # ==================== 1. 路径与静态资源配置 (核心修复) ====================
 # 获取 resources 目录的绝对路径 (兼容本地运行和打包环境)
 CURRENT_FILE_PATH = os.path.abspath(__file__)
@@ -76,152 +101,283 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # 全局变量
-log_queue = Queue()
-active_tasks = {}
+# 日志总线: 每个 SSE 客户端独立缓冲，支持 task_id 过滤与 Last-Event-ID 重放
+log_bus = LogBus(replay_size=5000, buffer_size=2000)
+# 任务注册表: 唯一 ID、结构化进度、取消、按数量/时间保留已结束任务
+job_registry = JobRegistry(max_finished=200, finished_ttl=24 * 3600)
+# 后端自身的累计计数 (同步字节数、日志转发行数)，由 /metrics 输出
+backend_counters = metrics.CounterSet()
+log_rate = metrics.RateMeter(window=60)
+STARTED_AT = time.time()
 
 # 爬虫配置
 SPIDERS = {
-    "depop": {"file": "depop_crawler.py", "dir_name": "depop_data"},
-    "ebay": {"file": "ebay_crawler.py", "dir_name": "ebay_data"},
+    "depop": {"file": "depop_crawler.py", "dir_name": "depop_data", "agent": True},
+    "ebay": {"file": "ebay_crawler.py", "dir_name": "ebay_data", "agent": True},
     "goofish": {"file": "goofish_crawler.py", "dir_name": "goofish_data"},
     "vips": {"file": "vips_crawler.py", "dir_name": "vips_data"},
     "xiaomi": {"file": "xiaomiyoupin_crawler.py", "dir_name": "xiaomiyoupin_data"},
-    "grailed": {"file": "grailed_crawler.py", "dir_name": "grailed_data"},
+    "grailed": {"file": "grailed_crawler.py", "dir_name": "grailed_data", "agent": True},
 }
 
 
-def create_ssh_client(server_ip, server_user, key_file_path):
-    try:
-        key = paramiko.RSAKey.from_private_key_file(key_file_path)
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(hostname=server_ip, username=server_user, pkey=key, timeout=10)
-        logger.info(f" link to {server_ip}")
-        return client
-    except Exception as e:
-        logger.error(f" SSH filed: {e}")
-        raise
+# 本地结果数据根目录: 任务结束后结果文件拉回这里 (_pull_job_results)，也可以是与节点共享的目录；
+# 结果查询只索引这里的文件
+RESULTS_DATA_ROOT = os.environ.get("CRAWLER_DATA_ROOT", os.path.join(os.path.dirname(BASE_DIR), "crawler_data"))
+_results_index = None
+_results_index_lock = threading.Lock()
 
 
-def upload_file(sftp, local_path, remote_path):
-    try:
-        remote_path = remote_path.replace("\\", "/")
-        remote_dir = os.path.dirname(remote_path)
-
-        dirs = remote_dir.split("/")
-        path = ""
-        for d in dirs:
-            if not d: continue
-            path += "/" + d
-            try:
-                sftp.stat(path)
-            except FileNotFoundError:
-                sftp.mkdir(path)
+def get_results_index():
+    """懒加载结果索引，并启动后台增量刷新线程"""
+    global _results_index
+    with _results_index_lock:
+        if _results_index is None:
+            dirs = {site: os.path.join(RESULTS_DATA_ROOT, cfg["dir_name"]) for site, cfg in SPIDERS.items()}
+            _results_index = ResultsIndex(os.path.join(RESULTS_DATA_ROOT, ".results_index.sqlite3"), dirs,
+                                          refresh_interval=10)
+            _results_index.refresh(force=True)
 
-        sftp.put(local_path, remote_path)
-        logger.info(f" 上传: {os.path.basename(local_path)}")
-        return True
-    except Exception as e:
-        logger.error(f" 上传失败: {e}")
-        return False
+            def refresh_loop():
+                while True:
+                    time.sleep(_results_index.refresh_interval)
+                    try:
+                        _results_index.refresh(force=True)
+                    except Exception as e:
+                        logger.error(f" 结果索引刷新失败: {e}")
+
+            threading.Thread(target=refresh_loop, daemon=True).start()
+        return _results_index
+
+
+# SSH 连接池: 同一 (host, user, key) 复用一个 Transport，并发任务复用 channel；
+# 短操作 6 + 运行中任务 3 个 channel，低于 sshd 默认 MaxSessions=10，留一个给取消任务
+ssh_pool = SSHConnectionPool(keepalive=30, idle_timeout=300, max_channels=6, max_streams=3)
 
 
-def sync_project_files(client, local_task_file, remote_task_file, remote_code_dir):
+def _record_sync(server, stats):
+    backend_counters.inc("sync_bytes", stats.get("bytes", 0), server=server)
+    backend_counters.inc("sync_files_changed", stats.get("changed", 0), server=server)
+    backend_counters.inc("sync_seconds", stats.get("seconds", 0.0), server=server)
+
+
+def sync_project_files(client, local_task_file, remote_task_file, remote_code_dir, server=None):
+    """增量同步: 只上传内容有变化的脚本，多个文件打包一次传输"""
     logger.info(f" 开始同步文件到 {remote_code_dir}...")
-    sftp = client.open_sftp()
+    remote_code_dir = remote_code_dir.replace("\\", "/").rstrip("/")
+    remote_task_file = remote_task_file.replace("\\", "/")
 
     try:
-        # 1. 上传 crawler_base.py (从 spiders 目录找)
-        base_crawler_path = os.path.join(BASE_DIR, "spiders", "crawler_base.py")
-        if os.path.exists(base_crawler_path):
-            upload_file(sftp, base_crawler_path, f"{remote_code_dir}/crawler_base.py")
-        else:
-            logger.warning(" 未找到 crawler_base.py")
-
-        # 2. 上传 spiders 目录下的所有脚本
+        # 1. spiders 目录下的所有脚本 (包含 crawler_base.py)
+        files = {}
         spiders_dir = os.path.join(BASE_DIR, "spiders")
         if os.path.exists(spiders_dir):
             for f in os.listdir(spiders_dir):
                 if f.endswith(".py"):
-                    local_p = os.path.join(spiders_dir, f)
-                    remote_p = f"{remote_code_dir}/{f}"
-                    upload_file(sftp, local_p, remote_p)
+                    files[f] = os.path.join(spiders_dir, f)
+        if "crawler_base.py" not in files:
+            logger.warning(" 未找到 crawler_base.py")
+
+        # 2. 任务文件 (位于代码目录下时一并参与增量同步)
+        task_in_code_dir = remote_task_file.startswith(remote_code_dir + "/")
+        if task_in_code_dir:
+            files[remote_task_file[len(remote_code_dir) + 1:]] = local_task_file
 
-        # 3. 上传任务文件
-        upload_file(sftp, local_task_file, remote_task_file)
+        _record_sync(server, sync_files(client, files, remote_code_dir))
+
+        if not task_in_code_dir:
+            _record_sync(server, sync_files(client, {os.path.basename(remote_task_file): local_task_file},
+                                            os.path.dirname(remote_task_file)))
 
-        sftp.close()
         logger.info(" 文件同步完成")
         return True
     except Exception as e:
         logger.error(f" 同步失败: {e}")
-        sftp.close()
         return False
 
 
-def execute_remote_crawler(task_id, config):
+def execute_remote_crawler(job, config):
+    task_id = job.id
+    conn_args = (config["server_ip"], config["server_user"], config["key_file_path"])
     try:
-        log_queue.put({"task_id": task_id, "message": " 正在连接远程服务器...", "type": "info"})
-        client = create_ssh_client(config["server_ip"], config["server_user"], config["key_file_path"])
-        log_queue.put({"task_id": task_id, "message": " 连接成功", "type": "success"})
+        log_bus.publish({"task_id": task_id, "message": " 正在连接远程服务器...", "type": "info"})
+        # 同步是短操作，租用 channel 名额；爬虫执行期间只挂在连接上，不占名额，
+        # 避免长任务把同一主机的下载/同步请求全部堵住
+        with ssh_pool.lease(*conn_args) as client:
+            log_bus.publish({"task_id": task_id, "message": " 连接成功", "type": "success"})
+            _sync_remote_task(job, config, client)
+            since = results_export.remote_clock(client)
+        with ssh_pool.attach(*conn_args) as client:
+            _run_remote_crawler(job, config, client)
+        _pull_job_results(job, config, conn_args, since)
+
+    except Exception as e:
+        error_msg = f" 执行错误: {str(e)}"
+        logger.error(error_msg)
+        log_bus.publish({"task_id": task_id, "message": error_msg, "type": "error"})
+        job_registry.finish(job, "failed", error=str(e))
 
+
+def _pull_job_results(job, config, conn_args, since):
+    """
+    任务结束后把本次写入的结果文件拉回本地数据根目录: 结果查询只索引本地文件，
+    爬虫写在节点的 remote_data_root 上，不拉回来 /api/results/query 查不到
+    """
+    data_dir = f"{config['remote_data_root'].rstrip('/')}/{SPIDERS[config['site_name']]['dir_name']}"
+    try:
+        with ssh_pool.lease(*conn_args) as client:
+            pulled = results_export.pull_results(client, data_dir, RESULTS_DATA_ROOT, since)
+        if pulled:
+            log_bus.publish({"task_id": job.id, "message": f" 已拉回 {pulled} 个结果文件到本地索引", "type": "info"})
+    except Exception as e:
+        logger.error(f" [{job.id}] 拉取结果文件失败: {e}")
+        log_bus.publish({"task_id": job.id, "message": f" 拉取结果文件失败 (不影响任务结果): {e}", "type": "warning"})
+
+
+def _sync_remote_task(job, config, client):
+    """生成任务文件并与爬虫脚本一起增量同步到远端"""
+    task_id = job.id
+    local_task_file = f"temp_task_{task_id}.json"
+    try:
         # 生成临时任务文件
-        local_task_file = f"temp_task_{task_id}.json"
         with open(local_task_file, 'w', encoding='utf-8') as f:
             json.dump(config["product_names"], f, ensure_ascii=False, indent=2)
 
-        log_queue.put({"task_id": task_id, "message": " 正在上传任务文件...", "type": "info"})
+        log_bus.publish({"task_id": task_id, "message": " 正在上传任务文件...", "type": "info"})
 
-        spider_config = SPIDERS[config["site_name"]]
         remote_task_path = f"{config['remote_code_dir']}/current_tasks.json"
-        final_data_dir = f"{config['remote_data_root']}/{spider_config['dir_name']}"
-
-        sync_success = sync_project_files(client, local_task_file, remote_task_path, config['remote_code_dir'])
+        sync_success = sync_project_files(client, local_task_file, remote_task_path, config['remote_code_dir'],
+                                          server=config["server_ip"])
         if not sync_success: raise Exception("文件同步失败")
 
-        log_queue.put({"task_id": task_id, "message": " 文件上传完成", "type": "success"})
-
-        # 处理 Cookie (如果存在)
-        remote_script_name = spider_config['file']
-        cookie_arg = ""
-        # TODO: 这里可以扩展 Cookie 上传逻辑
-
-        cmd = (
-            f"cd {config['remote_code_dir']} && "
-            f"export PYTHONPATH=$PYTHONPATH:. && "
-            f"python3 {remote_script_name} "
-            f"--workers {config['workers']} "
-            f"--base_port {config['base_port']} "
-            f"--max_count {config['max_count']} "
-            f"--output_dir '{final_data_dir}' "
-            f"--task_file '{remote_task_path}'"
-            f"{cookie_arg}"
-        )
+    finally:
+        if os.path.exists(local_task_file): os.remove(local_task_file)
 
-        log_queue.put({"task_id": task_id, "message": f" 启动爬虫: {config['site_name']}", "type": "info"})
-        log_queue.put({"task_id": task_id, "message": f" 执行命令: {cmd}", "type": "info"})
 
-        stdin, stdout, stderr = client.exec_command(cmd, get_pty=True)
-        for line in iter(stdout.readline, ""):
-            if line.strip():
-                log_queue.put({"task_id": task_id, "message": line.rstrip(), "type": "info"})
+def _run_remote_crawler(job, config, client):
+    """在已同步的 SSH 连接上执行爬虫命令"""
+    task_id = job.id
+    spider_config = SPIDERS[config["site_name"]]
+    remote_task_path = f"{config['remote_code_dir']}/current_tasks.json"
+    final_data_dir = f"{config['remote_data_root']}/{spider_config['dir_name']}"
+
+    log_bus.publish({"task_id": task_id, "message": " 文件上传完成", "type": "success"})
+
+    # 优先交给节点上的常驻 agent (浏览器已预热)，不可用时回退到一次性启动
+    if spider_config.get("agent") and config.get("use_agent", True):
+        if _run_via_agent(job, config, client, final_data_dir):
+            return
+        log_bus.publish({"task_id": task_id, "message": " 常驻 agent 不可用，改为一次性启动", "type": "warning"})
+
+    # 处理 Cookie (如果存在)
+    remote_script_name = spider_config['file']
+    cookie_arg = ""
+    # TODO: 这里可以扩展 Cookie 上传逻辑
+    # 自动扩缩容: workers 作为上限，由爬虫节点按吞吐/内存/负载自行调整
+    autoscale_arg = " --autoscale" if config.get("autoscale") else ""
+    # 关键词新鲜度: 未指定时由爬虫按站点默认 TTL 决定
+    ttl_arg = f" --ttl_hours {config['ttl_hours']}" if config.get("ttl_hours") is not None else ""
+    # 增量模式: 过期关键词翻到已爬过的商品就停
+    delta_arg = " --delta" if config.get("delta") else ""
+
+    # 先回显 shell 的进程组 ID，再 exec 替换为爬虫进程 (PID 不变)，取消时按进程组整体 kill
+    cmd = (
+        f"cd {config['remote_code_dir']} && "
+        f"export PYTHONPATH=$PYTHONPATH:. && "
+        f"echo \"{PGID_PREFIX}$(ps -o pgid= $$ | tr -d ' ')\" && "
+        f"exec python3 {remote_script_name} "
+        f"--workers {config['workers']} "
+        f"--base_port {config['base_port']} "
+        f"--max_count {config['max_count']} "
+        f"--output_dir '{final_data_dir}' "
+        f"--task_file '{remote_task_path}'"
+        f"{autoscale_arg}"
+        f"{ttl_arg}"
+        f"{delta_arg}"
+        f"{cookie_arg}"
+    )
+
+    log_bus.publish({"task_id": task_id, "message": f" 启动爬虫: {config['site_name']}", "type": "info"})
+    log_bus.publish({"task_id": task_id, "message": f" 执行命令: {cmd}", "type": "info"})
+
+    if job.cancel_requested:
+        raise Exception("任务已取消")
+
+    stdin, stdout, stderr = client.exec_command(cmd, get_pty=True)
+    job_registry.mark_running(job, client=client, channel=stdout.channel)
+
+    _ship_logs(job, config, stdout.channel, lambda line: job_registry.handle_line(job, line))
+    _finish_job(job, stdout.channel.recv_exit_status())
+
+
+def _ship_logs(job, config, channel, line_filter, initial=b""):
+    """
+    大块读取 + 100ms 时间窗口合并，\r 进度行折叠，按任务限速
+    控制行 (@@EVENT / @@PGID / @@EXIT) 由 line_filter 消费，不推送到前端
+    """
+    batcher = LogBatcher(log_bus.publish, job.id, window=0.1, max_lines_per_second=200, line_filter=line_filter)
+    if initial:
+        batcher.feed(initial.decode("utf-8", "replace"))
+    ship_stats = pump_channel(channel, batcher)
+    logger.info(f" [{job.id}] 日志转发: {ship_stats}")
+    for key in ("bytes", "lines_in", "lines_out", "suppressed"):
+        backend_counters.inc(f"log_ship_{key}", ship_stats.get(key, 0), server=config["server_ip"])
+
+
+def _finish_job(job, exit_status):
+    task_id = job.id
+    if job.cancel_requested:
+        log_bus.publish({"task_id": task_id, "message": " 任务已取消", "type": "warning"})
+        job_registry.finish(job, "cancelled", exit_status=exit_status)
+    elif exit_status != 0:
+        log_bus.publish({"task_id": task_id, "message": f" 任务执行出错 (Exit: {exit_status})", "type": "error"})
+        job_registry.finish(job, "failed", exit_status=exit_status)
+    else:
+        log_bus.publish({"task_id": task_id, "message": " 任务执行完毕！", "type": "success"})
+        job_registry.finish(job, "completed", exit_status=exit_status)
+
+
+def _run_via_agent(job, config, client, output_dir):
+    """通过节点上的常驻 agent 执行任务；agent 不可用返回 False"""
+    task_id = job.id
+    payload = {
+        "site": config["site_name"],
+        "product_names": config["product_names"],
+        "max_count": config["max_count"],
+        "output_dir": output_dir,
+        "workers": config["workers"],
+        "base_port": config["base_port"],
+        "autoscale": config.get("autoscale", False),
+        "ttl_hours": config.get("ttl_hours"),
+        "delta": config.get("delta", False),
+    }
+    if job.cancel_requested:
+        raise Exception("任务已取消")
+    try:
+        channel, initial = agent_client.submit(client, config["remote_code_dir"], payload)
+    except agent_client.AgentUnavailable as e:
+        logger.warning(f" [{task_id}] agent 不可用: {e}")
+        return False
 
-        exit_status = stdout.channel.recv_exit_status()
-        if exit_status != 0:
-            log_queue.put({"task_id": task_id, "message": f" 任务执行出错 (Exit: {exit_status})", "type": "error"})
-            active_tasks[task_id] = "failed"
-        else:
-            log_queue.put({"task_id": task_id, "message": " 任务执行完毕！", "type": "success"})
-            active_tasks[task_id] = "completed"
+    log_bus.publish({"task_id": task_id, "message": f" 已提交到常驻 agent: {config['site_name']}", "type": "info"})
+    # 取消时 job_registry 会向 channel 发送 Ctrl-C 并关闭，agent 据此取消任务
+    job_registry.mark_running(job, client=client, channel=channel)
 
-        client.close()
-        if os.path.exists(local_task_file): os.remove(local_task_file)
+    result = {}
 
-    except Exception as e:
-        error_msg = f" 执行错误: {str(e)}"
-        logger.error(error_msg)
-        log_queue.put({"task_id": task_id, "message": error_msg, "type": "error"})
-        active_tasks[task_id] = "failed"
+    def line_filter(line):
+        if line.startswith(agent_client.EXIT_PREFIX):
+            try:
+                result["exit_status"] = int(line[len(agent_client.EXIT_PREFIX):])
+            except ValueError:
+                result["exit_status"] = 1
+            return True
+        return job_registry.handle_line(job, line)
+
+    _ship_logs(job, config, channel, line_filter, initial)
+    # 没收到 @@EXIT 说明隧道中途断开
+    _finish_job(job, result.get("exit_status", -1))
+    return True
 
 
 # ==================== API 端点 ====================
@@ -231,6 +387,74 @@ def health_check():
     return jsonify({"status": "healthy", "message": "爬虫API正在运行"})
 
 
+@app.route('/api/ssh/pool', methods=['GET'])
+def ssh_pool_stats():
+    return jsonify(ssh_pool.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus 文本格式指标: 后端吞吐 + 远端爬虫通过日志通道上报的计数器/阶段直方图"""
+    w = metrics.MetricsWriter()
+    w.gauge("backend_uptime_seconds", "后端运行时长", round(time.time() - STARTED_AT, 1))
+
+    # ---------- 任务 ----------
+    for status in ("pending", "running", "completed", "failed", "cancelled"):
+        w.gauge("tasks", "按状态统计的任务数 (已结束任务按保留策略清理)", job_registry.count(status), status=status)
+
+    # ---------- 日志 / SSE ----------
+    w.gauge("sse_subscribers", "当前 SSE 日志订阅者数量", log_bus.subscriber_count())
+    w.counter("log_lines_published", "发布到日志总线的消息数", log_bus.published)
+    w.gauge("log_lines_per_second", "最近 60 秒日志总线每秒消息数", log_rate.rate(log_bus.published))
+    for key, help_text in (("bytes", "远端输出字节数"), ("lines_in", "远端输出行数"),
+                           ("lines_out", "转发到前端的行数"), ("suppressed", "因限速丢弃的行数")):
+        for labels, value in backend_counters.items(f"log_ship_{key}"):
+            w.counter(f"log_ship_{key}", help_text + " (任务结束时累计)", value, **labels)
+
+    # ---------- SSH 连接池 ----------
+    pool = ssh_pool.stats()
+    w.gauge("ssh_pool_connections", "连接池中的 SSH 连接数", pool["connections"])
+    w.gauge("ssh_pool_active_channels", "正在使用的 channel 数", pool["active_channels"])
+    w.gauge("ssh_pool_active_streams", "长时间运行的任务 channel 数", pool["active_streams"])
+    for key in ("hits", "misses", "reconnects", "evictions"):
+        w.counter(f"ssh_pool_{key}", f"连接池 {key} 次数", pool[key])
+    for host in pool["hosts"]:
+        w.gauge("ssh_pool_host_leases", "各主机当前租用数", host["leases"], server=host["host"])
+
+    # ---------- 文件同步 ----------
+    for name, help_text in (("sync_bytes", "同步上传字节数"), ("sync_files_changed", "同步上传的文件数"),
+                            ("sync_seconds", "同步耗时")):
+        for labels, value in backend_counters.items(name):
+            w.counter(name, help_text, value, **labels)
+
+    # ---------- 远端爬虫 (按服务器 + 站点累计) ----------
+    for (server, site), totals in job_registry.totals().items():
+        labels = {"server": server, "site": site}
+        w.counter("spider_items_saved", "爬虫保存的商品条数", totals["items"], **labels)
+        w.counter("spider_keywords_done", "完成的关键词数", totals["keywords"], **labels)
+        for name, value in sorted(totals["counters"].items()):
+            w.counter("spider_events", "爬虫计数器 (pages_fetched / verifications / browser_restarts ...)",
+                      value, event=name, **labels)
+        for phase, stats in sorted(totals["phases"].items()):
+            w.histogram("spider_phase_duration_seconds", "爬虫各阶段耗时", PHASE_BUCKETS, stats["buckets"],
+                        stats["total"], stats["count"], phase=phase, **labels)
+
+    # ---------- 运行中的任务 (按任务) ----------
+    for job in job_registry.list(status="running"):
+        labels = {"task_id": job.id, "server": job.server, "site": job.site}
+        w.gauge("task_items_collected", "运行中任务已采集条数", job.items_collected, **labels)
+        w.gauge("task_items_per_second", "运行中任务 items/s", job.items_per_sec(), **labels)
+        w.gauge("task_keywords_done", "运行中任务已完成关键词数", job.keywords_done, **labels)
+        counters, phases = job_registry.job_metrics(job)
+        for name, value in sorted(counters.items()):
+            w.counter("task_spider_events", "运行中任务的爬虫计数器", value, event=name, **labels)
+        for phase, stats in sorted(phases.items()):
+            w.histogram("task_phase_duration_seconds", "运行中任务各阶段耗时", PHASE_BUCKETS, stats["buckets"],
+                        stats["total"], stats["count"], phase=phase, **labels)
+
+    return Response(w.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
+
 @app.route('/api/spiders', methods=['GET'])
 def get_spiders():
     return jsonify({"spiders": list(SPIDERS.keys()), "details": SPIDERS})
@@ -242,8 +466,8 @@ def validate_config():
     try:
         if not os.path.exists(data['key_file_path']):
             return jsonify({"valid": False, "error": "密钥文件不存在"}), 400
-        client = create_ssh_client(data['server_ip'], data['server_user'], data['key_file_path'])
-        client.close()
+        # 校验的同时预热连接池，随后的 /api/execute 可直接复用
+        ssh_pool.get(data['server_ip'], data['server_user'], data['key_file_path'])
         return jsonify({"valid": True, "message": "配置有效"})
     except Exception as e:
         return jsonify({"valid": False, "error": str(e)}), 400
@@ -255,14 +479,15 @@ def execute_crawler():
     if data['site_name'] not in SPIDERS:
         return jsonify({"error": f"未知爬虫: {data['site_name']}"}), 400
 
-    task_id = f"task_{int(time.time())}"
-    active_tasks[task_id] = "running"
-
     config = {
         "site_name": data['site_name'],
         "product_names": data['product_names'],
         "max_count": data['max_count'],
         "workers": data['workers'],
+        "autoscale": bool(data.get('autoscale', False)),
+        "ttl_hours": float(data['ttl_hours']) if data.get('ttl_hours') not in (None, "") else None,
+        "delta": bool(data.get('delta', False)),
+        "use_agent": bool(data.get('use_agent', True)),
         "base_port": data['base_port'],
         "server_ip": data['server_ip'],
         "server_user": data['server_user'],
@@ -271,24 +496,197 @@ def execute_crawler():
         "remote_data_root": data['remote_data_root']
     }
 
-    thread = threading.Thread(target=execute_remote_crawler, args=(task_id, config))
+    job = job_registry.create(config)
+
+    thread = threading.Thread(target=execute_remote_crawler, args=(job, config))
     thread.daemon = True
     thread.start()
 
-    return jsonify({"task_id": task_id, "status": "started", "message": "任务已启动"})
+    return jsonify({"task_id": job.id, "status": "started", "message": "任务已启动"})
+
+
+@app.route('/api/tasks', methods=['GET'])
+def list_tasks():
+    status = request.args.get('status')
+    return jsonify({"tasks": [job.to_dict() for job in job_registry.list(status=status)]})
+
+
+@app.route('/api/tasks/<task_id>', methods=['GET'])
+def get_task(task_id):
+    job = job_registry.get(task_id)
+    if not job:
+        return jsonify({"error": f"任务不存在: {task_id}"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/tasks/<task_id>/cancel', methods=['POST'])
+def cancel_task(task_id):
+    job = job_registry.get(task_id)
+    if not job:
+        return jsonify({"error": f"任务不存在: {task_id}"}), 404
+    try:
+        if not job_registry.cancel(job):
+            return jsonify({"error": f"任务已结束: {job.status}"}), 409
+    except Exception as e:
+        return jsonify({"error": f"取消失败: {e}"}), 500
+    log_bus.publish({"task_id": task_id, "message": " 已发送取消指令", "type": "warning"})
+    return jsonify({"task_id": task_id, "status": "cancelling"})
+
+
+@app.route('/api/results/query', methods=['GET'])
+def query_results():
+    """
+    分页查询已爬取商品
+    参数: platform / keyword / min_price / max_price / q (标题子串)
+          sort (newest | oldest | price_asc | price_desc | title) / limit / cursor
+    """
+    args = request.args
+    try:
+        # 不在请求路径上扫描目录: 由后台线程定时增量刷新，需要立即生效时调用 /api/results/query/refresh
+        index = get_results_index()
+        result = index.query(
+            platform=args.get('platform') or None,
+            keyword=args.get('keyword') or None,
+            min_price=args.get('min_price', type=float),
+            max_price=args.get('max_price', type=float),
+            q=args.get('q') or None,
+            sort=args.get('sort', 'newest'),
+            limit=args.get('limit', 50, type=int),
+            cursor=args.get('cursor') or None,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+
+@app.route('/api/results/query/stats', methods=['GET'])
+def query_results_stats():
+    index = get_results_index()
+    stats = index.stats()
+    stats["keywords"] = index.keywords(request.args.get('platform') or None)
+    # 只索引本地数据根目录里的文件 (任务结束后自动拉回，或手动下载解压到这里)
+    stats["data_root"] = RESULTS_DATA_ROOT
+    stats["scope"] = "local"
+    return jsonify(stats)
+
+
+@app.route('/api/results/query/refresh', methods=['POST'])
+def query_results_refresh():
+    return jsonify(get_results_index().refresh(force=True))
+
+
+@app.route('/api/results/<site>', methods=['GET'])
+def download_results(site):
+    """
+    打包下载远端爬取结果 (单个 tar 流)
+    参数: server_ip / server_user / key_file_path / remote_data_root
+          since (可选，Unix 时间戳水位线) / compression (gzip | zstd)
+    支持 Range 断点续传；响应头 X-Watermark 为本次打包时的远端时间，下次增量下载时作为 since 传入
+    """
+    if site not in SPIDERS:
+        return jsonify({"error": f"未知爬虫: {site}"}), 400
+    args = request.args
+    missing = [k for k in ("server_ip", "server_user", "key_file_path", "remote_data_root") if not args.get(k)]
+    if missing:
+        return jsonify({"error": f"缺少参数: {', '.join(missing)}"}), 400
+
+    try:
+        since = int(args['since']) if args.get('since') else None
+    except ValueError:
+        return jsonify({"error": "since 必须是 Unix 时间戳"}), 400
+
+    conn_args = (args['server_ip'], args['server_user'], args['key_file_path'])
+    host_key = f"{args['server_ip']}:{args['server_user']}"
+    data_dir = f"{args['remote_data_root'].rstrip('/')}/{SPIDERS[site]['dir_name']}"
+
+    try:
+        with ssh_pool.lease(*conn_args) as client:
+            watermark, digest = results_export.probe_remote(client, host_key, data_dir, since)
+    except Exception as e:
+        return jsonify({"error": f"连接失败: {e}"}), 502
+
+    compression = results_export.choose_compression(args.get('compression', 'gzip'), host_key)
+    key = results_export.export_key(data_dir, since, compression, digest)
+    cache_file = results_export.cache_path(key, compression)
+    info = results_export.COMPRESSORS[compression]
+    filename = f"{SPIDERS[site]['dir_name']}_{since or 'full'}.{info['ext']}"
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{key}"',
+        "X-Watermark": str(watermark or ""),
+        "X-Compression": compression,
+    }
+
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    # ETag 随文件清单变化；If-Range 不匹配说明内容已变，直接回完整 200
+    total = None
+    if range_header and (not if_range or if_range.strip('"') == key):
+        # 断点续传: 从远端缓存文件读取固定内容
+        try:
+            with ssh_pool.lease(*conn_args) as client:
+                total = results_export.ensure_cached(client, data_dir, since, compression, cache_file, digest)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 502
+    if total is not None:
+        byte_range = results_export.parse_range(range_header, total)
+        if not byte_range:
+            return Response(status=416, headers={"Content-Range": f"bytes */{total}"})
+        start, end = byte_range
+
+        def generate_range():
+            with ssh_pool.lease(*conn_args) as client:
+                yield from results_export.stream_cached_range(client, cache_file, start, end)
+
+        headers.update({"Content-Range": f"bytes {start}-{end}/{total}",
+                        "Content-Length": str(end - start + 1)})
+        return Response(generate_range(), status=206, mimetype=info['mimetype'], headers=headers)
+
+    def generate():
+        with ssh_pool.lease(*conn_args) as client:
+            yield from results_export.stream_pack(client, data_dir, since, compression, cache_file, digest)
+
+    return Response(generate(), mimetype=info['mimetype'], headers=headers)
 
 
 @app.route('/api/logs/stream')
 def stream_logs():
+    """
+    SSE 日志流
+    - ?task_id=xxx 只看某个任务
+    - 断线重连时浏览器自动携带 Last-Event-ID，补发期间错过的日志
+    """
+    task_id = request.args.get('task_id') or None
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    subscriber = log_bus.subscribe(task_id=task_id, last_event_id=last_event_id)
+
     def generate():
-        while True:
-            if not log_queue.empty():
-                log = log_queue.get()
-                yield f"data: {json.dumps(log, ensure_ascii=False)}\n\n"
-            else:
-                time.sleep(0.1)
-
-    return Response(generate(), mimetype='text/event-stream')
+        try:
+            while True:
+                events = subscriber.wait(timeout=15)
+                if not events:
+                    # 心跳: 保持连接并及时发现已断开的客户端
+                    yield ": keepalive\n\n"
+                    continue
+
+                dropped = subscriber.take_dropped()
+                if dropped:
+                    warn = {"task_id": task_id, "message": f" 客户端过慢，丢弃 {dropped} 条日志", "type": "warning"}
+                    yield f"data: {json.dumps(warn, ensure_ascii=False)}\n\n"
+
+                for event_id, log in events:
+                    yield f"id: {event_id}\ndata: {json.dumps(log, ensure_ascii=False)}\n\n"
+        finally:
+            log_bus.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 if __name__ == '__main__':
@@ -0,0 +1,204 @@
+"""
+增量代码同步引擎
+1. 本地计算文件内容哈希，与远端 manifest 对比，只传输变化的文件
+2. 多个变更文件打包成一个 tar.gz，一次上传、远端一次解压（高延迟链路下省掉 N 次往返）
+3. 缓存已确认存在的远端目录，避免每次逐级 stat/mkdir
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import posixpath
+import tarfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 远端 manifest 文件名 (放在 remote_code_dir 下)
+MANIFEST_NAME = ".sync_manifest.json"
+# 远端临时压缩包名
+BUNDLE_NAME = ".sync_bundle.tar.gz"
+
+# 已确认存在的远端目录缓存: {(host_key, remote_dir)}
+_known_dirs = set()
+_known_dirs_lock = threading.Lock()
+
+
+def file_sha256(path):
+    """计算本地文件的 sha256"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _host_key(client):
+    """用对端地址区分不同服务器 (目录缓存按服务器隔离)"""
+    try:
+        peer = client.get_transport().getpeername()
+        return f"{peer[0]}:{peer[1]}"
+    except Exception:
+        return str(id(client))
+
+
+def ensure_remote_dir(client, sftp, remote_dir):
+    """确保远端目录存在，已确认过的目录直接跳过"""
+    remote_dir = remote_dir.replace("\\", "/").rstrip("/")
+    if not remote_dir:
+        return
+    key = (_host_key(client), remote_dir)
+    with _known_dirs_lock:
+        if key in _known_dirs:
+            return
+
+    try:
+        # 绝大多数情况下目录已存在，一次 stat 即可结束
+        sftp.stat(remote_dir)
+    except FileNotFoundError:
+        path = ""
+        for d in remote_dir.split("/"):
+            if not d: continue
+            path += "/" + d
+            try:
+                sftp.stat(path)
+            except FileNotFoundError:
+                sftp.mkdir(path)
+
+    with _known_dirs_lock:
+        _known_dirs.add(key)
+
+
+def forget_remote_dirs(client=None):
+    """清空目录缓存 (远端目录被人为删除时使用)"""
+    with _known_dirs_lock:
+        if client is None:
+            _known_dirs.clear()
+        else:
+            host = _host_key(client)
+            for key in [k for k in _known_dirs if k[0] == host]:
+                _known_dirs.discard(key)
+
+
+def read_remote_manifest(sftp, remote_code_dir):
+    """读取远端 manifest，不存在或损坏时返回空字典"""
+    try:
+        with sftp.open(f"{remote_code_dir}/{MANIFEST_NAME}", 'r') as f:
+            data = json.loads(f.read().decode('utf-8'))
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def write_remote_manifest(sftp, remote_code_dir, manifest):
+    with sftp.open(f"{remote_code_dir}/{MANIFEST_NAME}", 'w') as f:
+        f.write(json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+
+
+def _build_bundle(files):
+    """把 {远端相对路径: 本地路径} 打包成内存中的 tar.gz"""
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w:gz') as tar:
+        for rel_name, local_path in files.items():
+            tar.add(local_path, arcname=rel_name)
+    return buf.getvalue()
+
+
+def _push_bundle(client, sftp, remote_code_dir, files):
+    """上传单个压缩包并在远端解压，成功返回传输字节数，失败返回 None"""
+    data = _build_bundle(files)
+    remote_bundle = f"{remote_code_dir}/{BUNDLE_NAME}"
+    with sftp.open(remote_bundle, 'wb') as f:
+        f.set_pipelined(True)
+        f.write(data)
+
+    cmd = f"cd '{remote_code_dir}' && tar -xzf {BUNDLE_NAME} && rm -f {BUNDLE_NAME}"
+    _, stdout, stderr = client.exec_command(cmd)
+    exit_status = stdout.channel.recv_exit_status()
+    if exit_status != 0:
+        logger.warning(f" 远端解压失败 (Exit: {exit_status}): {stderr.read().decode('utf-8', 'ignore').strip()}")
+        return None
+    return len(data)
+
+
+def sync_files(client, files, remote_code_dir, use_bundle=True, force=False):
+    """
+    增量同步文件到远端目录
+
+    参数:
+        client: 已连接的 paramiko.SSHClient
+        files: {远端相对路径: 本地路径}
+        remote_code_dir: 远端根目录
+        use_bundle: 多个文件变化时是否打包上传
+        force: 忽略 manifest 全量上传
+
+    返回:
+        dict: 同步统计 (total / changed / bytes / mode / seconds)
+    """
+    start = time.time()
+    remote_code_dir = remote_code_dir.replace("\\", "/").rstrip("/")
+    stats = {"total": len(files), "changed": 0, "bytes": 0, "mode": "skip", "seconds": 0.0}
+
+    sftp = client.open_sftp()
+    try:
+        ensure_remote_dir(client, sftp, remote_code_dir)
+
+        manifest = {} if force else read_remote_manifest(sftp, remote_code_dir)
+
+        # 一次 listdir_attr 校验 manifest 与远端实际文件是否一致 (防止远端文件被手动删改)
+        remote_sizes = {}
+        try:
+            for attr in sftp.listdir_attr(remote_code_dir):
+                remote_sizes[attr.filename] = attr.st_size
+        except Exception:
+            pass
+
+        local_meta = {}
+        changed = {}
+        for rel_name, local_path in files.items():
+            meta = {"sha256": file_sha256(local_path), "size": os.path.getsize(local_path)}
+            local_meta[rel_name] = meta
+
+            old = manifest.get(rel_name)
+            top_level = rel_name.split("/")[0]
+            if "/" not in rel_name and remote_sizes.get(top_level) != meta["size"]:
+                changed[rel_name] = local_path
+            elif not old or old.get("sha256") != meta["sha256"]:
+                changed[rel_name] = local_path
+
+        if not changed:
+            logger.info(f" 无文件变化，跳过上传 ({len(files)} 个文件)")
+            stats["seconds"] = round(time.time() - start, 3)
+            return stats
+
+        # 确保子目录存在 (tar 解压会自动创建，逐个上传时才需要)
+        sent = None
+        if use_bundle and len(changed) > 1:
+            sent = _push_bundle(client, sftp, remote_code_dir, changed)
+            if sent is not None:
+                stats["mode"] = "bundle"
+
+        if sent is None:
+            sent = 0
+            for rel_name, local_path in changed.items():
+                remote_path = f"{remote_code_dir}/{rel_name}"
+                ensure_remote_dir(client, sftp, posixpath.dirname(remote_path))
+                sftp.put(local_path, remote_path)
+                sent += local_meta[rel_name]["size"]
+            stats["mode"] = "file"
+
+        for rel_name in changed:
+            manifest[rel_name] = local_meta[rel_name]
+            logger.info(f" 上传: {rel_name}")
+        write_remote_manifest(sftp, remote_code_dir, manifest)
+
+        stats["changed"] = len(changed)
+        stats["bytes"] = sent
+        stats["seconds"] = round(time.time() - start, 3)
+        logger.info(f" 增量同步: {len(changed)}/{len(files)} 个文件, {sent} 字节, "
+                    f"模式 {stats['mode']}, 耗时 {stats['seconds']}s")
+        return stats
+    finally:
+        sftp.close()
@@ -0,0 +1,330 @@
+"""
+任务注册表
+- 唯一任务 ID (同一秒多次启动不再冲突)
+- 结构化进度: 关键词完成数、已采集条数、items/s、各 worker 状态
+- 各阶段 (navigate / scroll / content / extract / save) 耗时直方图
+- 爬虫计数器 (counter 事件)，按任务以及按 (服务器, 站点) 累计，供 /metrics 输出
+- 自动扩缩容的决策记录 (autoscale 事件)、worker 重启与监控汇总
+- 调度预估 (schedule 事件) 与实际总耗时对比
+- 支持取消 (通过同一 SSH 连接杀掉远端进程组)
+- 已结束任务按数量/时间保留
+"""
+import bisect
+import copy
+import json
+import threading
+import time
+import uuid
+
+# 远端爬虫通过 stdout 打印的结构化事件前缀 (与 crawler_base.EVENT_PREFIX 保持一致)
+EVENT_PREFIX = "@@EVENT "
+# 远端 shell 启动时回显进程组 ID 的前缀
+PGID_PREFIX = "@@PGID "
+
+FINISHED_STATES = ("completed", "failed", "cancelled")
+# 阶段耗时直方图桶上界 (秒)，与 crawler_base.PHASE_BUCKETS 保持一致
+PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# 每个任务保留的自动扩缩容决策条数
+AUTOSCALE_HISTORY = 50
+
+
+def _observe_phase(phases, phase, seconds, items):
+    stats = phases.get(phase)
+    if stats is None:
+        stats = phases[phase] = {"count": 0, "total": 0.0, "max": 0.0, "items": 0,
+                                 "buckets": [0] * (len(PHASE_BUCKETS) + 1)}
+    stats["count"] += 1
+    stats["total"] = round(stats["total"] + seconds, 3)
+    stats["max"] = max(stats["max"], round(seconds, 3))
+    stats["items"] += items
+    stats["buckets"][bisect.bisect_left(PHASE_BUCKETS, seconds)] += 1
+
+
+class Job:
+    def __init__(self, job_id, config):
+        self.id = job_id
+        self.site = config.get("site_name")
+        self.server = config.get("server_ip")
+        self.config = {k: v for k, v in config.items() if k not in ("key_file_path", "product_names")}
+        self.status = "pending"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.exit_status = None
+        self.error = None
+        self.cancel_requested = False
+
+        self.keywords_total = len(config.get("product_names") or [])
+        self.keywords_done = 0
+        self.items_collected = 0
+        self.workers = {}
+        self.phases = {}
+        self.counters = {}
+        # 自动扩缩容的决策记录 (只保留最近 AUTOSCALE_HISTORY 条)
+        self.autoscale = []
+        # 监控汇总: 重启次数、损失时间、放回队列 / 放弃的关键词数
+        self.supervisor = {}
+        # 调度预估: 预计总耗时、耗时模型参数，结束后补上实际耗时与偏差
+        self.schedule = {}
+
+        # 运行期句柄，不对外序列化
+        self.client = None
+        self.channel = None
+        self.remote_pgid = None
+        # 浏览器以独立会话启动 (不在爬虫进程组里)，按 browser_started / browser_stopped 事件跟踪其进程组
+        self.browser_pgids = set()
+
+    def items_per_sec(self):
+        if not self.started_at:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return round(self.items_collected / elapsed, 2) if elapsed > 0 else 0.0
+
+    def to_dict(self):
+        return {
+            "task_id": self.id,
+            "site": self.site,
+            "server": self.server,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "exit_status": self.exit_status,
+            "error": self.error,
+            "remote_pgid": self.remote_pgid,
+            "progress": {
+                "keywords_total": self.keywords_total,
+                "keywords_done": self.keywords_done,
+                "items_collected": self.items_collected,
+                "items_per_sec": self.items_per_sec(),
+                "workers": self.workers,
+            },
+            "phases": self.phases,
+            "counters": self.counters,
+            "autoscale": self.autoscale,
+            "supervisor": self.supervisor,
+            "schedule": self.schedule,
+            "config": self.config,
+        }
+
+
+class JobRegistry:
+    def __init__(self, max_finished=200, finished_ttl=24 * 3600):
+        self.max_finished = max_finished
+        self.finished_ttl = finished_ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        # (服务器, 站点) -> 累计值；任务被清理后仍保留，保证 /metrics 中的计数单调递增
+        self._totals = {}
+
+    @staticmethod
+    def new_id():
+        return f"task_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+
+    def create(self, config):
+        job = Job(self.new_id(), config)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, status=None):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if status:
+            jobs = [j for j in jobs if j.status == status]
+        return sorted(jobs, key=lambda j: j.created_at, reverse=True)
+
+    def count(self, status):
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j.status == status)
+
+    # ---------- 状态流转 ----------
+    def mark_running(self, job, client=None, channel=None):
+        with self._lock:
+            job.status = "running"
+            job.started_at = job.started_at or time.time()
+            job.client = client
+            job.channel = channel
+
+    def finish(self, job, status, exit_status=None, error=None):
+        with self._lock:
+            if job.cancel_requested and status != "completed":
+                status = "cancelled"
+            job.status = status
+            job.exit_status = exit_status
+            job.error = error
+            job.finished_at = time.time()
+            job.client = None
+            job.channel = None
+            for state in job.workers.values():
+                if state.get("state") not in ("finished", "crashed"):
+                    state["state"] = "stopped"
+            self._prune()
+
+    def _prune(self):
+        """按时间和数量清理已结束任务 (调用方持有锁)"""
+        now = time.time()
+        finished = sorted((j for j in self._jobs.values() if j.status in FINISHED_STATES),
+                          key=lambda j: j.finished_at or j.created_at)
+        for job in finished:
+            if now - (job.finished_at or now) > self.finished_ttl:
+                del self._jobs[job.id]
+        finished = [j for j in finished if j.id in self._jobs]
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job.id]
+
+    # ---------- 远端输出解析 ----------
+    def handle_line(self, job, line):
+        """
+        处理远端输出中的控制行，返回 True 表示该行已被消费 (不再推送到前端)
+        """
+        if line.startswith(PGID_PREFIX):
+            try:
+                job.remote_pgid = int(line[len(PGID_PREFIX):].strip())
+            except ValueError:
+                pass
+            return True
+        if line.startswith(EVENT_PREFIX):
+            try:
+                self.apply_event(job, json.loads(line[len(EVENT_PREFIX):]))
+            except ValueError:
+                return False
+            return True
+        return False
+
+    def _totals_for(self, job):
+        key = (job.server or "", job.site or "")
+        totals = self._totals.get(key)
+        if totals is None:
+            totals = self._totals[key] = {"items": 0, "keywords": 0, "counters": {}, "phases": {}}
+        return totals
+
+    def totals(self):
+        """{(服务器, 站点): {items, keywords, counters, phases}} 的副本"""
+        with self._lock:
+            return copy.deepcopy(self._totals)
+
+    def job_metrics(self, job):
+        """运行中任务的 (counters, phases) 副本"""
+        with self._lock:
+            return dict(job.counters), copy.deepcopy(job.phases)
+
+    def apply_event(self, job, event):
+        kind = event.get("event")
+        port = event.get("port")
+        with self._lock:
+            worker = job.workers.setdefault(str(port), {}) if port is not None else None
+            totals = self._totals_for(job)
+            if kind == "job_start":
+                job.keywords_total = event.get("keywords_total", job.keywords_total)
+            elif kind == "worker_state" and worker is not None:
+                worker["state"] = event.get("state")
+                if event.get("error"):
+                    worker["error"] = event["error"]
+            elif kind == "keyword_start" and worker is not None:
+                worker["state"] = "running"
+                worker["keyword"] = event.get("keyword")
+            elif kind == "keyword_done":
+                job.keywords_done += 1
+                job.items_collected += int(event.get("items") or 0)
+                totals["keywords"] += 1
+                totals["items"] += int(event.get("items") or 0)
+                if worker is not None:
+                    worker["keywords_done"] = worker.get("keywords_done", 0) + 1
+                    worker["items"] = worker.get("items", 0) + int(event.get("items") or 0)
+                    worker["keyword"] = None
+            elif kind == "phase":
+                try:
+                    seconds = float(event.get("duration_ms") or 0) / 1000
+                except (TypeError, ValueError):
+                    seconds = 0.0
+                for phases in (job.phases, totals["phases"]):
+                    _observe_phase(phases, str(event.get("phase")), seconds, int(event.get("items") or 0))
+            elif kind == "counter" and event.get("name"):
+                value = int(event.get("value") or 0)
+                for counters in (job.counters, totals["counters"]):
+                    counters[event["name"]] = counters.get(event["name"], 0) + value
+            elif kind == "phase_summary" and worker is not None:
+                worker["phases"] = {name: {k: v for k, v in stats.items() if k != "buckets"}
+                                    for name, stats in (event.get("phases") or {}).items()}
+            elif kind == "worker_restart" and worker is not None:
+                worker["state"] = "restarting"
+                worker["restarts"] = event.get("restarts")
+                worker["keyword"] = None
+            elif kind == "supervisor_summary":
+                job.supervisor = {k: event.get(k) for k in ("restarts", "lost_seconds", "requeued", "dropped",
+                                                             "remaining")}
+            elif kind == "schedule":
+                job.schedule = {k: event.get(k) for k in ("predicted_seconds", "workers", "keywords", "history",
+                                                          "probed", "overhead", "per_item")}
+            elif kind == "schedule_result":
+                predicted = event.get("predicted_seconds") or 0
+                actual = event.get("actual_seconds") or 0
+                job.schedule["actual_seconds"] = actual
+                job.schedule["error"] = round(actual / predicted - 1, 3) if predicted else None
+            elif kind == "autoscale":
+                job.autoscale.append({k: event.get(k) for k in ("ts", "action", "workers", "reason",
+                                                                 "items_per_sec", "mem", "load")})
+                del job.autoscale[:-AUTOSCALE_HISTORY]
+            elif kind == "browser_started" and event.get("pgid"):
+                job.browser_pgids.add(int(event["pgid"]))
+            elif kind == "browser_stopped" and event.get("pgid"):
+                job.browser_pgids.discard(int(event["pgid"]))
+            elif kind == "items":
+                job.items_collected += int(event.get("count") or 0)
+                totals["items"] += int(event.get("count") or 0)
+                if worker is not None:
+                    worker["items"] = worker.get("items", 0) + int(event.get("count") or 0)
+            if worker is not None:
+                worker["updated_at"] = event.get("ts", time.time())
+
+    # ---------- 取消 ----------
+    def cancel(self, job, grace=3):
+        """
+        取消任务:
+        1. 通过任务自己的 PTY channel 发送 Ctrl-C (SIGINT 前台进程组)
+        2. 在同一个 SSH 连接上 kill 整个远端进程组，以及事件里登记的浏览器进程组 (浏览器在独立会话里，
+           不会随爬虫进程组收到信号；爬虫自身的清理可能超过宽限期)，宽限后一并 SIGKILL
+        kill 序列在后台线程里执行，调用方 (HTTP 请求) 立即返回；任务的收尾由读取输出的线程完成
+        """
+        with self._lock:
+            if job.status in FINISHED_STATES:
+                return False
+            job.cancel_requested = True
+            client, channel, pgid = job.client, job.channel, job.remote_pgid
+            groups = " ".join(f"-{g}" for g in [pgid] + sorted(job.browser_pgids) if g)
+
+        if channel is not None:
+            try:
+                channel.send("\x03")
+            except Exception:
+                pass
+
+        if client is not None and pgid:
+            threading.Thread(target=self._kill_remote, args=(client, channel, groups, grace), daemon=True).start()
+        elif channel is not None:
+            try:
+                channel.close()
+            except Exception:
+                pass
+        return True
+
+    @staticmethod
+    def _kill_remote(client, channel, groups, grace):
+        cmd = (f"kill -TERM -- {groups} 2>/dev/null; sleep {grace}; "
+               f"kill -KILL -- {groups} 2>/dev/null; true")
+        try:
+            _, stdout, _ = client.exec_command(cmd)
+            stdout.channel.recv_exit_status()
+        except Exception:
+            # 连接已断: 远端进程随会话结束，关掉 channel 让读取线程收尾
+            if channel is not None:
+                try:
+                    channel.close()
+                except Exception:
+                    pass
@@ -0,0 +1,108 @@
+"""
+日志发布/订阅总线
+- 每个 SSE 客户端一个有界环形缓冲区，互不抢消息
+- 阻塞等待 (Condition)，不再 sleep 轮询
+- 支持按 task_id 过滤
+- 全局重放窗口，断线重连时按 Last-Event-ID 补发
+"""
+import itertools
+import threading
+from collections import deque
+
+
+class LogSubscriber:
+    """单个订阅者 (对应一个浏览器 SSE 连接)"""
+
+    def __init__(self, task_id=None, buffer_size=2000):
+        self.task_id = task_id
+        self.buffer = deque(maxlen=buffer_size)
+        self.dropped = 0
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def matches(self, event):
+        return self.task_id is None or event.get("task_id") == self.task_id
+
+    def push(self, event_id, event):
+        with self._cond:
+            if len(self.buffer) == self.buffer.maxlen:
+                # 客户端太慢，最旧的消息被覆盖
+                self.dropped += 1
+            self.buffer.append((event_id, event))
+            self._cond.notify()
+
+    def wait(self, timeout=None):
+        """阻塞直到有新消息或超时，返回 [(event_id, event), ...] 并清空缓冲"""
+        with self._cond:
+            if not self.buffer and not self.closed:
+                self._cond.wait(timeout)
+            items = list(self.buffer)
+            self.buffer.clear()
+            return items
+
+    def take_dropped(self):
+        with self._cond:
+            n, self.dropped = self.dropped, 0
+            return n
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class LogBus:
+    """进程内日志总线"""
+
+    def __init__(self, replay_size=5000, buffer_size=2000):
+        self.buffer_size = buffer_size
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._history = deque(maxlen=replay_size)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def publish(self, event):
+        """发布一条日志 (dict，需包含 task_id / message / type)"""
+        with self._lock:
+            event_id = next(self._ids)
+            self._last_id = event_id
+            self._history.append((event_id, event))
+            self.published += 1
+            # 在锁内分发，保证每个订阅者收到的 id 单调递增
+            for sub in self._subscribers:
+                if sub.matches(event):
+                    sub.push(event_id, event)
+        return event_id
+
+    # 兼容旧的 Queue 写法: log_bus.put({...})
+    put = publish
+
+    def subscribe(self, task_id=None, last_event_id=None):
+        """
+        创建订阅者；传入 last_event_id 时补发重放窗口内之后的消息
+        (后端重启导致 id 回退时，整个窗口全部补发)
+        """
+        with self._lock:
+            backlog = []
+            if last_event_id is not None:
+                if last_event_id > self._last_id:
+                    last_event_id = 0
+                backlog = [(i, e) for i, e in self._history
+                           if i > last_event_id and (task_id is None or e.get("task_id") == task_id)]
+            # 缓冲区容纳全部补发内容，保证重连不丢消息
+            sub = LogSubscriber(task_id=task_id, buffer_size=self.buffer_size + len(backlog))
+            for event_id, event in backlog:
+                sub.push(event_id, event)
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+        sub.close()
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
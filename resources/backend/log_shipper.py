@@ -0,0 +1,172 @@
+"""
+远程日志批量转发
+- 按大块读取 SSH channel (不再逐行 readline)
+- 按时间窗口 (默认 100ms) 把多行合并成一条 SSE 事件
+- 折叠 '\\r' 进度行，只保留窗口内最后一次进度
+- 按任务限速，超出部分汇总为一行提示
+"""
+import codecs
+import socket
+import time
+
+
+class LogBatcher:
+    """把零散的输出行攒成批次，通过 publish 回调发出"""
+
+    def __init__(self, publish, task_id, window=0.1, max_lines_per_second=200, max_batch_lines=500,
+                 line_filter=None):
+        self.publish = publish
+        self.task_id = task_id
+        # line_filter(line) 返回 True 表示该行是控制信息，已被消费，不推送到前端
+        self.line_filter = line_filter
+        self.window = window
+        self.max_lines_per_second = max_lines_per_second
+        self.max_batch_lines = max_batch_lines
+
+        self._partial = ""
+        self._lines = []
+        self._progress = None
+        self._window_start = time.monotonic()
+
+        # 每秒行数预算 (简单令牌桶)
+        self._budget = float(max_lines_per_second)
+        self._budget_ts = time.monotonic()
+        self._suppressed = 0
+
+        self.stats = {"bytes": 0, "lines_in": 0, "lines_out": 0, "batches": 0,
+                      "collapsed": 0, "suppressed": 0}
+
+    # ---------- 输入 ----------
+    def feed(self, text):
+        if not text:
+            return
+        self.stats["bytes"] += len(text)
+        data = self._partial + text
+        parts = data.split("\n")
+        self._partial = parts.pop()
+
+        for line in parts:
+            # PTY 输出是 \r\n；行内多个 \r 只有最后一段是终端上可见的内容
+            segments = [s for s in line.rstrip("\r").split("\r") if s.strip()]
+            self.stats["lines_in"] += 1
+            # 控制行 (@@EVENT) 即使被 \r 覆盖也要交给 line_filter 消费
+            segments = [s for s in segments[:-1] if not self._consume(s)] + segments[-1:]
+            if not segments:
+                continue
+            self.stats["collapsed"] += len(segments) - 1
+            if self._progress is not None:
+                # 进度行被后续正常输出覆盖，不再单独保留
+                self.stats["collapsed"] += 1
+                self._progress = None
+            visible = segments[-1].rstrip()
+            if self._consume(visible):
+                continue
+            self._add(visible)
+
+        # 未换行的尾部: print(..., end='\r') 形式的进度刷新
+        # 结尾的 '\r' 可能是被读块拆开的 '\r\n'，留到下一块数据到达再判断
+        tail = self._partial
+        held = ""
+        if tail.endswith("\r"):
+            tail, held = tail[:-1], "\r"
+        if "\r" in tail:
+            segments = tail.split("\r")
+            self._partial = segments.pop() + held
+            for seg in segments:
+                if not seg.strip() or self._consume(seg):
+                    continue
+                self.stats["lines_in"] += 1
+                if self._progress is not None:
+                    self.stats["collapsed"] += 1
+                self._progress = seg.rstrip()
+
+    def _consume(self, line):
+        """控制行交给 line_filter，返回 True 表示已被消费"""
+        return bool(self.line_filter and self.line_filter(line.strip()))
+
+    def _add(self, line):
+        self._lines.append(line)
+        if len(self._lines) >= self.max_batch_lines:
+            self.flush()
+
+    # ---------- 输出 ----------
+    def tick(self):
+        """时间窗口到期则发出一批"""
+        if time.monotonic() - self._window_start >= self.window:
+            self.flush()
+
+    def _take_budget(self, n):
+        now = time.monotonic()
+        self._budget = min(self.max_lines_per_second,
+                           self._budget + (now - self._budget_ts) * self.max_lines_per_second)
+        self._budget_ts = now
+        allowed = min(n, int(self._budget))
+        self._budget -= allowed
+        return allowed
+
+    def flush(self):
+        self._window_start = time.monotonic()
+        lines = self._lines
+        if self._progress is not None:
+            lines = lines + [self._progress]
+            self._progress = None
+        self._lines = []
+        if not lines:
+            return
+
+        allowed = self._take_budget(len(lines))
+        if allowed < len(lines):
+            # 保留报错行，其余按预算截断
+            important = [l for l in lines[allowed:] if "❌" in l or "Traceback" in l or "Error" in l]
+            self._suppressed += len(lines) - allowed - len(important)
+            self.stats["suppressed"] += len(lines) - allowed - len(important)
+            lines = lines[:allowed] + important
+
+        if self._suppressed and allowed > 0:
+            lines.append(f" ... 输出过快，已省略 {self._suppressed} 行")
+            self._suppressed = 0
+        if not lines:
+            return
+
+        self.stats["lines_out"] += len(lines)
+        self.stats["batches"] += 1
+        self.publish({
+            "task_id": self.task_id,
+            "message": "\n".join(lines),
+            "type": "info",
+            "lines": lines,
+            "count": len(lines),
+        })
+
+    def close(self):
+        if self._partial.strip():
+            self._add(self._partial.rstrip("\r"))
+        self._partial = ""
+        self.flush()
+        if self._suppressed:
+            self._lines.append(f" ... 输出过快，已省略 {self._suppressed} 行")
+            self._suppressed = 0
+            self._budget = max(self._budget, 1)
+            self.flush()
+
+
+def pump_channel(channel, batcher, chunk_size=65536):
+    """
+    持续读取 channel 直到 EOF，数据交给 batcher
+    channel 使用超时读取，即使没有新输出也能按时间窗口刷新
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    channel.settimeout(batcher.window)
+    while True:
+        try:
+            data = channel.recv(chunk_size)
+        except socket.timeout:
+            batcher.tick()
+            continue
+        if not data:
+            break
+        batcher.feed(decoder.decode(data))
+        batcher.tick()
+    batcher.feed(decoder.decode(b"", final=True))
+    batcher.close()
+    return batcher.stats
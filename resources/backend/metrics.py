@@ -0,0 +1,111 @@
+"""
+Prometheus 文本格式 (exposition format 0.0.4) 指标
+- CounterSet: 后端自身的累计计数 (同步字节数、日志转发行数等)，线程安全
+- RateMeter: 由累计值估算最近一段时间的每秒速率 (每次抓取时采样)
+- MetricsWriter: 每次 /metrics 请求时现场拼装文本，不依赖 prometheus_client
+"""
+import threading
+import time
+from collections import deque
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels):
+    items = [(k, v) for k, v in labels.items() if v is not None]
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(items)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class CounterSet:
+    """(名称, 标签) -> 累计值"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def items(self, name):
+        with self._lock:
+            return [(dict(labels), value) for (n, labels), value in self._values.items() if n == name]
+
+
+class RateMeter:
+    """记录 (时间, 累计值) 样本，返回窗口内的平均每秒增量"""
+
+    def __init__(self, window=60):
+        self.window = window
+        self._samples = deque()
+        self._lock = threading.Lock()
+
+    def rate(self, total):
+        now = time.time()
+        with self._lock:
+            self._samples.append((now, total))
+            while len(self._samples) > 2 and now - self._samples[0][0] > self.window:
+                self._samples.popleft()
+            first_ts, first_total = self._samples[0]
+        elapsed = now - first_ts
+        return round((total - first_total) / elapsed, 3) if elapsed > 0 else 0.0
+
+
+class MetricsWriter:
+    def __init__(self, prefix="crawler_"):
+        self.prefix = prefix
+        self._families = {}
+
+    def _family(self, name, kind, help_text):
+        name = self.prefix + name
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = {"kind": kind, "help": help_text, "samples": []}
+        return name, family
+
+    def sample(self, name, kind, help_text, value, /, **labels):
+        name, family = self._family(name, kind, help_text)
+        family["samples"].append(f"{name}{format_labels(labels)} {_format_value(value)}")
+
+    def gauge(self, name, help_text, value, /, **labels):
+        self.sample(name, "gauge", help_text, value, **labels)
+
+    def counter(self, name, help_text, value, /, **labels):
+        # Prometheus 约定计数器以 _total 结尾
+        if not name.endswith("_total"):
+            name += "_total"
+        self.sample(name, "counter", help_text, value, **labels)
+
+    def histogram(self, name, help_text, bounds, buckets, total, count, /, **labels):
+        """buckets 为各桶的非累计计数 (最后一个为 +Inf 桶)，这里转换成累计形式"""
+        name, family = self._family(name, "histogram", help_text)
+        cumulative = 0
+        for bound, n in zip(list(bounds) + [float("inf")], buckets):
+            cumulative += n
+            family["samples"].append(
+                f"{name}_bucket{format_labels(dict(labels, le=_format_value(float(bound))))} {cumulative}")
+        family["samples"].append(f"{name}_sum{format_labels(labels)} {_format_value(float(total))}")
+        family["samples"].append(f"{name}_count{format_labels(labels)} {count}")
+
+    def render(self):
+        lines = []
+        for name, family in self._families.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            lines.extend(family["samples"])
+        return "\n".join(lines) + "\n"
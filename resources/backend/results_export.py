@@ -0,0 +1,244 @@
+"""
+远端结果批量打包下载
+- 远端 find + tar + zstd/gzip 打成一个流，后端边读边转发给客户端 (不在内存里缓冲整个包)
+- 可选水位线 since: 只打包修改时间晚于该时间戳的文件
+- 打包流同时 tee 到远端缓存文件，断点续传 (Range) 时直接从缓存文件 seek 读取
+- ETag / 缓存文件名包含文件清单 (路径/大小/mtime) 的摘要，内容变化后旧的续传请求拿到完整的 200
+- 任务结束后把本次写入的 *_products_*.json 拉回本地数据根目录，供结果索引查询
+"""
+import hashlib
+import logging
+import os
+import re
+import shlex
+import tarfile
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# 远端打包缓存目录
+EXPORT_CACHE_DIR = "/tmp/crawler_export"
+# 缓存保留时间 (分钟)
+EXPORT_CACHE_MINUTES = 60
+CHUNK_SIZE = 256 * 1024
+# 结果文件名 (与 results_index.FILE_PATTERN 一致)，拉回本地时同一关键词只保留最新的
+PRODUCTS_FILE = re.compile(r'^(.+?)_products_(\d{8}_\d{6})\.json$')
+
+COMPRESSORS = {
+    "zstd": {"cmd": "zstd -q -c -T0", "ext": "tar.zst", "mimetype": "application/zstd"},
+    "gzip": {"cmd": "gzip -c", "ext": "tar.gz", "mimetype": "application/gzip"},
+}
+
+# 每台服务器是否安装 zstd 的缓存 {host_key: bool}
+_zstd_available = {}
+
+
+def _run(client, cmd):
+    _, stdout, stderr = client.exec_command(cmd)
+    out = stdout.read().decode("utf-8", "ignore")
+    status = stdout.channel.recv_exit_status()
+    return status, out, stderr.read().decode("utf-8", "ignore")
+
+
+def _split_dir(data_dir):
+    return data_dir.rstrip("/").rsplit("/", 1) if "/" in data_dir.rstrip("/") else (".", data_dir)
+
+
+def _listing_command(name, since):
+    """列出待打包文件的 路径/大小/mtime，排序后用于计算内容摘要"""
+    newer = f"-newermt @{int(since)}" if since else ""
+    return f"find {shlex.quote(name)} -type f {newer} -printf '%p\\t%s\\t%T@\\n' | LC_ALL=C sort | sha1sum | cut -c1-40"
+
+
+def probe_remote(client, host_key, data_dir, since=None):
+    """一次往返取得远端当前时间 (作为新水位线)、zstd 可用性与待打包文件清单摘要"""
+    parent, name = _split_dir(data_dir)
+    status, out, _ = _run(
+        client,
+        "date +%s; command -v zstd >/dev/null 2>&1 && echo zstd || echo none; "
+        f"cd {shlex.quote(parent or '/')} 2>/dev/null && {_listing_command(name, since)} || echo missing"
+    )
+    lines = out.split()
+    remote_now = int(lines[0]) if lines and lines[0].isdigit() else None
+    _zstd_available[host_key] = len(lines) > 1 and lines[1] == "zstd"
+    digest = lines[2] if len(lines) > 2 else "missing"
+    return remote_now, digest
+
+
+def remote_clock(client):
+    """远端当前时间戳 (拉取结果的水位线用远端时钟，避免本机与节点时钟偏差)"""
+    status, out, _ = _run(client, "date +%s")
+    return int(out.strip()) if status == 0 and out.strip().isdigit() else None
+
+
+def pull_results(client, data_dir, local_root, since=None):
+    """
+    把远端 data_dir 中 since 之后写入的 *_products_*.json 拉到 local_root/<目录名>/，
+    同一关键词本地较旧的文件删除 (与爬虫保存时新文件取代旧文件一致)；返回拉取的文件数
+    """
+    parent, name = _split_dir(data_dir)
+    newer = f"-newermt @{int(since)}" if since else ""
+    cmd = (f"cd {shlex.quote(parent or '/')} && "
+           f"find {shlex.quote(name)} -maxdepth 1 -type f -name '*_products_*.json' {newer} -print0 | "
+           f"tar --null -T - -czf -")
+    _, stdout, stderr = client.exec_command(cmd, bufsize=CHUNK_SIZE)
+    local_dir = os.path.join(local_root, name)
+    newest = {}
+    pulled = 0
+    tar_error = None
+    try:
+        with tarfile.open(fileobj=stdout, mode="r|gz") as tar:
+            for member in tar:
+                base = member.name.rsplit("/", 1)[-1]
+                match = PRODUCTS_FILE.match(base)
+                # 只接受目录下一层的普通结果文件，忽略其它成员 (防止路径穿越)
+                if not member.isfile() or member.name != f"{name}/{base}" or not match:
+                    continue
+                os.makedirs(local_dir, exist_ok=True)
+                target = os.path.join(local_dir, base)
+                tmp = f"{target}.part"
+                with tar.extractfile(member) as src, open(tmp, "wb") as dst:
+                    while True:
+                        data = src.read(CHUNK_SIZE)
+                        if not data:
+                            break
+                        dst.write(data)
+                os.utime(tmp, (member.mtime, member.mtime))
+                os.replace(tmp, target)
+                pulled += 1
+                keyword, stamp = match.groups()
+                newest[keyword] = max(stamp, newest.get(keyword, stamp))
+    except tarfile.TarError as e:
+        # 远端命令失败时输出不是完整的 gzip 流，以退出码和 stderr 为准
+        tar_error = e
+    status = stdout.channel.recv_exit_status()
+    if status != 0 or tar_error is not None:
+        detail = stderr.read().decode("utf-8", "ignore").strip() or tar_error
+        raise Exception(f"拉取结果失败 (exit {status}): {detail}")
+    if newest:
+        for old_name in os.listdir(local_dir):
+            match = PRODUCTS_FILE.match(old_name)
+            if match and match.group(1) in newest and match.group(2) < newest[match.group(1)]:
+                os.remove(os.path.join(local_dir, old_name))
+    return pulled
+
+
+def choose_compression(requested, host_key):
+    if requested == "zstd" and _zstd_available.get(host_key):
+        return "zstd"
+    return "gzip"
+
+
+def export_key(data_dir, since, compression, digest):
+    """同一 (目录, 水位线, 压缩方式, 文件清单摘要) 生成同一个 ETag / 缓存文件名"""
+    raw = f"{data_dir}|{since or 0}|{compression}|{digest}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_path(key, compression):
+    return f"{EXPORT_CACHE_DIR}/{key}.{COMPRESSORS[compression]['ext']}"
+
+
+def build_pack_command(data_dir, since, compression, cache_file, digest):
+    """
+    生成远端打包命令: 输出到 stdout，同时写入缓存文件
+    打包完成后重新计算文件清单摘要，与 ETag 对应的 digest 一致才改名为缓存文件，
+    打包期间文件有变化则丢弃，避免续传时拼出与 ETag 不符的归档
+    """
+    parent, name = _split_dir(data_dir)
+    newer = f"-newermt @{int(since)}" if since else ""
+    part = f"{cache_file}.part.{uuid.uuid4().hex[:8]}"
+    return (
+        f"set -o pipefail 2>/dev/null; "
+        f"mkdir -p {EXPORT_CACHE_DIR} && "
+        f"find {EXPORT_CACHE_DIR} -type f -mmin +{EXPORT_CACHE_MINUTES} -delete 2>/dev/null; "
+        f"cd {shlex.quote(parent or '/')} && "
+        f"find {shlex.quote(name)} -type f {newer} -print0 | "
+        f"tar --null -T - -cf - | {COMPRESSORS[compression]['cmd']} | "
+        f"tee {shlex.quote(part)} && "
+        f"if [ \"$({_listing_command(name, since)})\" = {shlex.quote(digest)} ]; "
+        f"then mv -f {shlex.quote(part)} {shlex.quote(cache_file)}; "
+        f"else rm -f {shlex.quote(part)}; fi"
+    )
+
+
+def stream_pack(client, data_dir, since, compression, cache_file, digest):
+    """
+    执行打包命令并逐块产出压缩数据
+    远端 find/tar/压缩失败时抛异常: 已发出的响应随之中断，客户端拿到的是不完整的传输而不是看似成功的截断归档
+    """
+    cmd = build_pack_command(data_dir, since, compression, cache_file, digest)
+    _, stdout, stderr = client.exec_command(cmd, bufsize=CHUNK_SIZE)
+    channel = stdout.channel
+    try:
+        while True:
+            data = channel.recv(CHUNK_SIZE)
+            if not data:
+                break
+            yield data
+        status = channel.recv_exit_status()
+        if status != 0:
+            err = stderr.read().decode("utf-8", "ignore").strip()
+            logger.error(f" 远端打包失败 {data_dir} (exit {status}): {err}")
+            raise Exception(f"远端打包失败 (exit {status}): {err}")
+    finally:
+        # 客户端中途断开时关闭 channel，远端 tee 收到 SIGPIPE 退出，残留 .part 由过期清理删除
+        channel.close()
+
+
+def ensure_cached(client, data_dir, since, compression, cache_file, digest):
+    """
+    确保远端缓存文件存在 (Range 请求需要固定内容)，返回文件大小
+    打包期间内容发生变化 (缓存与 ETag 不符，未落盘) 时返回 None
+    """
+    sftp = client.open_sftp()
+    try:
+        try:
+            return sftp.stat(cache_file).st_size
+        except FileNotFoundError:
+            pass
+        cmd = f"( {build_pack_command(data_dir, since, compression, cache_file, digest)} ) > /dev/null"
+        status, _, err = _run(client, cmd)
+        if status != 0:
+            raise Exception(f"远端打包失败: {err.strip()}")
+        try:
+            return sftp.stat(cache_file).st_size
+        except FileNotFoundError:
+            return None
+    finally:
+        sftp.close()
+
+
+def stream_cached_range(client, cache_file, start, end):
+    """从远端缓存文件读取 [start, end] 字节区间"""
+    sftp = client.open_sftp()
+    try:
+        with sftp.open(cache_file, "rb") as f:
+            f.seek(start)
+            f.prefetch()
+            remaining = end - start + 1
+            while remaining > 0:
+                data = f.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+    finally:
+        sftp.close()
+
+
+def parse_range(header, total_size):
+    """解析单区间 Range 头: bytes=start-end / bytes=start- / bytes=-suffix，非法返回 None"""
+    match = re.match(r"^bytes=(\d*)-(\d*)$", (header or "").strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else total_size - 1
+    else:
+        start = max(0, total_size - int(match.group(2)))
+        end = total_size - 1
+    end = min(end, total_size - 1)
+    if start > end:
+        return None
+    return start, end
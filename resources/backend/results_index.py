@@ -0,0 +1,308 @@
+"""
+爬取结果索引与分页查询
+- 基于 SQLite (标准库) 为各爬虫输出目录建立索引
+- 按文件 mtime/size 增量刷新：新增/变化的 *_products_*.json 重新导入，被合并删除的旧文件同步移除
+- 游标 (keyset) 分页 + 索引列排序，翻页耗时与总数据量无关
+- 标题搜索走 FTS5 trigram 索引 (SQLite 不支持时退回 LIKE)，关键词列表来自导入时维护的 keywords 表
+"""
+import base64
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+INDEX_FILE = ".results_index.sqlite3"
+FILE_PATTERN = re.compile(r'^(.+?)_products_\d{8}_\d{6}\.json$')
+PRICE_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+
+# 排序方式: 名称 -> (列, 方向)
+SORTS = {
+    "newest": ("id", "DESC"),
+    "oldest": ("id", "ASC"),
+    "price_asc": ("price", "ASC"),
+    "price_desc": ("price", "DESC"),
+    "title": ("title", "ASC"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    platform TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    keyword TEXT,
+    title TEXT,
+    price REAL,
+    price_raw TEXT,
+    link TEXT,
+    image TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_products_file ON products(file);
+CREATE INDEX IF NOT EXISTS idx_products_platform_kw ON products(platform, keyword, id);
+CREATE INDEX IF NOT EXISTS idx_products_price ON products(price, id);
+CREATE INDEX IF NOT EXISTS idx_products_title ON products(title, id);
+CREATE TABLE IF NOT EXISTS keywords (
+    platform TEXT NOT NULL,
+    keyword TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    PRIMARY KEY (platform, keyword)
+);
+"""
+
+# 标题子串搜索: 外部内容 FTS5 表 + 触发器与 products 同步
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    title, content='products', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts(rowid, title) VALUES (new.id, new.title);
+END;
+CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, title) VALUES ('delete', old.id, old.title);
+END;
+"""
+# trigram 分词至少需要 3 个字符才能走索引
+FTS_MIN_CHARS = 3
+
+
+def parse_price(value):
+    """'$1,299' / '¥236' / 'N/A' -> float 或 None"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = PRICE_PATTERN.search(str(value).replace(",", ""))
+    return float(match.group()) if match else None
+
+
+def _encode_cursor(sort_value, row_id):
+    raw = json.dumps([sort_value, row_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor):
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return value, int(row_id)
+    except Exception:
+        raise ValueError("无效的 cursor")
+
+
+class ResultsIndex:
+    """
+    dirs: {platform: 数据目录}，例如 {"depop": "/data/depop_data"}
+    """
+
+    def __init__(self, index_path, dirs, refresh_interval=5):
+        self.index_path = index_path
+        self.dirs = dirs
+        self.refresh_interval = refresh_interval
+        self._last_refresh = 0.0
+        self._lock = threading.RLock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        self._db = sqlite3.connect(index_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        existing = {row[0] for row in self._db.execute("SELECT name FROM sqlite_master")}
+        self._db.executescript(SCHEMA)
+        if "keywords" not in existing:
+            # 旧版本索引文件: 从已有数据补建关键词表
+            self._db.execute("INSERT OR REPLACE INTO keywords (platform, keyword, rows) "
+                             "SELECT platform, keyword, COUNT(*) FROM products "
+                             "WHERE keyword IS NOT NULL AND keyword != '' GROUP BY platform, keyword")
+        self._fts = False
+        try:
+            self._db.executescript(FTS_SCHEMA)
+            self._fts = True
+            if "products_fts" not in existing:
+                self._db.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError:
+            # SQLite < 3.34 没有 trigram 分词，标题搜索退回 LIKE
+            pass
+        self._db.commit()
+
+    # ---------- 增量刷新 ----------
+    def refresh(self, force=False):
+        """扫描数据目录，只导入有变化的文件；返回本次变更统计"""
+        with self._lock:
+            if not force and time.time() - self._last_refresh < self.refresh_interval:
+                return None
+            stats = {"added": 0, "updated": 0, "removed": 0, "rows": 0}
+
+            known = {row["path"]: (row["mtime"], row["size"])
+                     for row in self._db.execute("SELECT path, mtime, size FROM files")}
+            seen = set()
+
+            for platform, data_dir in self.dirs.items():
+                data_path = Path(data_dir)
+                if not data_path.exists():
+                    continue
+                for json_file in data_path.glob('*_products_*.json'):
+                    if json_file.name.startswith('all_products'): continue
+                    match = FILE_PATTERN.match(json_file.name)
+                    if not match: continue
+
+                    path = str(json_file)
+                    seen.add(path)
+                    st = json_file.stat()
+                    if known.get(path) == (st.st_mtime, st.st_size):
+                        continue
+                    stats["updated" if path in known else "added"] += 1
+                    stats["rows"] += self._import_file(path, platform, match.group(1), st)
+
+            for path in set(known) - seen:
+                # _save_data 合并续传后会删除旧文件
+                self._delete_file_rows(path)
+                self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+                stats["removed"] += 1
+
+            self._db.commit()
+            self._last_refresh = time.time()
+            return stats
+
+    def _import_file(self, path, platform, keyword, st):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception:
+            # 文件可能正在写入，下次刷新再试
+            return 0
+        if not isinstance(data, list):
+            data = []
+
+        rows = []
+        for item in data:
+            if not isinstance(item, dict):
+                continue
+            price_raw = item.get('price')
+            rows.append((
+                path, platform, item.get('keyword') or keyword,
+                item.get('title') or "", parse_price(price_raw),
+                "" if price_raw is None else str(price_raw),
+                item.get('link') or "", item.get('image') or "",
+                json.dumps(item, ensure_ascii=False),
+            ))
+
+        touched = self._delete_file_rows(path, recount=False)
+        self._db.executemany(
+            "INSERT INTO products (file, platform, keyword, title, price, price_raw, link, image, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self._db.execute("INSERT OR REPLACE INTO files (path, platform, mtime, size, rows) VALUES (?, ?, ?, ?, ?)",
+                         (path, platform, st.st_mtime, st.st_size, len(rows)))
+        self._recount_keywords(touched | {(platform, row[2]) for row in rows})
+        return len(rows)
+
+    def _delete_file_rows(self, path, recount=True):
+        """删除某个文件导入的记录，返回涉及的 (platform, keyword)"""
+        touched = {(row[0], row[1]) for row in self._db.execute(
+            "SELECT DISTINCT platform, keyword FROM products WHERE file = ?", (path,))}
+        self._db.execute("DELETE FROM products WHERE file = ?", (path,))
+        if recount:
+            self._recount_keywords(touched)
+        return touched
+
+    def _recount_keywords(self, pairs):
+        """按 (platform, keyword) 重新计数 (走 idx_products_platform_kw)，计数为 0 的删除"""
+        for platform, keyword in pairs:
+            if not keyword:
+                continue
+            n = self._db.execute("SELECT COUNT(*) FROM products WHERE platform = ? AND keyword = ?",
+                                 (platform, keyword)).fetchone()[0]
+            if n:
+                self._db.execute("INSERT OR REPLACE INTO keywords (platform, keyword, rows) VALUES (?, ?, ?)",
+                                 (platform, keyword, n))
+            else:
+                self._db.execute("DELETE FROM keywords WHERE platform = ? AND keyword = ?", (platform, keyword))
+
+    # ---------- 查询 ----------
+    def query(self, platform=None, keyword=None, min_price=None, max_price=None, q=None,
+              sort="newest", limit=50, cursor=None):
+        if sort not in SORTS:
+            raise ValueError(f"不支持的排序: {sort}")
+        limit = max(1, min(int(limit), 500))
+        column, direction = SORTS[sort]
+
+        where, params = [], []
+        if platform:
+            where.append("platform = ?"); params.append(platform)
+        if keyword:
+            where.append("keyword = ?"); params.append(keyword)
+        if min_price is not None:
+            where.append("price >= ?"); params.append(float(min_price))
+        if max_price is not None:
+            where.append("price <= ?"); params.append(float(max_price))
+        if q and self._fts and len(q) >= FTS_MIN_CHARS:
+            # trigram 短语查询即子串匹配 (不区分大小写)
+            where.append("id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)")
+            params.append('"' + q.replace('"', '""') + '"')
+        elif q:
+            where.append("title LIKE ? ESCAPE '\\'")
+            params.append("%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if column == "price":
+            # 无价格的记录不参与价格排序
+            where.append("price IS NOT NULL")
+
+        if cursor:
+            value, row_id = _decode_cursor(cursor)
+            op = ">" if direction == "ASC" else "<"
+            if column == "id":
+                where.append(f"id {op} ?"); params.append(row_id)
+            else:
+                where.append(f"({column} {op} ? OR ({column} = ? AND id {op} ?))")
+                params.extend([value, value, row_id])
+
+        sql = "SELECT id, platform, keyword, title, price, price_raw, link, image, data FROM products"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {column} {direction}, id {direction} LIMIT ?"
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        items = []
+        for row in rows:
+            item = json.loads(row["data"])
+            item["_id"] = row["id"]
+            item["_platform"] = row["platform"]
+            item["_keyword"] = row["keyword"]
+            item["_price"] = row["price"]
+            items.append(item)
+
+        next_cursor = None
+        if has_more and rows:
+            last = rows[-1]
+            next_cursor = _encode_cursor(last[column], last["id"])
+        return {"items": items, "next_cursor": next_cursor, "has_more": has_more}
+
+    def stats(self):
+        with self._lock:
+            # 计数来自 files 表 (每个文件一行)，避免扫描 products
+            by_platform = {row["platform"]: row["n"] for row in self._db.execute(
+                "SELECT platform, SUM(rows) AS n FROM files GROUP BY platform")}
+            files = self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        return {"files": files, "products": sum(by_platform.values()), "by_platform": by_platform,
+                "last_refresh": self._last_refresh}
+
+    def keywords(self, platform=None):
+        sql = "SELECT DISTINCT keyword FROM keywords"
+        params = []
+        if platform:
+            sql += " WHERE platform = ?"; params.append(platform)
+        sql += " ORDER BY keyword"
+        with self._lock:
+            return [row[0] for row in self._db.execute(sql, params)]
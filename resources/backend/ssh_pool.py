@@ -0,0 +1,225 @@
+"""
+SSH 连接池
+- 按 (host, user, key_file) 复用同一个 Transport，多个任务在其上复用 channel
+- keepalive + 取用前健康检查，断线自动重连
+- 空闲超时自动回收，单主机 channel 数上限 (对应 sshd 的 MaxSessions)
+- 短操作 (lease) 和长时间运行的 channel (attach: 爬虫/agent 隧道) 各有名额，互不堵塞；
+  max_channels + max_streams 要小于 sshd 的 MaxSessions (默认 10)，留一个给取消任务时的 kill
+- 等待名额有超时，超时抛 HostBusy
+- 暴露命中/未命中等统计数据
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import paramiko
+
+logger = logging.getLogger(__name__)
+
+
+class HostBusy(TimeoutError):
+    """等待 channel / 任务名额超时"""
+
+
+class _PooledConnection:
+    """池中的一条连接"""
+
+    def __init__(self, client, max_channels, max_streams):
+        self.client = client
+        self.created_at = time.time()
+        self.last_used = time.time()
+        self.leases = 0
+        self.streams = 0
+        self.slots = threading.BoundedSemaphore(max_channels)
+        self.stream_slots = threading.BoundedSemaphore(max_streams)
+
+    def is_alive(self):
+        transport = self.client.get_transport()
+        if not transport or not transport.is_active() or not transport.is_authenticated():
+            return False
+        try:
+            # 发一个 IGNORE 包探测，半开连接会在这里抛异常
+            transport.send_ignore()
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+class SSHConnectionPool:
+    """线程安全的 SSH 连接池"""
+
+    def __init__(self, keepalive=30, idle_timeout=300, max_channels=6, max_streams=3, connect_timeout=10,
+                 lease_timeout=30):
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self.max_channels = max_channels
+        self.max_streams = max_streams
+        self.connect_timeout = connect_timeout
+        # 等待 channel 名额的默认超时 (秒)，超时抛 HostBusy 而不是无限阻塞
+        self.lease_timeout = lease_timeout
+
+        self._lock = threading.Lock()
+        self._conns = {}
+        self._key_locks = {}
+        self._stats = {"hits": 0, "misses": 0, "reconnects": 0, "evictions": 0}
+        self._reaper = None
+
+    # ---------- 内部工具 ----------
+    def _connect(self, host, user, key_file):
+        key = paramiko.RSAKey.from_private_key_file(key_file)
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(hostname=host, username=user, pkey=key, timeout=self.connect_timeout)
+        transport = client.get_transport()
+        if transport and self.keepalive:
+            transport.set_keepalive(self.keepalive)
+        logger.info(f" link to {host} (新建连接)")
+        return client
+
+    def _key_lock(self, key):
+        # 同一主机的建连串行化，避免并发任务同时握手
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def _release(self, key, conn):
+        # 失效后被替换掉的连接，等最后一个使用者结束再关闭
+        with self._lock:
+            conn.last_used = time.time()
+            retired = self._conns.get(key) is not conn and conn.leases == 0 and conn.streams == 0
+        if retired:
+            conn.close()
+
+    def _ensure_reaper(self):
+        if self._reaper and self._reaper.is_alive():
+            return
+        self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+        self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(max(5, min(60, self.idle_timeout / 2)))
+            self.reap_idle()
+
+    # ---------- 对外接口 ----------
+    def get(self, host, user, key_file):
+        """取得一个健康的连接 (不占用 channel 名额)"""
+        key = (host, user, key_file)
+        with self._key_lock(key):
+            with self._lock:
+                conn = self._conns.get(key)
+
+            if conn and conn.is_alive():
+                with self._lock:
+                    self._stats["hits"] += 1
+                    conn.last_used = time.time()
+                return conn
+
+            if conn:
+                # 连接已失效，重建；还有人在用的旧连接只移出池子，由最后一个使用者关闭
+                logger.warning(f" SSH 连接失效，重新连接 {host}")
+                with self._lock:
+                    self._stats["reconnects"] += 1
+                    in_use = conn.leases or conn.streams
+                if not in_use:
+                    conn.close()
+
+            client = self._connect(host, user, key_file)
+            conn = _PooledConnection(client, self.max_channels, self.max_streams)
+            with self._lock:
+                self._conns[key] = conn
+                self._stats["misses"] += 1
+            self._ensure_reaper()
+            return conn
+
+    @contextmanager
+    def lease(self, host, user, key_file, timeout=None):
+        """
+        租用一个 channel 名额，期间可以在 client 上 exec/sftp (用于短操作)
+
+        用法:
+            with ssh_pool.lease(ip, user, key) as client:
+                client.exec_command(...)
+        """
+        key = (host, user, key_file)
+        conn = self.get(host, user, key_file)
+        timeout = self.lease_timeout if timeout is None else timeout
+        if not conn.slots.acquire(timeout=timeout):
+            raise HostBusy(f"{host} 繁忙: channel 数已达上限 ({self.max_channels})，等待 {timeout}s 未释放")
+        with self._lock:
+            conn.leases += 1
+        try:
+            yield conn.client
+        finally:
+            with self._lock:
+                conn.leases -= 1
+            conn.slots.release()
+            self._release(key, conn)
+
+    @contextmanager
+    def attach(self, host, user, key_file, timeout=None):
+        """
+        长时间运行的 channel (整个爬虫任务 / agent 隧道) 使用:
+        连接在期间不会被空闲回收；占用单独的任务名额 (max_streams)，不挤占短操作的 channel 名额
+        """
+        key = (host, user, key_file)
+        conn = self.get(host, user, key_file)
+        timeout = self.lease_timeout if timeout is None else timeout
+        if not conn.stream_slots.acquire(timeout=timeout):
+            raise HostBusy(f"{host} 繁忙: 运行中的任务数已达上限 ({self.max_streams})，等待 {timeout}s 未结束")
+        with self._lock:
+            conn.streams += 1
+        try:
+            yield conn.client
+        finally:
+            with self._lock:
+                conn.streams -= 1
+            conn.stream_slots.release()
+            self._release(key, conn)
+
+    def reap_idle(self):
+        """回收超过空闲时间且无人使用的连接"""
+        now = time.time()
+        expired = []
+        with self._lock:
+            for key, conn in list(self._conns.items()):
+                if conn.leases == 0 and conn.streams == 0 and now - conn.last_used > self.idle_timeout:
+                    expired.append(conn)
+                    del self._conns[key]
+                    self._stats["evictions"] += 1
+        for conn in expired:
+            conn.close()
+        return len(expired)
+
+    def close_all(self):
+        with self._lock:
+            conns = list(self._conns.values())
+            self._conns.clear()
+        for conn in conns:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            total = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / total, 3) if total else 0.0,
+                "connections": len(self._conns),
+                "active_channels": sum(c.leases for c in self._conns.values()),
+                "active_streams": sum(c.streams for c in self._conns.values()),
+                "max_channels": self.max_channels,
+                "max_streams": self.max_streams,
+                "hosts": [
+                    {"host": k[0], "user": k[1], "leases": c.leases, "streams": c.streams,
+                     "idle_seconds": round(time.time() - c.last_used, 1)}
+                    for k, c in self._conns.items()
+                ],
+            }
@@ -0,0 +1,325 @@
+"""
+端到端爬取基准测试 (离线，本地假站点 + 真实浏览器)
+- 启动 fixture_server，通过 CRAWLER_SITE_OVERRIDE 把目标域名转到本地，爬虫代码本身不做任何修改
+- depop / ebay / grailed 走 BaseCrawler 子类的 crawl()，vips 走 crawl_products_automated (自动回车跳过首次调试/验证提示)
+- 每个站点在独立子进程里跑，统计 items/s、首条商品耗时 (服务端发出 / 爬虫解析出)，以及各阶段耗时:
+    browser_start  启动浏览器并连接
+    navigate       page.goto
+    wait           wait_for_load_state / wait_for_function
+    scroll         页面内 JS (滚动、计数)
+    content        page.content()
+    parse          extract_products
+    save           _save_data
+    challenge      验证页检测与等待 (vips)
+    sleep          爬虫里的 asyncio.sleep (可用 --sleep-scale 缩放)
+- 浏览器默认用 Playwright 自带的 Chromium，可用 CRAWLER_BROWSER / CRAWLER_BROWSER_CHANNEL 覆盖
+
+用法:
+    python resources/benchmarks/bench_crawl.py                               # 四个站点，默认参数
+    python resources/benchmarks/bench_crawl.py --site ebay --latency-ms 200 --items 600 --max-count 500
+    python resources/benchmarks/bench_crawl.py --sleep-scale 0.1 --challenge-every 5
+"""
+import argparse
+import asyncio
+import functools
+import io
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SPIDERS_DIR = os.path.join(os.path.dirname(BENCH_DIR), "spiders")
+ROOT_DIR = os.path.dirname(os.path.dirname(BENCH_DIR))
+
+sys.path.insert(0, BENCH_DIR)
+from fixture_server import FixtureConfig, override_env, start_server
+from make_parser_fixtures import KEYWORDS
+
+SITES = ["depop", "ebay", "grailed", "vips"]
+PHASES = ["browser_start", "navigate", "wait", "scroll", "content", "parse", "save", "challenge", "sleep"]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# ==================== 阶段计时 ====================
+class PhaseTimer:
+    """按阶段累计耗时；嵌套调用只算最外层 (例如 scroll_to_load 里的 sleep 记在 scroll 上)"""
+
+    def __init__(self):
+        self.phases = {}
+        self.depth = 0
+        self.active = None
+        self.first_item_ts = None
+
+    def add(self, name, seconds):
+        entry = self.phases.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def wrap(self, name, func):
+        timer = self
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if timer.depth:
+                    return await func(*args, **kwargs)
+                timer.depth += 1
+                timer.active = name
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    timer.add(name, time.perf_counter() - started)
+                    timer.depth -= 1
+                    timer.active = None
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if timer.depth:
+                return func(*args, **kwargs)
+            timer.depth += 1
+            timer.active = name
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.add(name, time.perf_counter() - started)
+                timer.depth -= 1
+                timer.active = None
+        return wrapper
+
+    def report(self, wall):
+        rows = []
+        for name in PHASES + sorted(set(self.phases) - set(PHASES)):
+            if name in self.phases:
+                calls, seconds = self.phases[name]
+                rows.append({"phase": name, "calls": calls, "seconds": round(seconds, 3),
+                             "share": round(seconds / wall, 3) if wall else 0})
+        other = wall - sum(seconds for _, seconds in self.phases.values())
+        rows.append({"phase": "other", "calls": 0, "seconds": round(other, 3),
+                     "share": round(other / wall, 3) if wall else 0})
+        return rows
+
+
+def instrument(crawler_cls, timer, sleep_scale):
+    """给爬虫类和 asyncio.sleep 挂上计时；页面方法在 init_browser 之后再包"""
+    init_browser = crawler_cls.init_browser
+
+    async def init_and_instrument(self, *args, **kwargs):
+        await timer.wrap("browser_start", init_browser)(self, *args, **kwargs)
+        page = self.page
+        for method, phase in (("goto", "navigate"), ("wait_for_load_state", "wait"),
+                              ("wait_for_function", "wait"), ("evaluate", "scroll"), ("content", "content")):
+            setattr(page, method, timer.wrap(phase, getattr(page, method)))
+
+    crawler_cls.init_browser = init_and_instrument
+
+    extract_products = crawler_cls.extract_products
+
+    def extract_and_mark(self, *args, **kwargs):
+        items = extract_products(self, *args, **kwargs)
+        if items and timer.first_item_ts is None:
+            timer.first_item_ts = time.time()
+        return items
+
+    crawler_cls.extract_products = timer.wrap("parse", extract_and_mark)
+    for method, phase in (("_save_data", "save"), ("scroll_to_load", "scroll"),
+                          ("check_verification", "challenge"), ("handle_verification_with_retry", "challenge")):
+        if hasattr(crawler_cls, method):
+            setattr(crawler_cls, method, timer.wrap(phase, getattr(crawler_cls, method)))
+
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay, *args, **kwargs):
+        # 启动浏览器时的等待不缩放 (浏览器需要真实时间起来)
+        if timer.active != "browser_start":
+            delay = delay * sleep_scale
+        return await real_sleep(delay, *args, **kwargs)
+
+    asyncio.sleep = timer.wrap("sleep", sleep)
+
+
+# ==================== 单站点 (子进程内执行) ====================
+async def _browser_executable():
+    from playwright.async_api import async_playwright
+    async with async_playwright() as p:
+        return p.chromium.executable_path
+
+
+async def _crawl(site, keywords, max_count, vips_pages, output_dir, timer, sleep_scale):
+    sys.path[:0] = [SPIDERS_DIR, ROOT_DIR]
+    if site == "vips":
+        import vips_crawler
+        instrument(vips_crawler.VipsCrawler, timer, sleep_scale)
+        # cookies 写到临时目录；首次调试 / 验证提示都自动回车
+        vips_crawler.COOKIES_FILE = Path(output_dir) / "vips_cookies.json"
+        sys.stdin = io.StringIO("\n" * 1000)
+        await vips_crawler.crawl_products_automated(keywords, vips_pages, headless=True, output_dir=output_dir)
+        return
+
+    if site == "depop":
+        from depop_crawler import DepopCrawler as crawler_cls
+    elif site == "ebay":
+        from ebay_crawler import EbayCrawler as crawler_cls
+    else:
+        from grailed_crawler import GrailedCrawler as crawler_cls
+    instrument(crawler_cls, timer, sleep_scale)
+    crawler = crawler_cls(port=_free_port())
+    try:
+        await crawler.crawl([(kw, 0) for kw in keywords], max_count, output_dir)
+    finally:
+        crawler.kill_browser()
+
+
+def _count_saved(output_dir):
+    total = 0
+    for json_file in Path(output_dir).glob("*_products_*.json"):
+        if json_file.name.startswith("all_products"):
+            continue
+        with open(json_file, "r", encoding="utf-8") as f:
+            total += len(json.load(f))
+    return total
+
+
+def _server_stats(server_url, action):
+    with urllib.request.urlopen(f"{server_url}/{action}", timeout=10) as resp:
+        return json.loads(resp.read())
+
+
+def run_site(site, keywords, max_count, vips_pages, server_url, sleep_scale, verbose):
+    work_dir = tempfile.mkdtemp(prefix=f"bench_crawl_{site}_")
+    output_dir = os.path.join(work_dir, "out")
+    os.makedirs(output_dir)
+    os.environ.setdefault("CRAWLER_PROFILE_ROOT", work_dir)
+    os.environ.setdefault("CRAWLER_BROWSER_CHANNEL", "")
+    if "CRAWLER_BROWSER" not in os.environ:
+        os.environ["CRAWLER_BROWSER"] = asyncio.run(_browser_executable())
+
+    timer = PhaseTimer()
+    _server_stats(server_url, "_reset")
+    log = sys.stdout if verbose else io.StringIO()
+    real_stdout = sys.stdout
+    started = time.time()
+    try:
+        sys.stdout = log
+        asyncio.run(_crawl(site, keywords, max_count, vips_pages, output_dir, timer, sleep_scale))
+    finally:
+        sys.stdout = real_stdout
+    wall = time.time() - started
+
+    stats = _server_stats(server_url, "_stats")
+    items = _count_saved(output_dir)
+    served_ts = stats["first_item_ts"].get(site)
+    return {
+        "site": site,
+        "keywords": len(keywords),
+        "items": items,
+        "wall_seconds": round(wall, 2),
+        "items_per_sec": round(items / wall, 2) if wall else 0,
+        "ttfi_served": round(served_ts - started, 2) if served_ts else None,
+        "ttfi_parsed": round(timer.first_item_ts - started, 2) if timer.first_item_ts else None,
+        "requests": stats["requests"].get(site, 0),
+        "challenges": stats["challenges"],
+        "phases": timer.report(wall),
+        "output_dir": output_dir,
+    }
+
+
+def run_site_subprocess(site, args, server_url, env):
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", site, "--server-url", server_url,
+           "--max-count", str(args.max_count), "--vips-pages", str(args.vips_pages),
+           "--sleep-scale", str(args.sleep_scale)]
+    for keyword in args.keyword or [KEYWORDS[site]]:
+        cmd += ["--keyword", keyword]
+    if args.verbose:
+        cmd.append("--verbose")
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=None if args.verbose else subprocess.PIPE,
+                          text=True, env=env)
+    lines = proc.stdout.strip().splitlines()
+    if args.verbose:
+        print("\n".join(lines[:-1]))
+    if proc.returncode != 0 or not lines:
+        return {"site": site, "error": ((proc.stderr or "") + proc.stdout).strip().splitlines()[-1:]}
+    return json.loads(lines[-1])
+
+
+# ==================== 报告 ====================
+def _fmt(value, suffix="s"):
+    return "-" if value is None else f"{value}{suffix}"
+
+
+def print_report(results):
+    print(f"{'站点':<9}{'条数':>7}{'耗时(s)':>10}{'items/s':>10}{'首条(服务端)':>14}{'首条(解析)':>12}"
+          f"{'请求数':>8}{'验证页':>8}")
+    for r in results:
+        if r.get("error"):
+            print(f"{r['site']:<9} ❌ {r['error']}")
+            continue
+        print(f"{r['site']:<9}{r['items']:>7}{r['wall_seconds']:>10}{r['items_per_sec']:>10}"
+              f"{_fmt(r['ttfi_served']):>14}{_fmt(r['ttfi_parsed']):>12}{r['requests']:>8}{r['challenges']:>8}")
+    for r in results:
+        if r.get("error"):
+            continue
+        print(f"\n[{r['site']}] 阶段耗时")
+        for row in r["phases"]:
+            print(f"  {row['phase']:<14}{row['calls']:>6} 次 {row['seconds']:>9.2f}s {row['share'] * 100:>6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端爬取基准测试 (本地假站点)")
+    parser.add_argument("--site", action="append", choices=SITES, help="只跑指定站点 (可重复)")
+    parser.add_argument("--keyword", action="append", help="关键词 (可重复)，默认每个站点一个")
+    parser.add_argument("--max-count", type=int, default=200, help="每个关键词目标条数 (传给 crawl)")
+    parser.add_argument("--items", type=int, default=240, help="假站点每个关键词的商品总数")
+    parser.add_argument("--latency-ms", type=int, default=100, help="列表页/追加接口的响应延迟")
+    parser.add_argument("--page-size", type=int, help="翻页站点每页条数")
+    parser.add_argument("--scroll-batch", type=int, help="无限滚动每批条数")
+    parser.add_argument("--challenge-every", type=int, default=0, help="每隔 N 个列表页返回一次验证页")
+    parser.add_argument("--sleep-scale", type=float, default=1.0, help="爬虫 asyncio.sleep 缩放系数")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    parser.add_argument("--verbose", action="store_true", help="显示爬虫自身日志")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--server-url", help=argparse.SUPPRESS)
+    parser.add_argument("--vips-pages", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_site(args.worker, args.keyword, args.max_count, args.vips_pages, args.server_url,
+                          args.sleep_scale, args.verbose)
+        print(json.dumps(result, ensure_ascii=False))
+        return 0
+
+    config = FixtureConfig(args.latency_ms, args.items, args.page_size, args.scroll_batch, args.challenge_every)
+    server = start_server(config)
+    server_url = f"http://127.0.0.1:{server.server_port}"
+    # vips 按页数爬，换算成与 max_count 相当的页数
+    args.vips_pages = max(1, math.ceil(args.max_count / config.per_page("vips")))
+
+    results = []
+    for site in args.site or SITES:
+        env = dict(os.environ, CRAWLER_SITE_OVERRIDE=override_env(server, [site]))
+        print(f"🚀 {site} ...", flush=True)
+        results.append(run_site_subprocess(site, args, server_url, env))
+    server.shutdown()
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print_report(results)
+    return 1 if any(r.get("error") for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
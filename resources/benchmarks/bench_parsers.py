@@ -0,0 +1,329 @@
+"""
+解析器基准测试 (离线，无需浏览器/网络)
+- 语料: 仓库内 fixtures/<site>/*_page_*.html + 可选的本地数据目录 (save_html=True 保存的 {商品}_page_{n}.html)
+- 每个站点在独立子进程里跑 extract_products，分别统计 pages/s、records/s、峰值 RSS
+- 单独再跑一遍插桩，统计各选择器 (find / find_all / select / select_one ...) 的累计耗时
+- 同一子进程内先跑一段固定的校准负载 (html.parser 解析合成页面)，吞吐以"相对校准负载的倍数"记录，
+  换机器后仍可比较；绝对 records/s 只做展示
+- 与 parser_baseline.json 对比，相对吞吐下降超过阈值或解析条数变化则退出码为 1，CI 里可以直接用
+
+用法:
+    python resources/benchmarks/bench_parsers.py                      # 跑全部站点并与基线对比
+    python resources/benchmarks/bench_parsers.py --site vips --top 15
+    python resources/benchmarks/bench_parsers.py --data-dir goofish=/root/goofish_data
+    python resources/benchmarks/bench_parsers.py --update-baseline
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SPIDERS_DIR = os.path.join(os.path.dirname(BENCH_DIR), "spiders")
+ROOT_DIR = os.path.dirname(os.path.dirname(BENCH_DIR))
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+BASELINE_FILE = os.path.join(BENCH_DIR, "parser_baseline.json")
+PAGE_PATTERN = re.compile(r'^(.+?)_page_(\d+)\.html$')
+# 校准负载: 固定的合成商品列表页
+CALIBRATION_ITEMS = 200
+
+
+# ==================== 各站点解析入口 ====================
+def _load_site(site):
+    """返回 parse(html, keyword, page_num) -> 商品列表"""
+    # 平铺导入 (from crawler_base import ...) 和包导入 (from resources.spiders...) 两种写法都要能找到
+    sys.path[:0] = [SPIDERS_DIR, ROOT_DIR]
+    if site == "depop":
+        from depop_crawler import DepopCrawler
+        crawler = DepopCrawler(port=0)
+        return lambda html, keyword, page_num: crawler.extract_products(html, 0)
+    if site == "ebay":
+        from ebay_crawler import EbayCrawler
+        crawler = EbayCrawler(port=0)
+        return lambda html, keyword, page_num: crawler.extract_products(html, keyword, page_num)
+    if site == "grailed":
+        from grailed_crawler import GrailedCrawler
+        crawler = GrailedCrawler(port=0)
+        return lambda html, keyword, page_num: crawler.extract_products(html, 0)
+    if site == "goofish":
+        from goofish_crawler import GoofishCrawler
+        crawler = GoofishCrawler()
+    elif site == "vips":
+        from vips_crawler import VipsCrawler
+        crawler = VipsCrawler()
+    elif site == "xiaomi":
+        from xiaomiyoupin_crawler import XiaomiYoupinCrawler
+        crawler = XiaomiYoupinCrawler()
+    else:
+        raise ValueError(f"未知站点: {site}")
+    return lambda html, keyword, page_num: crawler.extract_products(html, page_num)
+
+
+SITES = ["depop", "ebay", "grailed", "goofish", "vips", "xiaomi"]
+
+
+def load_corpus(site, data_dirs):
+    """[(文件名, 关键词, 页码, html)]"""
+    dirs = [os.path.join(FIXTURES_DIR, site)] + list(data_dirs)
+    pages = []
+    for data_dir in dirs:
+        if not os.path.isdir(data_dir):
+            continue
+        for name in sorted(os.listdir(data_dir)):
+            match = PAGE_PATTERN.match(name)
+            if not match:
+                continue
+            with open(os.path.join(data_dir, name), "r", encoding="utf-8", errors="replace") as f:
+                pages.append((name, match.group(1), int(match.group(2)), f.read()))
+    return pages
+
+
+# ==================== 选择器插桩 ====================
+class SelectorProfiler:
+    """
+    临时替换 bs4.Tag 的查找方法，按 (方法, 参数) 累计耗时
+    find 内部会调用 find_all，只统计最外层调用，避免重复计时
+    """
+    METHODS = ("find", "find_all", "select", "select_one", "find_parent", "get_text")
+
+    def __init__(self):
+        self.stats = {}
+        self._depth = 0
+        self._originals = {}
+
+    @staticmethod
+    def _describe(method, args, kwargs):
+        parts = [repr(a.pattern if hasattr(a, "pattern") else a) for a in args[:1]]
+        for key in ("class_", "attrs", "href"):
+            if key in kwargs:
+                value = kwargs[key]
+                parts.append(f"{key}={value.pattern if hasattr(value, 'pattern') else value!r}")
+        return f"{method}({', '.join(parts)})"[:90]
+
+    def _wrap(self, method, original):
+        profiler = self
+
+        def wrapper(tag, *args, **kwargs):
+            if profiler._depth:
+                return original(tag, *args, **kwargs)
+            profiler._depth += 1
+            started = time.perf_counter()
+            try:
+                return original(tag, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                profiler._depth -= 1
+                key = profiler._describe(method, args, kwargs)
+                entry = profiler.stats.setdefault(key, [0, 0.0])
+                entry[0] += 1
+                entry[1] += elapsed
+        return wrapper
+
+    def __enter__(self):
+        from bs4.element import Tag
+        for method in self.METHODS:
+            original = getattr(Tag, method)
+            self._originals[method] = original
+            setattr(Tag, method, self._wrap(method, original))
+        return self
+
+    def __exit__(self, *exc):
+        from bs4.element import Tag
+        for method, original in self._originals.items():
+            setattr(Tag, method, original)
+
+    def top(self, n):
+        rows = sorted(self.stats.items(), key=lambda kv: kv[1][1], reverse=True)[:n]
+        return [{"selector": key, "calls": calls, "seconds": round(seconds, 4)} for key, (calls, seconds) in rows]
+
+
+# ==================== 校准负载 ====================
+def _calibration_page():
+    items = "".join(
+        f'<li class="item"><a href="/p/{i}"><img src="/img/{i}.jpg"><h3 class="title">Item {i}</h3></a>'
+        f'<span class="price">${i % 97}.99</span></li>'
+        for i in range(CALIBRATION_ITEMS)
+    )
+    return f"<html><body><ul class=\"list\">{items}</ul></body></html>"
+
+
+def calibrate(html):
+    """
+    解析一遍合成页面并提取字段，返回每秒处理的条目数
+    与 extract_products 走同一套 bs4 / html.parser，机器快慢对两者的影响基本同比例
+    """
+    from bs4 import BeautifulSoup
+    started = time.perf_counter()
+    soup = BeautifulSoup(html, "html.parser")
+    for li in soup.find_all("li", class_="item"):
+        li.find("a")["href"], li.find("h3").get_text(strip=True), li.find("span", class_="price").get_text()
+    return CALIBRATION_ITEMS / (time.perf_counter() - started)
+
+
+# ==================== 单站点 (子进程内执行) ====================
+def run_site(site, data_dirs, repeat, top):
+    parse = _load_site(site)
+    corpus = load_corpus(site, data_dirs)
+    if not corpus:
+        return {"site": site, "pages": 0}
+
+    sink = io.StringIO()
+    calibration_html = _calibration_page()
+    # 预热一遍 (导入、正则编译)
+    with contextlib.redirect_stdout(sink):
+        records = sum(len(parse(html, kw, page)) for _, kw, page, html in corpus)
+
+    # 每轮先跑校准负载再跑语料，两者背靠背计时，按轮求比值后取中位数，抵消机器频率/负载的漂移
+    elapsed, calibrations, ratios = float("inf"), [], []
+    with contextlib.redirect_stdout(sink):
+        calibrate(calibration_html)
+        for _ in range(repeat):
+            calibration = calibrate(calibration_html)
+            started = time.perf_counter()
+            for _, kw, page, html in corpus:
+                parse(html, kw, page)
+            seconds = time.perf_counter() - started
+            elapsed = min(elapsed, seconds)
+            calibrations.append(calibration)
+            ratios.append(records / seconds / calibration)
+            sink.seek(0)
+            sink.truncate()
+
+    profiler = SelectorProfiler()
+    with profiler, contextlib.redirect_stdout(sink):
+        for _, kw, page, html in corpus:
+            parse(html, kw, page)
+
+    records_per_sec = records / elapsed
+    return {
+        "site": site,
+        "pages": len(corpus),
+        "records": records,
+        "fixtures_only": not data_dirs,
+        "pages_per_sec": round(len(corpus) / elapsed, 2),
+        "records_per_sec": round(records_per_sec, 1),
+        "calibration_per_sec": round(statistics.median(calibrations), 1),
+        # 与机器无关的相对吞吐: 解析记录的速度是校准负载的多少倍
+        "relative_throughput": round(statistics.median(ratios), 4),
+        # Linux 上 ru_maxrss 单位为 KB
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "selectors": profiler.top(top),
+    }
+
+
+def run_site_subprocess(site, data_dirs, repeat, top):
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", site, "--repeat", str(repeat), "--top", str(top)]
+    for data_dir in data_dirs:
+        cmd += ["--data-dir", f"{site}={data_dir}"]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"site": site, "error": (proc.stderr or proc.stdout).strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+# ==================== 基线对比 ====================
+def compare(results, baseline, tolerance):
+    """只对解析条数和相对吞吐设门槛；绝对 records/s 随机器变化，不参与判定"""
+    regressions = []
+    for result in results:
+        base = baseline.get(result["site"])
+        if not base or not result.get("pages"):
+            continue
+        if result.get("fixtures_only") and result["records"] != base["records"]:
+            regressions.append(f"{result['site']}: 解析条数 {base['records']} -> {result['records']}")
+        # 相对吞吐只在同一语料 (仅 fixtures) 上可比
+        if not result.get("fixtures_only") or "relative_throughput" not in base:
+            continue
+        floor = base["relative_throughput"] * (1 - tolerance)
+        if result["relative_throughput"] < floor:
+            regressions.append(f"{result['site']}: 相对吞吐 {base['relative_throughput']} -> "
+                               f"{result['relative_throughput']} (低于阈值 {floor:.4f})")
+    return regressions
+
+
+def print_report(results, baseline, show_selectors):
+    print(f"{'站点':<10}{'页数':>6}{'条数':>8}{'pages/s':>10}{'records/s':>12}{'峰值RSS(MB)':>13}"
+          f"{'相对吞吐':>10}{'基线相对吞吐':>14}")
+    for r in results:
+        if r.get("error"):
+            print(f"{r['site']:<10} ❌ {r['error']}")
+            continue
+        if not r.get("pages"):
+            print(f"{r['site']:<10} (无语料)")
+            continue
+        base = baseline.get(r["site"], {}).get("relative_throughput", "-")
+        print(f"{r['site']:<10}{r['pages']:>6}{r['records']:>8}{r['pages_per_sec']:>10}"
+              f"{r['records_per_sec']:>12}{r['peak_rss_mb']:>13}{r['relative_throughput']:>10}{base:>14}")
+    if show_selectors:
+        for r in results:
+            if not r.get("selectors"):
+                continue
+            print(f"\n[{r['site']}] 选择器耗时 (单遍)")
+            for row in r["selectors"]:
+                print(f"  {row['seconds'] * 1000:>9.1f} ms {row['calls']:>7} 次  {row['selector']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="爬虫解析器基准测试")
+    parser.add_argument("--site", action="append", choices=SITES, help="只跑指定站点 (可重复)")
+    parser.add_argument("--data-dir", action="append", default=[], help="额外语料目录: site=路径")
+    parser.add_argument("--repeat", type=int, default=5, help="计时轮数")
+    parser.add_argument("--top", type=int, default=10, help="输出耗时最多的前 N 个选择器")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="允许的相对吞吐下降比例")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果覆盖基线")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    extra_dirs = {}
+    for item in args.data_dir:
+        site, _, path = item.partition("=")
+        extra_dirs.setdefault(site, []).append(path)
+
+    if args.worker:
+        print(json.dumps(run_site(args.worker, extra_dirs.get(args.worker, []), args.repeat, args.top),
+                         ensure_ascii=False))
+        return 0
+
+    results = [run_site_subprocess(site, extra_dirs.get(site, []), args.repeat, args.top)
+               for site in (args.site or SITES)]
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print_report(results, baseline, show_selectors=args.top > 0)
+
+    if args.update_baseline:
+        for r in results:
+            if r.get("pages") and r.get("fixtures_only"):
+                baseline[r["site"]] = {k: r[k] for k in ("pages", "records", "relative_throughput", "pages_per_sec",
+                                                         "records_per_sec", "calibration_per_sec", "peak_rss_mb")}
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 基线已更新: {BASELINE_FILE}")
+        return 0
+
+    failed = [r for r in results if r.get("error")]
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"❌ 回归: {line}")
+    if failed or regressions:
+        return 1
+    print("\n✅ 未发现解析回归")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+商品记录内存/耗时对比: dict vs ProductRecord (__slots__)
+模拟一个关键词批次在内存里攒 N 条记录 (eBay keyword_products / Goofish all_products 的情况)
+
+用法:
+    python resources/benchmarks/bench_product_record.py --count 100000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "spiders"))
+from record_schema import ProductRecord, normalize_records
+
+
+def make_values(i):
+    # 每条记录的字段值都是新字符串，和真实解析时一样
+    return {
+        "title": f"Nike Air Max 90 vintage {i}",
+        "price": f"${i % 997}.99",
+        "image": f"https://img.example.com/{i:08d}.jpg",
+        "link": f"https://www.example.com/products/{i:08d}",
+        "seller": f"seller{i % 5000}",
+    }
+
+
+def build_dicts(count):
+    items = []
+    for i in range(count):
+        product = {"index": i + 1}
+        for key, value in make_values(i).items():
+            product[key] = value
+        product["Platform"] = "depop"
+        items.append(product)
+    return items
+
+
+def build_records(count):
+    items = []
+    for i in range(count):
+        product = ProductRecord("depop", index=i + 1)
+        for key, value in make_values(i).items():
+            product[key] = value
+        product["Platform"] = "depop"
+        items.append(product)
+    return items
+
+
+def measure(builder, count):
+    tracemalloc.start()
+    started = time.perf_counter()
+    items = builder(count)
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # 字段值 (字符串 / index 整数) 和外层 list 两种方式一样大，单独算出容器本身的开销
+    shared = (sum(sys.getsizeof(v) for v in make_values(0).values()) + sys.getsizeof(count) + 8) * count
+    return items, {"seconds": elapsed, "total": current, "container": current - shared,
+                   "per_item": sys.getsizeof(items[0])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ProductRecord 基准测试")
+    parser.add_argument("--count", type=int, default=100000)
+    args = parser.parse_args()
+
+    dicts, dict_stats = measure(build_dicts, args.count)
+    del dicts
+    records, record_stats = measure(build_records, args.count)
+
+    mb = 1024 * 1024
+    print(f"记录数: {args.count}")
+    print(f"{'':<14}{'总内存(MB)':>12}{'容器开销(MB)':>14}{'单条容器(B)':>13}{'构建耗时(s)':>13}")
+    for name, stats in (("dict", dict_stats), ("ProductRecord", record_stats)):
+        print(f"{name:<14}{stats['total'] / mb:>12.1f}{stats['container'] / mb:>14.1f}"
+              f"{stats['per_item']:>13}{stats['seconds']:>13.3f}")
+    print(f"容器开销降低: {dict_stats['container'] / max(record_stats['container'], 1):.1f}x")
+
+    started = time.perf_counter()
+    normalize_records(records, platform="depop", keyword="nike")
+    print(f"规范化 {args.count} 条 ProductRecord: {time.perf_counter() - started:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+离线基准用的本地"假站点" (标准库 ThreadingHTTPServer，无需网络)
+- 商品 HTML 复用 make_parser_fixtures 的生成函数，结构与各爬虫 extract_products 依赖的选择器一致
+- 每个站点挂在一个路径前缀下，配合 CRAWLER_SITE_OVERRIDE 把真实域名的请求转到这里:
+    /depop/search/?q=        无限滚动: 首屏 scroll_batch 条，滚到底部时前端 fetch /search/_more 追加
+    /ebay/sch/i.html?_pgn=N  翻页: 每页 page_size 条，超出总数返回空列表页
+    /grailed/shop?query=     无限滚动 (UserItem_root 信息流)，追加接口 /shop/_more
+    /vips/                   首页 (已登录状态)
+    /vips/suggest.php        data-product-id 商品格子 + .c-page__item--next 翻页链接
+    /img/...                 1x1 图片 (商品图域名也可以指到这里)
+- 可配置: 响应延迟、每个关键词的商品总数、每页条数、每隔 N 个列表页插入一次验证页 (验证页过一会儿自动刷新)
+- /_stats 返回请求计数和首个商品发出的时间，/_reset 清零
+
+用法:
+    python resources/benchmarks/fixture_server.py --port 8765 --latency-ms 150 --items 240
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from make_parser_fixtures import PAGE_HEAD, PAGE_TAIL, SITES as FIXTURE_SITES, _nav
+
+# 1x1 透明 GIF
+PIXEL = (b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00"
+         b",\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;")
+
+# 真实域名 -> 本地路径前缀 (商品图片域名统一指到 /img)
+SITE_HOSTS = {
+    "depop": {"www.depop.com": "/depop", "media-photos.depop.com": "/img"},
+    "ebay": {"www.ebay.com": "/ebay", "i.ebayimg.com": "/img"},
+    "grailed": {"www.grailed.com": "/grailed", "media-assets.grailed.com": "/img"},
+    "vips": {"www.vip.com": "/vips", "category.vip.com": "/vips", "detail.vip.com": "/vips",
+             "h2.appsimg.com": "/img"},
+}
+
+# 无限滚动: 滚到接近底部时请求下一批，追加后如果仍在底部继续加载
+SCROLL_LOADER = """<div id="feed-sentinel"></div>
+<script>
+(function () {{
+  var offset = {offset}, done = {done}, loading = false;
+  var feed = document.getElementById('feed');
+  function check() {{
+    if (loading || done) return;
+    if (window.innerHeight + window.scrollY < document.body.scrollHeight - 300) return;
+    loading = true;
+    fetch('{more}?{param}=' + encodeURIComponent({keyword}) + '&offset=' + offset)
+      .then(function (r) {{ return Promise.all([r.text(), r.headers.get('X-Items')]); }})
+      .then(function (res) {{
+        var n = parseInt(res[1] || '0', 10);
+        if (n === 0) {{ done = true; }}
+        feed.insertAdjacentHTML('beforeend', res[0]);
+        offset += n; loading = false;
+        setTimeout(check, 50);
+      }})
+      .catch(function () {{ loading = false; }});
+  }}
+  window.addEventListener('scroll', check);
+}})();
+</script>
+"""
+
+CHALLENGE_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Security Challenge</title></head>
+<body><div class="captcha-box"><p>请完成验证 (challenge)</p><div class="captcha"></div></div>
+<script>setTimeout(function () {{ location.reload(); }}, {delay});</script></body></html>
+"""
+
+VIPS_HOME = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>唯品会</title></head>
+<body><header><div class="c-header-user"><span class="c-header-user__name">bench_user</span></div>
+<form action="https://category.vip.com/suggest.php"><input name="keyword"></form></header>
+<main><p>首页</p></main></body></html>
+"""
+
+
+class FixtureConfig:
+    def __init__(self, latency_ms=0, items=240, page_size=None, scroll_batch=None, challenge_every=0,
+                 challenge_ms=800):
+        self.latency_ms = latency_ms
+        self.items = items                  # 每个关键词的商品总数
+        self.page_size = page_size          # 翻页站点每页条数，None 时沿用夹具默认值
+        self.scroll_batch = scroll_batch    # 无限滚动每批条数，None 时沿用夹具默认值
+        self.challenge_every = challenge_every
+        self.challenge_ms = challenge_ms
+
+    def per_page(self, site):
+        default = FIXTURE_SITES[site][1]
+        if site in ("depop", "grailed"):
+            return self.scroll_batch or default
+        return self.page_size or default
+
+
+class FixtureState:
+    """生成的商品缓存 + 统计 (多线程共享)"""
+
+    def __init__(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self._items = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.requests = {}
+            self.items_served = {}
+            self.first_item_ts = {}
+            self.challenges = 0
+            self._listing_count = 0
+
+    def items(self, site, keyword, start, count):
+        end = min(start + count, self.config.items)
+        if start >= end:
+            return []
+        key = (site, keyword)
+        with self._lock:
+            cached = self._items.get(key)
+            if cached is None:
+                make_item = FIXTURE_SITES[site][0]
+                rng = random.Random(f"{site}-{keyword}")
+                cached = self._items[key] = [make_item(rng, i) for i in range(self.config.items)]
+        return cached[start:end]
+
+    def record(self, site, served):
+        with self._lock:
+            self.requests[site] = self.requests.get(site, 0) + 1
+            if served:
+                self.items_served[site] = self.items_served.get(site, 0) + served
+                self.first_item_ts.setdefault(site, time.time())
+
+    def should_challenge(self):
+        """每隔 challenge_every 个列表页插入一次验证页"""
+        every = self.config.challenge_every
+        if not every:
+            return False
+        with self._lock:
+            self._listing_count += 1
+            if self._listing_count % every == 0:
+                self.challenges += 1
+                return True
+        return False
+
+    def snapshot(self):
+        with self._lock:
+            return {"started": self.started, "requests": dict(self.requests), "items_served": dict(self.items_served),
+                    "first_item_ts": dict(self.first_item_ts), "challenges": self.challenges}
+
+
+def _page(site, body, title):
+    rng = random.Random(title)
+    nav = _nav(rng)
+    return PAGE_HEAD.format(title=title, nav=nav) + body + PAGE_TAIL.format(nav=nav)
+
+
+def _grid(site, items):
+    open_tag, close_tag = FIXTURE_SITES[site][2]
+    return open_tag.replace(">", ' id="feed">', 1) + "\n" + "\n".join(items) + "\n" + close_tag + "\n"
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    server_version = "FixtureServer/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _send(self, body, content_type="text/html; charset=utf-8", status=200, headers=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay(self):
+        if self.state.config.latency_ms:
+            time.sleep(self.state.config.latency_ms / 1000)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        path = parts.path
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        try:
+            if path.startswith("/img/"):
+                return self._send(PIXEL, "image/gif")
+            if path.endswith(".js"):
+                return self._send("", "application/javascript")
+            if path == "/_stats":
+                return self._send(json.dumps(self.state.snapshot()), "application/json")
+            if path == "/_reset":
+                self.state.reset()
+                return self._send("{}", "application/json")
+
+            site, _, rest = path.lstrip("/").partition("/")
+            handler = getattr(self, f"_site_{site}", None)
+            if handler is None:
+                return self._send("not found", "text/plain", status=404)
+            return handler("/" + rest, query)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    # ---------- 公共: 列表页 / 追加片段 ----------
+    def _listing(self, site, keyword, start, body_builder):
+        self._delay()
+        if self.state.should_challenge():
+            self.state.record(site, 0)
+            return self._send(CHALLENGE_PAGE.format(delay=self.state.config.challenge_ms))
+        items = self.state.items(site, keyword, start, self.state.config.per_page(site))
+        self.state.record(site, len(items))
+        return self._send(_page(site, body_builder(items), f"{keyword} - {site}"))
+
+    def _more(self, site, keyword, query):
+        self._delay()
+        offset = int(query.get("offset", 0))
+        items = self.state.items(site, keyword, offset, self.state.config.per_page(site))
+        self.state.record(site, len(items))
+        return self._send("\n".join(items), headers={"X-Items": str(len(items))})
+
+    def _scroll_body(self, site, keyword, param, more):
+        def build(items):
+            loader = SCROLL_LOADER.format(offset=len(items), done="true" if not items else "false",
+                                          more=more, param=param, keyword=json.dumps(keyword))
+            return _grid(site, items) + loader
+        return build
+
+    # ---------- 各站点 ----------
+    def _site_depop(self, path, query):
+        keyword = query.get("q", "")
+        if path.startswith("/search/_more"):
+            return self._more("depop", keyword, query)
+        if path.startswith("/search"):
+            return self._listing("depop", keyword, 0, self._scroll_body("depop", keyword, "q", "/search/_more"))
+        return self._send("not found", "text/plain", status=404)
+
+    def _site_grailed(self, path, query):
+        keyword = query.get("query", "")
+        if path.startswith("/shop/_more"):
+            return self._more("grailed", keyword, query)
+        if path.startswith("/shop"):
+            return self._listing("grailed", keyword, 0,
+                                 self._scroll_body("grailed", keyword, "query", "/shop/_more"))
+        return self._send("not found", "text/plain", status=404)
+
+    def _site_ebay(self, path, query):
+        if not path.startswith("/sch/"):
+            return self._send("not found", "text/plain", status=404)
+        keyword = query.get("_nkw", "")
+        page_num = max(1, int(query.get("_pgn", 1)))
+        start = (page_num - 1) * self.state.config.per_page("ebay")
+        return self._listing("ebay", keyword, start, lambda items: _grid("ebay", items))
+
+    def _site_vips(self, path, query):
+        if not path.startswith("/suggest.php"):
+            self._delay()
+            return self._send(VIPS_HOME)
+        keyword = query.get("keyword", "")
+        page_num = max(1, int(query.get("page", 1)))
+        per_page = self.state.config.per_page("vips")
+        start = (page_num - 1) * per_page
+
+        def build(items):
+            body = _grid("vips", items)
+            if start + per_page < self.state.config.items:
+                body += (f'<div class="c-page"><a class="c-page__item c-page__item--next" '
+                         f'href="/suggest.php?keyword={keyword}&page={page_num + 1}">下一页</a></div>\n')
+            return body
+        return self._listing("vips", keyword, start, build)
+
+
+def start_server(config, host="127.0.0.1", port=0):
+    """后台线程启动，返回 server (server.server_port 为实际端口)"""
+    server = ThreadingHTTPServer((host, port), FixtureHandler)
+    server.daemon_threads = True
+    server.state = FixtureState(config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def override_env(server, sites=None):
+    """生成 CRAWLER_SITE_OVERRIDE 的值"""
+    base = f"http://{server.server_address[0]}:{server.server_port}"
+    pairs = []
+    for site in sites or SITE_HOSTS:
+        pairs += [f"{host}={base}{prefix}" for host, prefix in SITE_HOSTS[site].items()]
+    return ",".join(pairs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准用的本地站点")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=int, default=0, help="列表页/追加接口的响应延迟")
+    parser.add_argument("--items", type=int, default=240, help="每个关键词的商品总数")
+    parser.add_argument("--page-size", type=int, help="翻页站点每页条数")
+    parser.add_argument("--scroll-batch", type=int, help="无限滚动每批条数")
+    parser.add_argument("--challenge-every", type=int, default=0, help="每隔 N 个列表页返回一次验证页 (0 关闭)")
+    args = parser.parse_args()
+
+    config = FixtureConfig(args.latency_ms, args.items, args.page_size, args.scroll_batch, args.challenge_every)
+    server = start_server(config, port=args.port)
+    print(f"🧪 本地站点已启动: http://127.0.0.1:{server.server_port}")
+    print(f"export CRAWLER_SITE_OVERRIDE=\"{override_env(server)}\"")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
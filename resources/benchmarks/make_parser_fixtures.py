@@ -0,0 +1,161 @@
+"""
+生成解析基准用的离线 HTML 夹具 (fixtures/<site>/<关键词>_page_<n>.html)
+- 结构按各爬虫 extract_products 依赖的选择器还原 (含导航、脚本、广告位等干扰节点)
+- 固定随机种子，重复生成内容一致；生成结果直接提交到仓库
+
+用法:
+    python resources/benchmarks/make_parser_fixtures.py
+"""
+import os
+import random
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+WORDS = ["vintage", "nike", "oversized", "denim", "wool", "leather", "cargo", "retro", "classic", "slim",
+         "cotton", "linen", "graphic", "washed", "cropped", "knit", "plaid", "suede", "canvas", "fleece"]
+CN_WORDS = ["工装裤", "衬衫裙", "帆布鞋", "托特包", "耳环", "羊毛", "纯棉", "新款", "复古", "宽松",
+            "加厚", "百搭", "简约", "韩版", "真皮", "轻薄", "透气", "防水", "修身", "休闲"]
+
+PAGE_HEAD = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<script>window.__STATE__ = {{"user": null, "flags": [1, 2, 3]}};</script>
+<style>.hidden{{display:none}}</style></head>
+<body><header><nav><ul>{nav}</ul></nav></header>
+<main><div class="filters"><button>Sort</button><button>Price</button><button>Size</button></div>
+"""
+PAGE_TAIL = """</main><footer><p>© example</p><ul>{nav}</ul></footer>
+<script src="/static/app.js"></script></body></html>
+"""
+
+
+def _nav(rng):
+    return "".join(f'<li><a href="/c/{w}">{w.title()}</a></li>' for w in rng.sample(WORDS, 8))
+
+
+def _title(rng, words=WORDS, n=4):
+    return " ".join(rng.choice(words) for _ in range(n))
+
+
+def depop_item(rng, i):
+    slug = f"{rng.choice(['alice', 'bobshop', 'thrift_co'])}-{'-'.join(rng.sample(WORDS, 3))}-{i:04d}"
+    price = f"${rng.randint(5, 300)}.{rng.choice(['00', '50', '99'])}"
+    label = rng.choice(["Price", "Discounted price", "Full price"])
+    return f"""<li class="styles_listItem__Uv9lb">
+  <div class="styles_productCardRoot__DaYPT">
+    <a class="styles_unstyledLink__DsttP" href="/products/{slug}/?ref=search">
+      <div class="styles_imageContainer__h4r7i"><img class="_mainImage_e5j9l_11" src="https://media-photos.depop.com/b1/{i:06d}/P0.jpg" alt=""></div>
+    </a>
+    <div class="styles_productAttributes__fP2Qs"><p aria-label="{label}" class="styles_price__H8qdh">{price}</p><p class="size">M</p></div>
+  </div>
+</li>"""
+
+
+def ebay_item(rng, i):
+    price = f"${rng.randint(5, 900)}.{rng.randint(0, 99):02d}"
+    if rng.random() < 0.1:
+        price = f"{price} to ${rng.randint(901, 2000)}.00"
+    return f"""<li class="s-item s-item__pl-on-bottom" data-view="mi:1686|iid:{i}">
+  <div class="s-item__wrapper clearfix">
+    <div class="s-item__image-section"><div class="s-item__image"><a href="https://www.ebay.com/itm/{300000000000 + i}?hash=item{i:x}&amp;amdata=enc">
+      <div class="s-item__image-wrapper"><img src="https://i.ebayimg.com/thumbs/images/g/{i:06d}/s-l225.webp" alt=""></div></a></div></div>
+    <div class="s-item__info clearfix">
+      <a class="s-item__link" href="https://www.ebay.com/itm/{300000000000 + i}?hash=item{i:x}&amp;amdata=enc">
+        <div class="s-item__title"><span role="heading">{_title(rng, n=6).title()}</span></div></a>
+      <div class="s-item__details clearfix"><div class="s-item__detail"><span class="s-item__price">{price}</span></div>
+      <div class="s-item__detail"><span class="s-item__shipping">+$12.00 shipping</span></div></div>
+    </div>
+  </div>
+</li>"""
+
+
+def grailed_item(rng, i):
+    return f"""<div class="UserItem_root__8Q2R_ UserItemForFeed_feedItem__5i2tc">
+  <a class="UserItem_link__kgEWg" href="/listings/{50000000 + i}-{'-'.join(rng.sample(WORDS, 3))}?feedPosition={i}">
+    <div class="UserItem_imageWrapper__2f"><img srcset="https://media-assets.grailed.com/prd/listing/{i}/a.jpg 1x, https://media-assets.grailed.com/prd/listing/{i}/b.jpg 2x" src="https://media-assets.grailed.com/prd/listing/{i}/a.jpg"></div>
+    <div class="UserItem_details__x"><p class="UserItem_designer__N8CxZ">{rng.choice(['Nike', 'Levis', 'Carhartt', 'Stussy'])}</p>
+    <p class="UserItem_size__QTA9F">{rng.choice(['S', 'M', 'L', '32'])}</p></div>
+    <p class="UserItem_title__riOTf">{_title(rng).title()}</p>
+    <div class="Price_root__x"><span class="Money_root__uOwWV" data-testid="Current">${rng.randint(20, 900)}</span></div>
+  </a>
+</div>"""
+
+
+def goofish_item(rng, i):
+    return f"""<a class="feeds-item-wrap--rGdH_KoF" href="//www.goofish.com/item?id={700000000000 + i}&amp;categoryId=50025969">
+  <div class="feeds-image--TDRC4fV1"><img class="feeds-image--TDRC4fV1" src="https://img.alicdn.com/bao/uploaded/i{i % 4}/O1CN01{i:06d}_xy_item.jpg_.webp"></div>
+  <img src="https://gw.alicdn.com/tfs/TB1-tps-2-2.png">
+  <div class="row1-wrap-title--qIlOySTh" title="{_title(rng, CN_WORDS, 5)}"><span class="main-title--sMrtWSJa">{_title(rng, CN_WORDS, 5)}</span></div>
+  <div class="row3-wrap-price--ffNdxq4u"><span class="sign--x5q">¥</span><span class="number--NKh1vXWM">{rng.randint(5, 999)}</span><span class="decimal--lSAcITCN">{rng.choice(['', '5', '9'])}</span></div>
+  <div class="row4-wrap-seller--bFOQRCbs"><img class="avatar--CXvfGbBf" src="//img.alicdn.com/avatar/{i}.jpg">
+    <div class="seller-text-wrap--J2P8Ug7e" title="{rng.choice(['浙江', '上海', '广东', '北京'])}"><p class="seller-text--Rr2Y3EbB">{rng.choice(['浙江', '上海'])}</p></div></div>
+</a>"""
+
+
+def vips_item(rng, i):
+    sale = rng.randint(30, 900)
+    market = sale * rng.randint(2, 4)
+    return f"""<div class="c-goods-item J-goods-item c-goods-item--auto-width" data-product-id="{6921691287833086801 + i}">
+  <a href="//detail.vip.com/detail-1710614161-{6921691287833086801 + i}.html" target="_blank">
+    <div class="c-goods-item__img"><img class="J-goods-item__img" src="//h2.appsimg.com/a.appsimg.com/upload/merchandise/{i}.jpg" alt="{_title(rng, CN_WORDS, 4)}"></div>
+    <div class="c-goods-item__main">
+      <div class="c-goods-item__sale-price J-goods-item__sale-price"><span>¥</span>{sale}</div>
+      <div class="c-goods-item__market-price J-goods-item__market-price"><span>¥</span>{market}</div>
+      <div class="c-goods-item__discount J-goods-item__discount">{round(sale / market * 10, 1)}折</div>
+      <div class="c-goods-item__brand">{rng.choice(['ONLY', 'VERO MODA', 'Nike', '李宁'])}</div>
+      <div class="c-goods-item__name c-goods-item__name--two-line">{_title(rng, CN_WORDS, 6)}</div>
+    </div>
+  </a>
+</div>"""
+
+
+def xiaomi_item(rng, i):
+    price = rng.randint(9, 3999)
+    return f"""<div class="pro-item" data-gid="{100000 + i}">
+  <a href="//www.xiaomiyoupin.com/detail?gid={100000 + i}">
+    <div class="pro-img"><img src="//img.youpin.mi-img.com/shopmain/{i:06d}.png" alt="{_title(rng, CN_WORDS, 4)}"></div>
+    <p class="pro-name">{_title(rng, CN_WORDS, 5)}</p>
+    <p class="pro-desc">{_title(rng, CN_WORDS, 3)}</p>
+    <p class="pro-price"><span class="m-num">¥</span><span>{price}</span><del class="old-price">¥{price + rng.randint(10, 300)}</del></p>
+    <span class="pro-tag">{rng.choice(['8折', '满减', '新品'])}</span>
+    <span class="pro-comment">{rng.randint(1, 9999)}条评价</span>
+  </a>
+</div>"""
+
+
+SITES = {
+    # site: (单条生成函数, 每页条数, 页面里包住列表的外层标签)
+    "depop": (depop_item, 48, ('<ul class="styles_productGrid__Cpzyf">', "</ul>")),
+    "ebay": (ebay_item, 60, ('<ul class="srp-results srp-list clearfix">', "</ul>")),
+    "grailed": (grailed_item, 40, ('<div class="FiltersInstantSearch_feed__x">', "</div>")),
+    "goofish": (goofish_item, 30, ('<div class="feeds-list-container--UkIMBPNk">', "</div>")),
+    "vips": (vips_item, 60, ('<section class="goods-list">', "</section>")),
+    "xiaomi": (xiaomi_item, 40, ('<div class="search-list">', "</div>")),
+}
+KEYWORDS = {"depop": "jacket", "ebay": "jacket", "grailed": "jacket",
+            "goofish": "工装裤", "vips": "耳罩", "xiaomi": "耳机"}
+PAGES = 2
+
+
+def build_page(site, page_num, rng):
+    make_item, per_page, (open_tag, close_tag) = SITES[site]
+    start = (page_num - 1) * per_page
+    items = "\n".join(make_item(rng, start + i) for i in range(per_page))
+    nav = _nav(rng)
+    return (PAGE_HEAD.format(title=f"{site} search", nav=nav) + open_tag + "\n" + items + "\n" + close_tag
+            + "\n" + PAGE_TAIL.format(nav=nav))
+
+
+def main():
+    for site in SITES:
+        rng = random.Random(f"{site}-fixtures")
+        site_dir = os.path.join(FIXTURES_DIR, site)
+        os.makedirs(site_dir, exist_ok=True)
+        for page_num in range(1, PAGES + 1):
+            path = os.path.join(site_dir, f"{KEYWORDS[site]}_page_{page_num}.html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(build_page(site, page_num, rng))
+            print(f"✓ {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+常驻爬虫节点 (agent)，替代每个任务一次 ssh exec python3 xxx_crawler.py 的冷启动
+- 进程常驻: Python / Playwright 只加载一次 (BaseCrawler.shared_playwright)
+- 预热 --warm 个浏览器放进池子，任务来了 MultiCrawlerManager 直接接管，用完还回池子
+- 只监听 127.0.0.1，后端通过 SSH 隧道 (direct-tcpip) 连接，不对外暴露端口
+- 提交任务需带上令牌: 启动时生成在 .crawler_agent_token (权限 0600)，同机其他用户无法读取，
+  后端用同一个 SSH 账号读取后随请求发送
+
+协议 (每个连接一个请求，按行):
+  → {"op": "ping"}                                   ← @@AGENT pong
+  → {"op": "submit", "token": "...", "site": "depop", "product_names": [...], "max_count": 100,
+     "output_dir": "...", "workers": 2, "autoscale": false, "base_port": 9222, "ttl_hours": null,
+     "delta": false, "probe": true}
+  ← @@AGENT accepted <job_id>   (或 @@AGENT reload: 代码已更新、agent 空闲重启，稍后重连；@@AGENT error <原因>)
+  ← 任务的 stdout 原文 (日志行 + @@EVENT 行，与一次性启动时相同，后端按原逻辑解析)
+  ← @@EXIT <退出码>
+  → 任务运行期间客户端发来任何数据 (如 Ctrl-C) 或断开连接 = 取消任务
+
+用法:
+    python3 crawler_agent.py --warm 2 --port 8765
+"""
+import argparse
+import asyncio
+import contextvars
+import importlib
+import io
+import hmac
+import json
+import os
+import secrets
+import sys
+import tempfile
+import time
+import uuid
+
+from playwright.async_api import async_playwright
+
+## ==================== 导入基类 ====================
+try:
+    from crawler_base import (BaseCrawler, MultiCrawlerManager, PortAllocator, browser_registry,
+                              kill_process_tree)
+except ImportError:
+    try:
+        from resources.spiders.crawler_base import (BaseCrawler, MultiCrawlerManager, PortAllocator,
+                                                    browser_registry, kill_process_tree)
+    except ImportError:
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+        from crawler_base import (BaseCrawler, MultiCrawlerManager, PortAllocator, browser_registry,
+                                  kill_process_tree)
+# =================================================
+
+AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
+HANDSHAKE_PREFIX = "@@AGENT "
+EXIT_PREFIX = "@@EXIT "
+TOKEN_FILE = os.path.join(AGENT_DIR, ".crawler_agent_token")
+
+# 支持常驻执行的站点: 基于 BaseCrawler / MultiCrawlerManager 的爬虫
+SITE_CLASSES = {
+    "depop": ("depop_crawler", "DepopCrawler"),
+    "ebay": ("ebay_crawler", "EbayCrawler"),
+    "grailed": ("grailed_crawler", "GrailedCrawler"),
+}
+
+
+# ==================== 按任务分发 stdout ====================
+_job_stream = contextvars.ContextVar("job_stream", default=None)
+
+
+class RoutedStdout(io.TextIOBase):
+    """
+    爬虫代码到处都是 print，这里按当前任务 (ContextVar，asyncio 任务创建时继承) 把输出写到对应连接
+    不属于任何任务的输出 (agent 自身日志) 写回原 stdout
+    """
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        stream = _job_stream.get()
+        if stream is None:
+            return self.fallback.write(text)
+        stream.write(text)
+        return len(text)
+
+    def flush(self):
+        if _job_stream.get() is None:
+            self.fallback.flush()
+
+
+class JobStream:
+    """把任务输出写进 socket；连接断开后静默丢弃"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.closed = False
+
+    def write(self, text):
+        if self.closed or self.writer.is_closing():
+            return
+        try:
+            self.writer.write(text.encode("utf-8", "replace"))
+        except Exception:
+            self.closed = True
+
+
+# ==================== 预热浏览器池 ====================
+class BrowserPool:
+    """
+    预热好的浏览器 (端口, Popen)，端口向 PortAllocator 租用
+    - take() 不等待: 池子空了 manager 就自己冷启动
+    - give() 归还: 进程还活着且池子没满就留着复用，否则结束进程、归还端口
+    """
+
+    def __init__(self, size, base_port):
+        self.size = size
+        self.idle = []
+        self.ports = PortAllocator(base_port)
+        self._filling = False
+
+    async def fill(self):
+        if self._filling:
+            return
+        self._filling = True
+        try:
+            while len(self.idle) < self.size:
+                port = self.ports.lease()
+                crawler = BaseCrawler(port=port)
+                try:
+                    await crawler.launch_browser()
+                except Exception as e:
+                    print(f"❌ 预热浏览器失败 (端口 {port}): {e}")
+                    self.ports.release(port)
+                    return
+                self.idle.append((port, crawler.browser_process))
+                print(f"🔥 浏览器已预热: 端口 {port} (池中 {len(self.idle)}/{self.size})")
+        finally:
+            self._filling = False
+
+    def take(self):
+        while self.idle:
+            port, proc = self.idle.pop()
+            if proc.poll() is None:
+                return port, proc
+            browser_registry.unregister(port, proc.pid)
+            self.ports.release(port)
+        return None
+
+    async def give(self, port, proc):
+        if proc is not None and proc.poll() is None:
+            if len(self.idle) < self.size:
+                self.idle.append((port, proc))
+                return
+            # 等待浏览器退出放到线程里，不阻塞其它任务共用的事件循环
+            await asyncio.to_thread(kill_process_tree, proc.pid, proc)
+        if proc is not None:
+            browser_registry.unregister(port, proc.pid)
+        self.ports.release(port)
+
+    def close(self):
+        for port, proc in self.idle:
+            if proc.poll() is None:
+                kill_process_tree(proc.pid, proc)
+            browser_registry.unregister(port, proc.pid)
+            self.ports.release(port)
+        self.idle = []
+
+
+# ==================== Agent ====================
+def load_token(path=TOKEN_FILE):
+    """读取提交令牌，不存在 (或为空) 时生成；文件权限固定为 0600"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            token = f.read().strip()
+        if token:
+            os.chmod(path, 0o600)
+            return token
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    token = secrets.token_hex(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+    return token
+
+
+def code_version():
+    """agent 所在目录下脚本的 (文件名, 修改时间, 大小)，后端同步了新代码后会变化"""
+    version = []
+    for name in sorted(os.listdir(AGENT_DIR)):
+        if name.endswith(".py"):
+            stat = os.stat(os.path.join(AGENT_DIR, name))
+            version.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+
+class CrawlerAgent:
+    def __init__(self, host="127.0.0.1", port=8765, warm=2, base_port=9222):
+        self.host = host
+        self.port = port
+        self.base_port = base_port
+        self.pool = BrowserPool(warm, base_port)
+        self.jobs = {}
+        self.version = code_version()
+        self.reload_pending = False
+        self.token = load_token()
+
+    async def serve(self):
+        BaseCrawler.shared_playwright = await async_playwright().start()
+        server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        print(f"🛰️  agent 已启动: {self.host}:{self.port} (PID {os.getpid()})，预热 {self.pool.size} 个浏览器")
+        async with server:
+            while True:
+                await self.pool.fill()
+                if self.reload_pending and not self.jobs:
+                    self.restart()
+                await asyncio.sleep(5)
+
+    def restart(self):
+        """代码已更新: 结束池中浏览器后原地 exec 重启 (PID 不变)"""
+        print("🔄 代码已更新，agent 重启...")
+        self.pool.close()
+        browser_registry.kill_owned()
+        sys.stdout.flush()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    async def handle_client(self, reader, writer):
+        try:
+            request = json.loads((await reader.readline()).decode("utf-8") or "{}")
+        except ValueError:
+            request = {}
+        op = request.get("op", "submit")
+        try:
+            if op == "ping":
+                writer.write(f"{HANDSHAKE_PREFIX}pong {len(self.jobs)} {len(self.pool.idle)}\n".encode())
+            elif op == "submit":
+                if hmac.compare_digest(str(request.get("token") or ""), self.token):
+                    await self.submit(request, reader, writer)
+                else:
+                    print("⛔ 拒绝未授权的提交")
+                    writer.write(f"{HANDSHAKE_PREFIX}error 未授权\n".encode())
+            else:
+                writer.write(f"{HANDSHAKE_PREFIX}error 未知操作 {op}\n".encode())
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def submit(self, request, reader, writer):
+        site = request.get("site")
+        if site not in SITE_CLASSES:
+            writer.write(f"{HANDSHAKE_PREFIX}error 不支持常驻执行的站点 {site}\n".encode())
+            return
+        if code_version() != self.version:
+            if not self.jobs:
+                writer.write(f"{HANDSHAKE_PREFIX}reload\n".encode())
+                await writer.drain()
+                writer.close()
+                self.restart()
+            # 还有任务在跑: 这次仍用旧代码执行，全部结束后再重启
+            self.reload_pending = True
+
+        job_id = uuid.uuid4().hex[:8]
+        writer.write(f"{HANDSHAKE_PREFIX}accepted {job_id}\n".encode())
+        stream = JobStream(writer)
+        token = _job_stream.set(stream)
+        try:
+            # create_task 会复制当前上下文，任务内 (含 manager 派生的 worker) 的 print 都写到这个连接
+            job = asyncio.create_task(self.run_job(job_id, request))
+        finally:
+            _job_stream.reset(token)
+        self.jobs[job_id] = job
+        watcher = asyncio.create_task(reader.read(1))
+        started = time.time()
+        print(f"📥 任务 {job_id}: {site} {len(request.get('product_names') or [])} 个关键词")
+
+        try:
+            await asyncio.wait({job, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not job.done():
+                print(f"🛑 任务 {job_id} 已取消 (客户端断开或发送中断)")
+                job.cancel()
+            try:
+                await job
+                status = 0
+            except asyncio.CancelledError:
+                status = 130
+            except Exception as e:
+                stream.write(f"❌ 任务异常: {e}\n")
+                status = 1
+        finally:
+            watcher.cancel()
+            self.jobs.pop(job_id, None)
+        print(f"📤 任务 {job_id} 结束 (退出码 {status}，耗时 {time.time() - started:.1f}s)")
+        stream.write(f"{EXIT_PREFIX}{status}\n")
+
+    async def run_job(self, job_id, request):
+        module_name, class_name = SITE_CLASSES[request["site"]]
+        module = importlib.import_module(module_name)
+        crawler_class = getattr(module, class_name)
+        max_count = int(request.get("max_count") or 100)
+        output_dir = request["output_dir"]
+
+        # 复用各爬虫的 get_tasks_from_file (按已保存文件计算断点)
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+            json.dump(request.get("product_names") or [], f, ensure_ascii=False)
+            task_file = f.name
+        try:
+            all_tasks = module.get_tasks_from_file(task_file, max_count, output_dir, request.get("ttl_hours"))
+        finally:
+            os.remove(task_file)
+
+        print(f"🚀 agent 任务 {job_id} (PID: {os.getpid()}): {request['site']}")
+        print(f"   - Workers: {request.get('workers', 2)}" + (" (自动扩缩容)" if request.get("autoscale") else ""))
+        print(f"   - Target: {max_count}")
+        print(f"   - Output: {output_dir}")
+        print("=" * 60)
+        if not all_tasks:
+            print("🎉 无待处理任务或任务文件为空")
+            return
+        print(f"📦 任务总数: {len(all_tasks)}")
+
+        manager = MultiCrawlerManager(
+            crawler_class=crawler_class,
+            base_port=int(request.get("base_port") or self.base_port),
+            workers=int(request.get("workers") or 2),
+            autoscale=bool(request.get("autoscale")),
+            min_workers=int(request.get("min_workers") or 1),
+            browser_pool=self.pool,
+            delta=bool(request.get("delta")),
+            probe=request.get("probe", True),
+        )
+        await manager.run(all_tasks, max_count, output_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="常驻爬虫节点")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="监听地址 (只应监听本机)")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("CRAWLER_AGENT_PORT", 8765)), help="监听端口")
+    parser.add_argument("--warm", type=int, default=2, help="预热浏览器数量")
+    parser.add_argument("--base_port", type=int, default=9222, help="调试端口起点")
+    args = parser.parse_args()
+
+    sys.stdout = RoutedStdout(sys.stdout)
+    agent = CrawlerAgent(args.host, args.port, args.warm, args.base_port)
+    try:
+        asyncio.run(agent.serve())
+    except KeyboardInterrupt:
+        print("\n🛑 agent 停止")
+    finally:
+        agent.pool.close()
@@ -1,14 +1,844 @@
 import asyncio
+import atexit
+import bisect
+import heapq
+import json
 import os
 import subprocess
 import platform
+import re
 import shutil
+import signal
+import socket
+import tempfile
+import threading
 import time
+import weakref
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 没有 fcntl，限速状态只在进程内共享
+    fcntl = None
 
 from playwright.async_api import async_playwright
 
 
+# ==================== 结构化事件 (供后端解析进度) ====================
+# 后端 job_registry 识别以此前缀开头的行，解析后不再展示到前端日志
+EVENT_PREFIX = "@@EVENT "
+
+
+def emit_event(event, **fields):
+    """向 stdout 输出一条结构化事件 (单行 JSON)"""
+    payload = {"event": event, "ts": round(time.time(), 3)}
+    payload.update(fields)
+    print(EVENT_PREFIX + json.dumps(payload, ensure_ascii=False), flush=True)
+
+
+# ==================== 阶段计时 (navigate / scroll / content / extract / save) ====================
+# 直方图桶上界 (秒)，与后端 job_registry.PHASE_BUCKETS 保持一致
+PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class PhaseStats:
+    """单个阶段的耗时直方图"""
+    __slots__ = ("count", "total", "max", "items", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.items = 0
+        self.buckets = [0] * (len(PHASE_BUCKETS) + 1)
+
+    def observe(self, seconds, items=0):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.items += items
+        self.buckets[bisect.bisect_left(PHASE_BUCKETS, seconds)] += 1
+
+    def quantile(self, q):
+        """按桶估算分位数 (返回所在桶的上界，落在最后一个桶时返回 max)"""
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return PHASE_BUCKETS[i] if i < len(PHASE_BUCKETS) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total": round(self.total, 3),
+            "avg": round(self.total / self.count, 3) if self.count else 0,
+            "max": round(self.max, 3),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "items": self.items,
+            "buckets": self.buckets,
+        }
+
+
+class PhaseSpan:
+    """
+    用法:
+        with self.span("extract", keyword=kw) as span:
+            data = self.extract_products(html)
+            span.items = len(data)
+    """
+
+    def __init__(self, timings, phase, fields):
+        self.timings = timings
+        self.phase = phase
+        self.fields = fields
+        self.items = None
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.timings.record(self.phase, time.perf_counter() - self.started, items=self.items,
+                            ok=exc_type is None, **self.fields)
+        return False
+
+
+class CrawlTimings:
+    """每个阶段输出一条 phase 事件，同时在本地累计直方图，结束时输出 phase_summary"""
+
+    def __init__(self, **context):
+        self.context = context
+        self.phases = {}
+
+    def span(self, phase, keyword=None, **fields):
+        return PhaseSpan(self, phase, dict(fields, keyword=keyword))
+
+    def record(self, phase, seconds, items=None, ok=True, **fields):
+        self.phases.setdefault(phase, PhaseStats()).observe(seconds, items or 0)
+        emit_event("phase", phase=phase, duration_ms=round(seconds * 1000, 1), items=items, ok=ok,
+                   **self.context, **fields)
+
+    def summary(self):
+        return {phase: stats.to_dict() for phase, stats in self.phases.items()}
+
+    def report_summary(self):
+        if not self.phases:
+            return
+        summary = self.summary()
+        emit_event("phase_summary", phases=summary, **self.context)
+        print("⏱️  阶段耗时汇总:")
+        for phase, s in sorted(summary.items(), key=lambda kv: kv[1]["total"], reverse=True):
+            print(f"   {phase:<10} {s['count']:>5} 次  共 {s['total']:>8.1f}s  平均 {s['avg']:>6.2f}s  "
+                  f"p95≤{s['p95']}s  最大 {s['max']:.2f}s")
+
+
+# ==================== 请求限速 (按站点的令牌桶，节点内所有 worker / 进程共享) ====================
+# 站点: (每秒请求数上限, 桶容量)；导航和翻页前各取一个令牌
+SITE_RATE_LIMITS = {
+    "depop": (1.0, 3),
+    "ebay": (2.0, 4),
+    "grailed": (1.0, 3),
+    "goofish": (0.2, 1),
+    "vips": (0.3, 2),
+    "xiaomi": (0.5, 2),
+}
+# 例: CRAWLER_RATE_LIMITS="vips=0.2,ebay=3"；设为 off 关闭限速
+RATE_LIMIT_ENV = "CRAWLER_RATE_LIMITS"
+# 共享状态文件 (同一节点上的多个爬虫进程通过文件锁协调)
+RATE_STATE_ENV = "CRAWLER_RATE_STATE"
+
+
+@contextmanager
+def locked_json(path, lock, local):
+    """
+    进程内 lock + 跨进程文件锁下读取 JSON 状态，退出 with 时写回
+    没有 fcntl (Windows) 时退化为只在进程内共享的 local 字典
+    """
+    with lock:
+        if fcntl is None:
+            yield local
+            return
+        with open(path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}
+                yield state
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class SiteRateLimiter:
+    """
+    令牌桶 + 自适应速率:
+    - 令牌允许透支，透支越多等待越久，并发的 worker 按先来后到排队
+    - 触发验证 (penalize) 后速率减半，最低降到上限的 10%
+    - 连续 RECOVER_INTERVAL 秒没有验证，每个周期回升上限的 10%
+    - 速率 <= 0 (如 CRAWLER_RATE_LIMITS="ebay=0") 视为该站点不限速
+    """
+    BACKOFF = 0.5
+    MIN_FACTOR = 0.1
+    RECOVER_STEP = 0.1
+    RECOVER_INTERVAL = 60
+
+    def __init__(self, limits=None, state_file=None):
+        self.limits = dict(SITE_RATE_LIMITS if limits is None else limits)
+        self.enabled = True
+        raw = os.environ.get(RATE_LIMIT_ENV, "").strip()
+        if raw.lower() in ("off", "0", "false"):
+            self.enabled = False
+        else:
+            for item in raw.split(","):
+                site, _, rate = item.strip().partition("=")
+                try:
+                    burst = self.limits.get(site, (0, 2))[1]
+                    self.limits[site] = (float(rate), burst)
+                except ValueError:
+                    continue
+        # 不在 limits 里的站点不限速；速率 <= 0 没有意义 (reserve 会除以 0)，同样按不限速处理
+        self.limits = {site: (rate, burst) for site, (rate, burst) in self.limits.items() if rate > 0}
+        self.state_file = state_file or os.environ.get(RATE_STATE_ENV) or os.path.join(
+            tempfile.gettempdir(), "crawler_rate_limits.json")
+        self._lock = threading.Lock()
+        self._local = {}
+
+    def _state(self):
+        """加锁读取共享状态，退出时写回"""
+        return locked_json(self.state_file, self._lock, self._local)
+
+    def _bucket(self, state, site, now):
+        rate_max, burst = self.limits[site]
+        bucket = state.get(site)
+        if bucket is None:
+            bucket = state[site] = {"tokens": burst, "ts": now, "rate": rate_max, "penalized": 0, "raised": now}
+        # 共享状态文件里的速率可能来自旧配置或被手工改坏，非正数时从上限重新开始
+        bucket["rate"] = min(bucket["rate"], rate_max) if bucket.get("rate", 0) > 0 else rate_max
+        if bucket["rate"] < rate_max and now - max(bucket["penalized"], bucket["raised"]) >= self.RECOVER_INTERVAL:
+            bucket["rate"] = min(rate_max, bucket["rate"] + rate_max * self.RECOVER_STEP)
+            bucket["raised"] = now
+        bucket["tokens"] = min(burst, bucket["tokens"] + (now - bucket["ts"]) * bucket["rate"])
+        bucket["ts"] = now
+        return bucket
+
+    def reserve(self, site):
+        """预定一个令牌，返回需要等待的秒数"""
+        if not self.enabled or site not in self.limits:
+            return 0.0
+        with self._state() as state:
+            bucket = self._bucket(state, site, time.time())
+            bucket["tokens"] -= 1
+            return 0.0 if bucket["tokens"] >= 0 else -bucket["tokens"] / bucket["rate"]
+
+    async def acquire(self, site):
+        wait = self.reserve(site)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def penalize(self, site):
+        """遇到验证页时调用：降低该站点的速率"""
+        if not self.enabled or site not in self.limits:
+            return
+        with self._state() as state:
+            now = time.time()
+            bucket = self._bucket(state, site, now)
+            old_rate = bucket["rate"]
+            bucket["rate"] = max(self.limits[site][0] * self.MIN_FACTOR, old_rate * self.BACKOFF)
+            bucket["penalized"] = now
+            new_rate = bucket["rate"]
+        print(f"🐢 [{site}] 检测到验证，限速 {old_rate:.2f} -> {new_rate:.2f} 次/秒")
+        emit_event("rate_limit", site=site, rate=round(new_rate, 3), reason="challenge")
+
+    def current_rate(self, site):
+        if not self.enabled or site not in self.limits:
+            return None
+        with self._state() as state:
+            return self._bucket(state, site, time.time())["rate"]
+
+
+rate_limiter = SiteRateLimiter()
+
+
+# ==================== 站点重定向 (离线基准测试用) ====================
+# 例: CRAWLER_SITE_OVERRIDE="www.depop.com=http://127.0.0.1:8765/depop,www.ebay.com=http://127.0.0.1:8765/ebay"
+# 设置后浏览器里对这些域名的请求改由本地服务返回，页面 URL 保持不变 (爬虫代码无需改动)
+SITE_OVERRIDE_ENV = "CRAWLER_SITE_OVERRIDE"
+
+
+def site_overrides():
+    overrides = {}
+    for item in os.environ.get(SITE_OVERRIDE_ENV, "").split(","):
+        host, _, target = item.strip().partition("=")
+        if host and target:
+            overrides[host] = target.rstrip("/")
+    return overrides
+
+
+async def install_site_overrides(context):
+    """按 CRAWLER_SITE_OVERRIDE 给浏览器上下文挂路由；未设置时什么都不做"""
+    for host, target in site_overrides().items():
+        async def handler(route, host=host, target=target):
+            url = route.request.url
+            path = url.split(host, 1)[1] if host in url else "/"
+            try:
+                response = await route.fetch(url=target + path)
+                await route.fulfill(response=response)
+            except Exception:
+                await route.abort()
+
+        await context.route(f"*://{host}/**", handler)
+        print(f"🔀 {host} -> {target}")
+
+
+# ==================== 浏览器进程登记 (只清理本任务启动的浏览器) ====================
+# 登记目录: 每个调试端口一个 {port}.json；同一节点上的多个任务共用
+BROWSER_REGISTRY_ENV = "CRAWLER_BROWSER_REGISTRY"
+
+
+def pid_alive(pid):
+    if not pid:
+        return False
+    if platform.system() == "Windows":
+        result = subprocess.run(f'tasklist /FI "PID eq {pid}" /NH', shell=True, capture_output=True, text=True)
+        return str(pid) in result.stdout
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def kill_process_tree(pid, proc=None, timeout=5):
+    """
+    结束浏览器及其子进程:
+    - Linux 上浏览器以独立会话启动，pid 即进程组 ID，先 SIGTERM 整组，超时再 SIGKILL
+    - Windows 用 taskkill /T 结束整棵进程树
+    proc 为本进程启动的 Popen 时顺带回收，避免僵尸进程让整组看起来还活着
+    """
+    if platform.system() == "Windows":
+        subprocess.run(f"taskkill /F /T /PID {pid}", shell=True, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        return
+    try:
+        os.killpg(pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        return
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc is not None:
+            proc.poll()
+        try:
+            os.killpg(pid, 0)
+        except ProcessLookupError:
+            return
+        time.sleep(0.2)
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    if proc is not None:
+        try:
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            pass
+
+
+class BrowserRegistry:
+    """
+    记录本节点上各调试端口的浏览器: {pid, owner (爬虫进程 PID), started}
+    - 任务启动时只清理 owner 已经不在的记录 (之前的任务异常退出留下的浏览器)
+    - 本进程退出 (含 SIGTERM / SIGHUP) 时清理自己登记的浏览器，不碰同机其它任务
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.environ.get(BROWSER_REGISTRY_ENV) or os.path.join(
+            tempfile.gettempdir(), "crawler_browsers")
+        self.owned = {}  # port -> Popen
+        self._lock = threading.Lock()
+
+    def _path(self, port):
+        return os.path.join(self.root, f"{port}.json")
+
+    def register(self, port, proc):
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            self.owned[port] = proc
+        with open(self._path(port), "w", encoding="utf-8") as f:
+            json.dump({"pid": proc.pid, "owner": os.getpid(), "started": round(time.time(), 3)}, f)
+        if platform.system() != "Windows":
+            # 浏览器在独立会话里 (pid 即进程组 ID)，后端取消任务时据此一并结束
+            emit_event("browser_started", port=port, pgid=proc.pid)
+
+    def unregister(self, port, pid):
+        with self._lock:
+            proc = self.owned.get(port)
+            if proc is not None and proc.pid == pid:
+                del self.owned[port]
+                if platform.system() != "Windows":
+                    emit_event("browser_stopped", port=port, pgid=pid)
+        record = self.read(port)
+        if record and record.get("pid") == pid:
+            try:
+                os.remove(self._path(port))
+            except OSError:
+                pass
+
+    def read(self, port):
+        try:
+            with open(self._path(port), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def records(self):
+        if not os.path.isdir(self.root):
+            return []
+        result = []
+        for name in os.listdir(self.root):
+            port, ext = os.path.splitext(name)
+            if ext == ".json" and port.isdigit():
+                record = self.read(int(port))
+                if record:
+                    result.append((int(port), record))
+        return result
+
+    def reap_orphans(self):
+        """清理 owner 已退出的浏览器，返回清理数量"""
+        reaped = 0
+        for port, record in self.records():
+            if pid_alive(record.get("owner")):
+                continue
+            if pid_alive(record.get("pid")):
+                print(f"☠️  清理残留浏览器 (端口 {port}, PID {record['pid']}, 原任务进程 {record.get('owner')} 已退出)")
+                kill_process_tree(record["pid"])
+                reaped += 1
+            self.unregister(port, record.get("pid"))
+        return reaped
+
+    def kill_owned(self):
+        with self._lock:
+            owned = list(self.owned.items())
+        for port, proc in owned:
+            if proc.poll() is None:
+                kill_process_tree(proc.pid, proc)
+            self.unregister(port, proc.pid)
+
+
+browser_registry = BrowserRegistry()
+atexit.register(browser_registry.kill_owned)
+
+
+def _exit_on_signal(signum, frame):
+    # 转成 SystemExit，让 finally / atexit 有机会清理浏览器
+    raise SystemExit(128 + signum)
+
+
+def install_exit_handlers():
+    """SIGTERM (取消任务) / SIGHUP (SSH 断开) 时正常退出；只能在主线程调用"""
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for name in ("SIGTERM", "SIGHUP"):
+        sig = getattr(signal, name, None)
+        if sig is not None:
+            signal.signal(sig, _exit_on_signal)
+
+
+# ==================== 调试端口租约 (同机多任务不再手工错开 base_port) ====================
+# 租约文件: {port: {owner, ts}}，文件锁保护；浏览器用户目录按端口命名，端口唯一则目录也唯一
+PORT_LEASE_ENV = "CRAWLER_PORT_LEASES"
+
+
+def port_free(port, host="127.0.0.1"):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind((host, port))
+        except OSError:
+            return False
+    return True
+
+
+class PortAllocator:
+    """
+    从 base_port 起向上找端口: 没有有效租约 (或租约进程已退出) 且当前能 bind 的才分配
+    - lease() 分配并登记，release() 归还；进程退出时由模块级的 atexit 钩子归还所有存活分配器的剩余租约
+    """
+
+    def __init__(self, base_port=9222, limit=500, state_file=None):
+        self.base_port = base_port
+        self.limit = limit
+        self.state_file = state_file or os.environ.get(PORT_LEASE_ENV) or os.path.join(
+            tempfile.gettempdir(), "crawler_port_leases.json")
+        self.leased = set()
+        self._lock = threading.Lock()
+        self._local = {}
+        _allocators.add(self)
+
+    def lease(self):
+        owner = os.getpid()
+        with locked_json(self.state_file, self._lock, self._local) as leases:
+            for port in range(self.base_port, self.base_port + self.limit):
+                record = leases.get(str(port))
+                # 同一进程里可能有多个分配器 (如 agent 的浏览器池和各任务的 manager)，本进程的租约同样跳过
+                if record and pid_alive(record.get("owner")):
+                    continue
+                if not port_free(port):
+                    continue
+                leases[str(port)] = {"owner": owner, "ts": round(time.time(), 3)}
+                self.leased.add(port)
+                return port
+        raise RuntimeError(f"{self.base_port}-{self.base_port + self.limit - 1} 范围内没有空闲的调试端口")
+
+    def release(self, port):
+        if port not in self.leased:
+            return
+        self.leased.discard(port)
+        with locked_json(self.state_file, self._lock, self._local) as leases:
+            record = leases.get(str(port))
+            if record and record.get("owner") == os.getpid():
+                del leases[str(port)]
+
+    def release_all(self):
+        for port in list(self.leased):
+            self.release(port)
+
+
+# 本进程里存活的分配器 (agent 每个任务新建一个)；弱引用，任务结束后分配器照常被回收，不会随任务数累积
+_allocators = weakref.WeakSet()
+
+
+def _release_all_ports():
+    for allocator in list(_allocators):
+        allocator.release_all()
+
+
+atexit.register(_release_all_ports)
+
+
+# ==================== 浏览器回收 (长时间运行时控制内存) ====================
+# 同一页面处理的关键词数或 JS 堆 (MB) 达到阈值: 换一个新页面
+# 浏览器进程树 RSS (MB) 超过阈值: 同端口重启浏览器，cookies 先取出再写回；设为 0 关闭对应检查
+RECYCLE_KEYWORDS = int(os.environ.get("CRAWLER_RECYCLE_KEYWORDS", 50))
+RECYCLE_HEAP_MB = float(os.environ.get("CRAWLER_RECYCLE_HEAP_MB", 512))
+RECYCLE_RSS_MB = float(os.environ.get("CRAWLER_RECYCLE_RSS_MB", 2048))
+
+
+def process_group_rss(pgid):
+    """Linux: 进程组内所有进程 (浏览器主进程 + 渲染/GPU 子进程) 的 RSS 之和 (MB)，取不到返回 None"""
+    if not pgid or not os.path.isdir("/proc"):
+        return None
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                stat = f.read()
+            # 进程名里可能有空格，从最后一个 ')' 之后切分: [state, ppid, pgrp, ..., rss (第 22 项)]
+            fields = stat.rsplit(")", 1)[1].split()
+            if int(fields[2]) != pgid:
+                continue
+            total += int(fields[21]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / 1024 / 1024
+
+
+# ==================== 关键词新鲜度 (按站点 TTL 决定是否重爬) ====================
+# 站点: 成功爬完后多少小时内不再重爬；二手站上新快，商城类更新慢
+SITE_TTL_HOURS = {
+    "depop": 24,
+    "ebay": 24,
+    "grailed": 24,
+    "goofish": 72,
+    "vips": 72,
+    "xiaomi": 168,
+}
+# 例: CRAWLER_TTL_HOURS="vips=48,ebay=12"，或单个数字作用于所有站点；<= 0 表示爬完后不再重爬
+TTL_ENV = "CRAWLER_TTL_HOURS"
+
+
+def site_ttl(site, ttl_hours=None):
+    """重爬间隔 (秒)，None 表示永不过期；优先级: 参数 > 环境变量 > SITE_TTL_HOURS"""
+    if ttl_hours is None:
+        ttl_hours = SITE_TTL_HOURS.get(site, 24)
+        for item in os.environ.get(TTL_ENV, "").split(","):
+            name, sep, value = item.strip().rpartition("=")
+            if sep and name != site:
+                continue
+            try:
+                ttl_hours = float(value)
+            except ValueError:
+                pass
+    return ttl_hours * 3600 if ttl_hours > 0 else None
+
+
+class CrawlLedger:
+    """
+    输出目录下的 crawl_ledger.json: {关键词: {"last_success": 时间戳, "items": 条数}}
+    由 MultiCrawlerManager / 单进程爬虫在关键词成功爬完后记账，任务规划时据此跳过新鲜的关键词；
+    没爬完的 (出错 / 中途放弃) 只记 last_attempt，账本里有条目就不再拿数据文件的修改时间当成功时间
+    """
+    FILE_NAME = "crawl_ledger.json"
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, self.FILE_NAME)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _state(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if fcntl is not None:
+            with locked_json(self.path, self._lock, {}) as state:
+                yield state
+            return
+        # Windows (桌面端爬虫单进程运行): 进程内锁 + 原子替换
+        with self._lock:
+            state = self._read()
+            yield state
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def snapshot(self):
+        with self._state() as state:
+            return dict(state)
+
+    def mark_success(self, keyword, items=0, seconds=None):
+        entry = {"last_success": round(time.time(), 1), "items": items}
+        if seconds is not None:
+            # 实测耗时，调度时据此校准耗时模型 (fit_cost)
+            entry["seconds"] = round(seconds, 1)
+        with self._state() as state:
+            state[keyword] = entry
+
+    def mark_attempt(self, keyword):
+        """没爬完: 去掉成功时间 (新写的数据文件已经取代了上次完整的)，下次照常重爬；保留条数 / 耗时供调度参考"""
+        with self._state() as state:
+            entry = dict(state.get(keyword) or {})
+            entry.pop("last_success", None)
+            entry["last_attempt"] = round(time.time(), 1)
+            state[keyword] = entry
+
+
+def fresh_keywords(crawled_at, ledger, ttl, now=None):
+    """
+    crawled_at: {关键词: 最新数据文件的修改时间}，账本里没有条目的 (记账之前的旧数据) 以此作为上次成功时间
+    返回 TTL 内爬过的关键词集合
+    """
+    now = now or time.time()
+    done = ledger.snapshot()
+    fresh = set()
+    for name, mtime in crawled_at.items():
+        last = done[name].get("last_success") if name in done else mtime
+        if last is not None and (ttl is None or now - last < ttl):
+            fresh.add(name)
+    return fresh
+
+
+def plan_tasks(progress, max_count, ledger, ttl, latest=None, now=None):
+    """
+    按新鲜度生成 [(关键词, 起始进度)]:
+    - TTL 内成功爬完过: 跳过
+    - 成功过但已过期: 从 0 重爬 (保存时新文件取代旧文件)
+    - 从没成功过: 从已有进度续爬；已达 max_count 的旧数据 (账本之前爬的) 视为在文件修改时间成功过
+    progress: {关键词: 已有进度}；latest: {关键词: 最新数据文件的修改时间}
+    """
+    now = now or time.time()
+    done = ledger.snapshot()
+    latest = latest or {}
+    tasks = []
+    counts = {"fresh": 0, "stale": 0, "resume": 0, "new": 0}
+    for name, current in progress.items():
+        last = (done.get(name) or {}).get("last_success")
+        if last is None and current >= max_count:
+            last = latest.get(name, now)
+        if last is not None and (ttl is None or now - last < ttl):
+            counts["fresh"] += 1
+        elif last is not None:
+            counts["stale"] += 1
+            print(f"  ♻️ 过期重爬: {name} (上次成功于 {(now - last) / 3600:.1f} 小时前)")
+            tasks.append((name, 0))
+        elif current > 0:
+            counts["resume"] += 1
+            print(f"  🔄 恢复任务: {name} (从 {current} 开始)")
+            tasks.append((name, current))
+        else:
+            counts["new"] += 1
+            tasks.append((name, 0))
+    ttl_text = "不过期" if ttl is None else f"TTL {ttl / 3600:g}h"
+    print(f"🗓️  新鲜度 ({ttl_text}): 跳过 {counts['fresh']}，过期重爬 {counts['stale']}，"
+          f"续爬 {counts['resume']}，新关键词 {counts['new']}")
+    # 按名称排序，保证每次运行顺序一致
+    return sorted(tasks, key=lambda x: x[0])
+
+
+# ==================== 增量爬取 (按最新排序的结果翻到已知商品就停) ====================
+# 一页 / 一批滚动结果里已知商品的占比达到该值，认为后面都是上次爬过的
+DELTA_SEEN_RATIO = 0.8
+DATA_FILE_PATTERN = re.compile(r'^(.+?)_products_(\d{8}_\d{6})\.json$')
+
+
+def listing_key(record):
+    """商品的唯一标识: 有 product_id 用 product_id，否则用去掉跟踪参数的链接 (闲鱼保留 ?id=)"""
+    product_id = record.get("product_id") or (record.get("extra") or {}).get("product_id")
+    if product_id:
+        return f"id:{product_id}"
+    link = record.get("link")
+    if not link:
+        return None
+    parts = urlsplit(link)
+    item_id = parse_qs(parts.query).get("id")
+    path = parts.path.rstrip("/")
+    return f"{parts.netloc}{path}?id={item_id[0]}" if item_id else f"{parts.netloc}{path}"
+
+
+def latest_records(output_dir, file_prefix):
+    """该关键词最新一份 *_products_*.json 的记录 (没有返回 [])"""
+    try:
+        names = os.listdir(output_dir)
+    except OSError:
+        return []
+    matches = [m for m in map(DATA_FILE_PATTERN.match, names) if m and m.group(1) == file_prefix]
+    if not matches:
+        return []
+    latest = max(matches, key=lambda m: m.group(2)).group(0)
+    try:
+        with open(os.path.join(output_dir, latest), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return data if isinstance(data, list) else []
+
+
+class DeltaCutoff:
+    """
+    增量模式: 关键词已有数据时，逐页 / 逐批滚动检查新结果中已知商品的占比，
+    达到 DELTA_SEEN_RATIO 就不再往后翻，重复爬取的耗时只和新上架商品数成正比
+    - check(records): 一页 / 一批结果 (记录或 {"link": ...})，占比达标返回 True
+    - merge(records, limit): 本次结果在前 (最新)，旧数据中没有重新抓到的接在后面，截到 limit 条并重新编号
+    """
+
+    def __init__(self, old_records, ratio=DELTA_SEEN_RATIO):
+        self.old = old_records
+        self.known = {listing_key(r) for r in old_records} - {None}
+        self.ratio = ratio
+        self.reached = False
+
+    @classmethod
+    def for_keyword(cls, output_dir, file_prefix):
+        """关键词没有旧数据时返回 None (照常全量爬)"""
+        old = latest_records(output_dir, file_prefix)
+        return cls(old) if old else None
+
+    def seen_ratio(self, records):
+        keys = [k for k in map(listing_key, records) if k]
+        return sum(k in self.known for k in keys) / len(keys) if keys else 0.0
+
+    def check(self, records):
+        if records and self.seen_ratio(records) >= self.ratio:
+            self.reached = True
+        return self.reached
+
+    def fresh(self, records):
+        return [r for r in records if listing_key(r) not in self.known]
+
+    def merge(self, records, limit=None):
+        """limit 默认取本次和上次条数的较大者 (按页数爬的站点)；index 从 1 重新编号，续传按最后一条的 index 判断进度"""
+        refetched = {listing_key(r) for r in records}
+        merged = list(records) + [r for r in self.old if listing_key(r) not in refetched]
+        merged = merged[:limit or max(len(records), len(self.old))]
+        for i, record in enumerate(merged, 1):
+            if isinstance(record, dict):
+                record["index"] = i
+            else:
+                record.index = i
+        return merged
+
+
+# ==================== 产出预估与 LPT 调度 ====================
+# 没有实测耗时时的模型 (秒): 每个关键词的固定开销 (导航 / 提取 / 保存) + 每条商品的耗时
+KEYWORD_OVERHEAD = 15
+SECONDS_PER_ITEM = {"depop": 0.4, "ebay": 0.15, "grailed": 0.4}
+# 每个 worker 启动浏览器的开销 (秒)，作为各 worker 的起点
+WORKER_STARTUP = 10
+# 首页探测同时打开的标签页数
+PROBE_TABS = 4
+# 首页探测预算: 最多探测的关键词数和总用时 (秒)；超出的按 max_count 估计，探测不拖慢 worker 启动
+PROBE_MAX_KEYWORDS = 40
+PROBE_BUDGET = 60
+
+
+def fit_cost(entries, site=None):
+    """
+    由账本里带耗时的记录估计 (每关键词开销, 每条商品耗时)
+    样本够多且条数有差异时做最小二乘，否则固定开销、按总量折算每条耗时
+    """
+    samples = [(e["items"], e["seconds"]) for e in entries if e.get("seconds") and e.get("items")]
+    overhead, per_item = KEYWORD_OVERHEAD, SECONDS_PER_ITEM.get(site, 0.4)
+    if len(samples) >= 3 and len({n for n, _ in samples}) > 1:
+        mean_n = sum(n for n, _ in samples) / len(samples)
+        mean_s = sum(s for _, s in samples) / len(samples)
+        slope = (sum((n - mean_n) * (s - mean_s) for n, s in samples)
+                 / sum((n - mean_n) ** 2 for n, _ in samples))
+        if slope > 0:
+            return max(mean_s - slope * mean_n, 0.0), slope
+    spent = sum(max(s - overhead, 0) for _, s in samples)
+    if spent > 0:
+        per_item = spent / sum(n for n, _ in samples)
+    return overhead, per_item
+
+
+def lpt_order(durations, workers):
+    """
+    LPT (最长处理时间优先): 按预计耗时从长到短排队；共享队列上空闲的 worker 取队首，
+    等价于把下一个最长的关键词分给最早空闲的 worker。返回 (关键词顺序, 预计总耗时)
+    """
+    order = sorted(durations, key=lambda name: durations[name], reverse=True)
+    finish = [WORKER_STARTUP] * max(min(workers, len(order)), 1)
+    for name in order:
+        heapq.heapreplace(finish, finish[0] + durations[name])
+    return order, max(finish) if order else 0.0
+
+
 class BaseCrawler:
+    # 子类填写站点名，用于限速 (SITE_RATE_LIMITS)
+    site = None
+    # 常驻 agent 进程里共用的 Playwright 实例；为 None 时每个 worker 自己启动一个
+    shared_playwright = None
+    # 进度单位对应的商品数 (eBay 的进度按页)
+    progress_items = 1
+    # 首页探测 (调度前预估产出): 搜索地址由 search_url() 给出；页面上有结果总数 (probe_total_selector)
+    # 就直接用，否则数首屏商品 (probe_selector)，不满 probe_page_size 说明结果就这么多
+    probe_total_selector = None
+    probe_selector = None
+    probe_page_size = 24
+    # 增量模式要求结果按最新上架排序 (已知商品之后只剩更旧的)：子类填写追加到搜索地址的排序参数；
+    # 为 None 的站点 (无法按时间排序) 增量模式不生效，照常全量爬
+    delta_sort = None
+
     def __init__(self, port, headless=True):  # 默认 headless=True
         self.port = port
         self.headless = headless  # 服务器上必须为 True
@@ -16,11 +846,63 @@ class BaseCrawler:
         self.browser = None
         self.context = None
         self.page = None
+        self.timings = CrawlTimings(port=port)
+        self.launches = 0
+        # 进程内事件回调 (event, fields)，自动扩缩容 / 监控用它统计吞吐、验证次数和进度
+        self.listener = None
+        # 浏览器进程句柄和 CDP 断开标记，监控据此判断 worker 是否已经挂掉
+        self.browser_process = None
+        self.disconnected = False
+        # 浏览器回收: 当前页面已处理的关键词数、CDP 会话 (读 JS 堆)、各级回收次数
+        self.keywords_on_page = 0
+        self.cdp = None
+        self.recycles = {"page": 0, "browser": 0}
+        # 回收重启期间为 True: 这次重连不算意外重启 (只计 browser_recycles)
+        self.recycling = False
+        # 增量模式 (MultiCrawlerManager 设置): 从头爬的关键词翻到已知商品就停
+        self.delta = False
+
+    def span(self, phase, keyword=None, **fields):
+        """阶段计时: with self.span("navigate", keyword=kw): ..."""
+        return self.timings.span(phase, keyword=keyword, **fields)
 
     async def init_browser(self):
         """标准化的浏览器启动逻辑 (自动适配 Windows/Linux)"""
         print(f"[Port {self.port}] 🔄 初始化浏览器...")
 
+        # 1-2. 启动浏览器进程；已经接管了预热好的浏览器 (agent 的浏览器池) 就直接连接
+        if self.browser_process is not None and self.browser_process.poll() is None:
+            print(f"[Port {self.port}] ♻️  复用已启动的浏览器 (PID {self.browser_process.pid})")
+        else:
+            await self.launch_browser()
+
+        # 3. Playwright 连接
+        self.playwright = BaseCrawler.shared_playwright or await async_playwright().start()
+        try:
+            self.browser = await self.playwright.chromium.connect_over_cdp(f"http://localhost:{self.port}")
+            self.disconnected = False
+            self.browser.on("disconnected", self._on_disconnected)
+            self.context = self.browser.contexts[0]
+            if len(self.context.pages) > 0:
+                self.page = self.context.pages[0]
+            else:
+                self.page = await self.context.new_page()
+
+            await self.page.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined});")
+            await install_site_overrides(self.context)
+            print(f"[Port {self.port}] ✅ 连接成功")
+            if not self.recycling:
+                self.launches += 1
+                self.count("browser_launches")
+                if self.launches > 1:
+                    self.count("browser_restarts")
+
+        except Exception as e:
+            print(f"[Port {self.port}] ❌ 连接失败: {e}")
+            raise e
+
+    async def launch_browser(self):
+        """以调试端口启动浏览器进程并登记 (不连接)；agent 预热浏览器池也用它"""
         system_name = platform.system()
 
         # 1. 配置路径和命令
@@ -34,8 +916,8 @@ class BaseCrawler:
             # Linux 配置 (服务器环境)
             # 假设服务器已安装 Chrome 或 Edge，通常命令是 google-chrome 或 microsoft-edge
             # 这里的路径通常是 /usr/bin/google-chrome
-            browser_executable = "google-chrome"  # 或者 "microsoft-edge"
-            user_data_dir = f"/root/browser_data_{self.port}"
+            browser_executable = os.environ.get("CRAWLER_BROWSER", "google-chrome")  # 或者 "microsoft-edge"
+            user_data_dir = os.path.join(os.environ.get("CRAWLER_PROFILE_ROOT", "/root"), f"browser_data_{self.port}")
             # Linux 服务器必须加无头参数
             headless_arg = ["--headless", "--disable-gpu", "--no-sandbox"]
 
@@ -55,8 +937,10 @@ class BaseCrawler:
               ] + headless_arg
 
         try:
-            # 使用 subprocess 启动浏览器进程
-            subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            # 使用 subprocess 启动浏览器进程；Linux 上放进独立会话，便于按进程组整体清理
+            self.browser_process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                                    start_new_session=system_name != "Windows")
+            browser_registry.register(self.port, self.browser_process)
         except FileNotFoundError:
             print(f"❌ 找不到浏览器可执行文件: {browser_executable}")
             print("请在服务器上运行: dnf install google-chrome-stable -y (或其他浏览器安装命令)")
@@ -65,73 +949,676 @@ class BaseCrawler:
         # 等待浏览器启动
         await asyncio.sleep(5)
 
-        # 3. Playwright 连接
-        self.playwright = await async_playwright().start()
+    async def close(self):
+        self.timings.report_summary()
+        if any(self.recycles.values()):
+            print(f"♻️  [Port {self.port}] 回收统计: 页面 {self.recycles['page']} 次，浏览器 {self.recycles['browser']} 次")
         try:
-            self.browser = await self.playwright.chromium.connect_over_cdp(f"http://localhost:{self.port}")
-            self.context = self.browser.contexts[0]
-            if len(self.context.pages) > 0:
-                self.page = self.context.pages[0]
-            else:
-                self.page = await self.context.new_page()
+            if self.playwright is not None and self.playwright is BaseCrawler.shared_playwright:
+                # 共用的 Playwright 不能停，只断开本 worker 的 CDP 连接，浏览器进程留给浏览器池
+                if self.browser: await self.browser.close()
+            elif self.playwright:
+                await self.playwright.stop()
+            print(f"[Port {self.port}] 断开连接")
+        except:
+            pass
 
+    async def js_heap_mb(self):
+        """当前页面的 JS 堆使用量 (CDP Performance.getMetrics)，取不到返回 None"""
+        try:
+            if self.cdp is None:
+                self.cdp = await self.context.new_cdp_session(self.page)
+                await self.cdp.send("Performance.enable")
+            result = await self.cdp.send("Performance.getMetrics")
+            for metric in result.get("metrics", []):
+                if metric.get("name") == "JSHeapUsedSize":
+                    return metric["value"] / 1024 / 1024
+        except Exception:
+            self.cdp = None
+        return None
+
+    async def maybe_recycle(self, keyword=None):
+        """关键词之间调用: 浏览器 RSS 超限则重启浏览器，页面处理量 / JS 堆超限则换页面"""
+        if self.page is None:
+            return
+        rss = process_group_rss(self.browser_process.pid) if self.browser_process is not None else None
+        if RECYCLE_RSS_MB and rss and rss > RECYCLE_RSS_MB:
+            await self.recycle_browser(f"浏览器内存 {rss:.0f}MB > {RECYCLE_RSS_MB:.0f}MB", keyword)
+        elif RECYCLE_KEYWORDS and self.keywords_on_page >= RECYCLE_KEYWORDS:
+            await self.recycle_page(f"已处理 {self.keywords_on_page} 个关键词", keyword)
+        elif RECYCLE_HEAP_MB:
+            heap = await self.js_heap_mb()
+            if heap and heap > RECYCLE_HEAP_MB:
+                await self.recycle_page(f"JS 堆 {heap:.0f}MB > {RECYCLE_HEAP_MB:.0f}MB", keyword)
+        self.keywords_on_page += 1
+
+    async def recycle_page(self, reason, keyword=None):
+        """关掉当前页面换一个新的 (同一上下文，cookies / 登录状态不变)"""
+        with self.span("recycle", keyword=keyword, level="page"):
+            old_page = self.page
+            self.page = await self.context.new_page()
             await self.page.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined});")
-            print(f"[Port {self.port}] ✅ 连接成功")
+            self.cdp = None
+            try:
+                await old_page.close()
+            except Exception:
+                pass
+        self.keywords_on_page = 0
+        self.recycles["page"] += 1
+        print(f"♻️  [Port {self.port}] 回收页面: {reason}")
+        self.count("page_recycles")
+
+    async def recycle_browser(self, reason, keyword=None):
+        """同端口、同用户目录重启浏览器进程；cookies 先取出，重连后写回"""
+        with self.span("recycle", keyword=keyword, level="browser"):
+            cookies = []
+            try:
+                cookies = await self.context.cookies()
+            except Exception:
+                pass
+            try:
+                if self.playwright is BaseCrawler.shared_playwright:
+                    await self.browser.close()
+                else:
+                    await self.playwright.stop()
+            except Exception:
+                pass
+            await self.kill_browser_async()
+            self.browser_process = None
+            self.cdp = None
+            self.recycling = True
+            try:
+                await self.init_browser()
+            finally:
+                self.recycling = False
+            if cookies:
+                await self.context.add_cookies(cookies)
+        self.keywords_on_page = 0
+        self.recycles["browser"] += 1
+        print(f"♻️  [Port {self.port}] 重启浏览器: {reason} (保留 {len(cookies)} 个 cookie)")
+        self.count("browser_recycles")
+
+    def _on_disconnected(self, browser=None):
+        # 回收浏览器时旧连接的断开事件可能晚到，只认当前这个
+        if browser is not None and browser is not self.browser:
+            return
+        self.disconnected = True
+        print(f"[Port {self.port}] 💀 浏览器连接已断开")
+
+    def alive(self):
+        """浏览器进程仍在且 CDP 连接未断开"""
+        if self.disconnected:
+            return False
+        return self.browser_process is None or self.browser_process.poll() is None
 
+    def kill_browser(self, timeout=5):
+        """结束本 worker 启动的浏览器 (含子进程)，重启前和 worker 退出时调用"""
+        proc = self.browser_process
+        if proc is None:
+            return
+        try:
+            if proc.poll() is None:
+                kill_process_tree(proc.pid, proc, timeout)
         except Exception as e:
-            print(f"[Port {self.port}] ❌ 连接失败: {e}")
-            raise e
+            print(f"[Port {self.port}] ⚠️ 结束浏览器失败: {e}")
+        browser_registry.unregister(self.port, proc.pid)
 
-    async def close(self):
+    async def kill_browser_async(self, timeout=5):
+        """
+        kill_browser 的协程版本: 在线程里等待浏览器退出 (最长 timeout 秒)，不阻塞事件循环
+        常驻 agent 的多个任务共用一个循环；to_thread 会带上 contextvars，输出仍写到本任务的日志流
+        """
+        await asyncio.to_thread(self.kill_browser, timeout)
+
+    async def throttle(self, keyword=None):
+        """导航 / 翻页前调用，按站点限速 (等待时间记为 throttle 阶段)"""
+        wait = rate_limiter.reserve(self.site)
+        if wait > 0:
+            with self.span("throttle", keyword=keyword):
+                await asyncio.sleep(wait)
+
+    def report(self, event, **fields):
+        """带上 worker 端口的结构化事件"""
+        emit_event(event, port=self.port, **fields)
+        if self.listener is not None:
+            try:
+                self.listener(event, fields)
+            except Exception:
+                pass
+
+    def count(self, name, value=1, **fields):
+        """计数器事件 (pages_fetched / browser_restarts ...)，后端按任务和服务器累计后输出到 /metrics"""
+        self.report("counter", name=name, value=value, **fields)
+
+    def search_url(self, keyword):
+        """关键词搜索结果首页地址，子类实现；返回 None 表示不支持首页探测"""
+        return None
+
+    async def probe(self, page, keyword):
+        """用搜索结果首页估计关键词的结果总数；首页已满 (后面可能还有很多) 或无法判断时返回 None"""
+        url = self.search_url(keyword)
+        if not url:
+            return None
+        await self.throttle(keyword)
+        with self.span("probe", keyword=keyword):
+            await page.goto(url, timeout=30000)
+            self.count("pages_fetched")
+            try:
+                await page.wait_for_load_state("networkidle", timeout=10000)
+            except Exception:
+                pass
+            total, count = await page.evaluate(
+                """([totalSel, itemSel]) => [
+                    (totalSel && document.querySelector(totalSel) || {}).innerText || "",
+                    itemSel ? document.querySelectorAll(itemSel).length : 0]""",
+                [self.probe_total_selector, self.probe_selector])
+        match = re.search(r"\d[\d,]*", total)
+        if match:
+            return int(match.group().replace(",", ""))
+        # 0 条多半是验证页 / 没加载出来，当作未知
+        return count if 0 < count < self.probe_page_size else None
+
+    async def probe_many(self, keywords, tabs=PROBE_TABS, deadline=None):
+        """开几个标签页并发探测首页，返回 {关键词: 结果数或 None}；过了 deadline 不再开始新的探测"""
+        results = {}
+        pending = list(keywords)
+
+        async def run(page):
+            while pending and (deadline is None or time.time() < deadline):
+                keyword = pending.pop(0)
+                try:
+                    results[keyword] = await self.probe(page, keyword)
+                except Exception as e:
+                    results[keyword] = None
+                    print(f"[Port {self.port}] ⚠️ 探测 {keyword} 失败: {e}")
+
+        pages = [self.page]
         try:
-            if self.playwright: await self.playwright.stop()
-            print(f"[Port {self.port}] 断开连接")
-        except:
-            pass
+            for _ in range(min(tabs, len(pending)) - 1):
+                pages.append(await self.context.new_page())
+            await asyncio.gather(*(run(page) for page in pages))
+        finally:
+            for page in pages[1:]:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+        return results
+
+    def delta_cutoff(self, output_dir, keyword, start, file_prefix=None):
+        """增量模式下从头爬、且已有数据的关键词返回 DeltaCutoff，否则 None (续爬照常追加；站点不能按最新排序也是 None)"""
+        if not self.delta or start or self.delta_sort is None:
+            return None
+        cutoff = DeltaCutoff.for_keyword(output_dir, file_prefix or keyword)
+        if cutoff is not None:
+            print(f"[Port {self.port}] 🧭 增量模式: {keyword} 已知 {len(cutoff.known)} 条，翻到已知商品即停")
+        return cutoff
+
+    async def loaded_links(self, item_selector, link_selector, start=0):
+        """滚动页面上第 start 个之后已加载商品的链接，供增量模式逐批检查"""
+        try:
+            links = await self.page.evaluate(
+                """([itemSel, linkSel, start]) => Array.from(document.querySelectorAll(itemSel)).slice(start)
+                    .map(item => { const a = item.matches(linkSel) ? item : item.querySelector(linkSel);
+                                   return a ? a.href : ""; })""",
+                [item_selector, link_selector, start])
+        except Exception:
+            return []
+        return [{"link": link} for link in links if link]
 
     async def crawl(self, keywords, max_count, output_dir):
         raise NotImplementedError
 
 
+# ==================== 自动扩缩容 (按吞吐 / 内存 / 负载 / 验证频率调整 worker 数) ====================
+class TaskFeed:
+    """
+    共享任务队列的列表视图: 子类 crawl() 里的 tasks.sort() 和 for 循环照常可用，
+    每次迭代从共享队列取下一个关键词；stop() 之后做完手上这个就退出 (缩容)
+    - current: 已取出但循环还没进入下一轮的关键词 (在途)；worker 崩溃时由监控放回队列
+    - 取下一个之前发现浏览器已挂 (crawler.alive() 为 False)，保留 current 并结束迭代
+    - ordered: 队列已由 MultiCrawlerManager.plan() 按 LPT 排好，子类里的 tasks.sort() 不再改动顺序
+    """
+
+    def __init__(self, queue, crawler=None, ordered=False):
+        self.queue = queue
+        self.crawler = crawler
+        self.ordered = ordered
+        self.stopped = False
+        self.current = None
+
+    def sort(self, key=None, reverse=False):
+        if not self.ordered:
+            self.queue.sort(key=key, reverse=reverse)
+
+    def stop(self):
+        self.stopped = True
+
+    def __len__(self):
+        return len(self.queue)
+
+    def __iter__(self):
+        while True:
+            if self.current is not None and self.crawler is not None and not self.crawler.alive():
+                return
+            self.current = None
+            if self.stopped or not self.queue:
+                return
+            self.current = self.queue.pop(0)
+            yield self.current
+
+
+def system_load():
+    """(内存使用率, 每核 1 分钟负载)，取不到的项为 None (如 Windows)"""
+    mem = None
+    try:
+        info = {}
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                info[key] = int(value.split()[0])
+        mem = 1 - info["MemAvailable"] / info["MemTotal"]
+    except (OSError, KeyError, ValueError, IndexError, ZeroDivisionError):
+        pass
+    try:
+        load = os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (OSError, AttributeError):
+        load = None
+    return mem, load
+
+
+class Autoscaler:
+    """
+    每 interval 秒按上一个窗口的数据决策一次 (+1 / -1 / 0):
+    - 内存使用率超过 MEM_HIGH，或验证/失败次数占完成关键词的比例超过 CHALLENGE_HIGH → 减一个
+    - 内存低于 MEM_ADD、每核负载低于 LOAD_ADD，且上次扩容后 items/s 仍在上涨 → 加一个
+    - 其它情况保持
+    """
+    MEM_HIGH = 0.85
+    MEM_ADD = 0.70
+    LOAD_ADD = 0.8
+    CHALLENGE_HIGH = 0.3
+    MIN_GAIN = 1.05
+
+    def __init__(self, min_workers, max_workers, interval=90):
+        self.min_workers = max(1, min(min_workers, max_workers))
+        self.max_workers = max_workers
+        self.interval = interval
+        self.items = 0
+        self.keywords = 0
+        self.challenges = 0
+        self._window = (time.time(), 0, 0, 0)
+        # 最近一次扩容前的 items/s，扩容后没有涨过它就不再继续加
+        self.rate_before_scale = None
+
+    def observe(self, event, fields):
+        """BaseCrawler.listener 回调"""
+        if event == "keyword_done":
+            self.keywords += 1
+            self.items += int(fields.get("items") or 0)
+            if fields.get("error"):
+                self.challenges += 1
+        elif event == "counter" and fields.get("name") == "verifications":
+            self.challenges += int(fields.get("value") or 1)
+
+    def decide(self, active, pending):
+        now = time.time()
+        started, items, keywords, challenges = self._window
+        self._window = (now, self.items, self.keywords, self.challenges)
+        rate = (self.items - items) / max(now - started, 1e-6)
+        keywords = self.keywords - keywords
+        challenges = self.challenges - challenges
+        challenge_ratio = challenges / max(keywords, 1)
+        mem, load = system_load()
+
+        action = 0
+        if active > self.min_workers and mem is not None and mem > self.MEM_HIGH:
+            action, reason = -1, f"内存使用率 {mem:.0%} 超过 {self.MEM_HIGH:.0%}"
+        elif active > self.min_workers and challenges and challenge_ratio > self.CHALLENGE_HIGH:
+            action, reason = -1, f"验证/失败 {challenges} 次 ({challenge_ratio:.0%} 的关键词)"
+        elif active >= self.max_workers:
+            reason = f"已达上限 {self.max_workers}"
+        elif pending <= 0:
+            reason = "没有待分配的关键词"
+        elif (mem is not None and mem > self.MEM_ADD) or (load is not None and load > self.LOAD_ADD):
+            reason = "内存或负载偏高"
+        elif rate <= 0:
+            reason = "本窗口暂无产出"
+        elif self.rate_before_scale is not None and rate < self.rate_before_scale * self.MIN_GAIN:
+            reason = f"上次扩容后吞吐未提升 ({self.rate_before_scale:.2f} → {rate:.2f} items/s)"
+        else:
+            action, reason = 1, "吞吐上涨且资源充足"
+
+        if action > 0:
+            self.rate_before_scale = rate
+        elif action < 0:
+            self.rate_before_scale = None
+
+        target = active + action
+        icon = {1: "📈", -1: "📉", 0: "⏸️ "}[action]
+        print(f"{icon} [autoscale] workers {active} → {target}: {reason} | {rate:.2f} items/s, "
+              f"内存 {'-' if mem is None else f'{mem:.0%}'}, 每核负载 {'-' if load is None else f'{load:.2f}'}")
+        emit_event("autoscale", action={1: "up", -1: "down", 0: "hold"}[action], workers=target, reason=reason,
+                   items_per_sec=round(rate, 3), challenges=challenges, pending=pending,
+                   mem=None if mem is None else round(mem, 3), load=None if load is None else round(load, 2))
+        return action
+
+
 class MultiCrawlerManager:
     """多进程任务管理器"""
+    # 每个端口的最大重启次数、重启间隔 (秒，按次数递增)、单个关键词允许随浏览器崩溃的次数
+    MAX_RESTARTS = 3
+    RESTART_BACKOFF = 10
+    MAX_KEYWORD_ATTEMPTS = 3
 
-    def __init__(self, crawler_class, base_port=9222, workers=4):
+    def __init__(self, crawler_class, base_port=9222, workers=4, cookies_file=None, autoscale=False,
+                 min_workers=1, scale_interval=90, browser_pool=None, delta=False, probe=True):
         self.crawler_class = crawler_class
         self.base_port = base_port
         self.workers = workers
+        # base_port 只是起点，实际端口向节点内的租约文件申请，同机并发任务互不冲突
+        self.ports = PortAllocator(base_port)
+        # 常驻 agent 传入的预热浏览器池: take() -> (端口, Popen) 或 None，give(端口, Popen) 归还
+        self.browser_pool = browser_pool
+        self.cookies_file = cookies_file
+        # 开启后 workers 作为上限，从 min_workers 起步按 Autoscaler 的决策增减
+        self.autoscale = autoscale
+        self.min_workers = min_workers
+        self.scale_interval = scale_interval
+        # 增量模式: 过期重爬的关键词翻到已知商品就停，新结果合并进旧数据
+        self.delta = delta
+        # 调度前探测没有历史记录的关键词首页 (关掉则按 max_count 估计)
+        self.probe = probe
+
+    async def cleanup_browsers(self):
+        """只清理登记过、且启动它的任务进程已经退出的浏览器；同机其它任务的浏览器不受影响"""
+        if await asyncio.to_thread(browser_registry.reap_orphans):
+            await asyncio.sleep(2)
 
-    def kill_all_processes(self):
-        """清理残留进程"""
-        print("☠️  清理残留浏览器进程...")
-        if platform.system() == "Windows":
-            subprocess.run("taskkill /F /IM msedge.exe /T", shell=True, stdout=subprocess.DEVNULL,
-                           stderr=subprocess.DEVNULL)
+    async def plan(self, queue, max_count, ledger, workers, scouted):
+        """
+        调度前规划: 估计每个关键词的产出和耗时，按 LPT 就地重排 queue，返回预计总耗时 (秒)
+        - 产出: 账本里上次成功的条数；没有历史的探测搜索结果首页 (最多 PROBE_MAX_KEYWORDS 个、PROBE_BUDGET 秒)，
+          判断不了或超出预算的按 max_count 算
+        - 耗时: fit_cost 按账本里的实测耗时校准
+        """
+        site = self.crawler_class.site
+        history = ledger.snapshot()
+        unknown = [name for name, _ in queue if not (history.get(name) or {}).get("last_success")]
+        probed = await self.probe_keywords(unknown[:PROBE_MAX_KEYWORDS], scouted) if unknown and self.probe else {}
+        overhead, per_item = fit_cost(history.values(), site)
+        durations = {}
+        for name, start in queue:
+            entry = history.get(name) or {}
+            expected = entry.get("items") if entry.get("last_success") else probed.get(name)
+            expected = max_count if expected is None else min(expected, max_count)
+            remaining = max(expected - start * self.crawler_class.progress_items, 0)
+            durations[name] = overhead + per_item * remaining
+        order, predicted = lpt_order(durations, workers)
+        starts = dict(queue)
+        queue[:] = [(name, starts[name]) for name in order]
+        known = sum(1 for name in order if name in probed and probed[name] is not None)
+        print(f"📐 调度: {len(order)} 个关键词按预计耗时从长到短 (LPT)，{workers} 个 worker，"
+              f"预计 {predicted / 60:.1f} 分钟 (每关键词 {overhead:.0f}s + 每条 {per_item:.2f}s；"
+              f"历史 {len(order) - len(unknown)} 个，首页探测 {known}/{len(probed)} 个)")
+        for name in order[:3]:
+            print(f"   ⏳ {name}: 约 {durations[name]:.0f}s")
+        emit_event("schedule", predicted_seconds=round(predicted, 1), workers=workers, keywords=len(order),
+                   history=len(order) - len(unknown), probed=len(probed), overhead=round(overhead, 1),
+                   per_item=round(per_item, 3))
+        return predicted
+
+    async def probe_keywords(self, keywords, scouted):
+        """
+        用一个浏览器开几个标签页探测首页；探测完浏览器不关，放进 scouted 交给第一个 worker 接着用
+        返回 {关键词: 结果数或 None}
+        """
+        warm = self.browser_pool.take() if self.browser_pool is not None else None
+        if warm is not None:
+            port, process = warm
+        else:
+            try:
+                port, process = self.ports.lease(), None
+            except RuntimeError as e:
+                print(f"⚠️  首页探测跳过: {e}")
+                return {}
+        scout = self.crawler_class(port=port)
+        scout.browser_process = process
+        started = time.time()
+        results = {}
+        print(f"🔎 首页探测 {len(keywords)} 个没有历史记录的关键词...")
+        try:
+            await scout.init_browser()
+            if scout.page is not None:
+                results = await scout.probe_many(keywords, deadline=started + PROBE_BUDGET)
+        except Exception as e:
+            print(f"⚠️  首页探测失败: {e}")
+        finally:
+            await scout.close()
+        process = scout.browser_process
+        if process is not None and process.poll() is None:
+            scouted.append((port, process, warm is not None))
+        elif warm is not None:
+            await self.browser_pool.give(port, process)
         else:
-            # Linux 清理命令
-            os.system("pkill -f google-chrome")
-            os.system("pkill -f microsoft-edge")
-        time.sleep(2)
+            await scout.kill_browser_async()
+            self.ports.release(port)
+        skipped = len(keywords) - len(results)
+        print(f"🔎 首页探测完成，用时 {time.time() - started:.0f}s"
+              + (f" (超出 {PROBE_BUDGET}s 预算，{skipped} 个按 max_count 估计)" if skipped else ""))
+        return results
 
     async def run(self, all_tasks, max_count, output_dir):
-        self.kill_all_processes()
-        chunks = [[] for _ in range(self.workers)]
-        for i, task in enumerate(all_tasks):
-            chunks[i % self.workers].append(task)
-
-        coroutines = []
-        print(f"\n🔥 启动 {self.workers} 个并发爬虫...")
-
-        for i in range(self.workers):
-            port = self.base_port + i
-            worker_tasks = chunks[i]
-            if not worker_tasks: continue
-
-            # 实例化
-            crawler_instance = self.crawler_class(port=port)
-            coro = crawler_instance.crawl(worker_tasks, max_count, output_dir)
-            coroutines.append(coro)
-
-        if coroutines:
-            await asyncio.gather(*coroutines, return_exceptions=True)
-            print("\n✅ 所有任务完成")
\ No newline at end of file
+        """
+        所有 worker 从同一个队列取关键词，并由监控循环负责:
+        - worker 异常退出 / 浏览器进程退出 / CDP 断开时，把在途关键词放回队首，
+          在同一端口 (租约保留) 上重启浏览器 (每个端口最多 MAX_RESTARTS 次，间隔递增)
+        - 同一关键词连续把浏览器搞挂 MAX_KEYWORD_ATTEMPTS 次就放弃，避免死循环
+        - 开启 autoscale 时按 Autoscaler 的决策增减 worker
+        - 开始前由 plan() 预估各关键词耗时并按 LPT 排队，结束时对比预计与实际总耗时
+        """
+        await self.cleanup_browsers()
+        install_exit_handlers()
+        if self.delta and self.crawler_class.delta_sort is None:
+            print(f"⚠️  {self.crawler_class.site} 不支持按最新上架排序，增量模式不生效，照常全量爬")
+        queue = list(all_tasks)
+        ledger = CrawlLedger(output_dir)
+        scouted = []  # 首页探测用过的浏览器 (端口, Popen, 是否来自浏览器池)，交给第一个 worker
+        scaler = Autoscaler(self.min_workers, self.workers, self.scale_interval) if self.autoscale else None
+        slots = {}  # worker 序号 -> worker 状态
+        slot_ports = {}  # worker 序号 -> 租到的端口 (重启沿用同一个)
+        pooled = set()  # 端口来自浏览器池的 worker，结束时把浏览器还回池子
+        retired = set()
+        attempts = {}
+        stats = {"restarts": 0, "lost_seconds": 0.0, "requeued": 0, "dropped": 0}
+
+        def observe(worker, event, fields):
+            if scaler is not None:
+                scaler.observe(event, fields)
+            if event == "keyword_start":
+                worker["keyword_at"] = time.time()
+            elif event == "keyword_done":
+                worker["progress_at"] = time.time()
+                # 爬虫明确报告爬完 (翻到底 / 够数)、增量模式翻到已知商品、或进度已达 max_count 才算成功；
+                # 中途放弃 (滚动无新内容、页面出错) 的即使有数据也不记账，下次续爬
+                current = worker["feed"].current
+                start = current[1] if current and current[0] == fields.get("keyword") else 0
+                done = (fields.get("complete") or fields.get("caught_up")
+                        or start + (fields.get("items") or 0) >= max_count)
+                if not fields.get("error") and done:
+                    try:
+                        ledger.mark_success(fields["keyword"], fields.get("items") or 0,
+                                            time.time() - worker["keyword_at"] if "keyword_at" in worker else None)
+                    except Exception as e:
+                        print(f"⚠️  记录关键词完成时间失败: {e}")
+            elif event == "worker_state" and fields.get("state") == "crashed":
+                worker["crashed"] = True
+
+        def spawn(slot=None, delay=0, restarts=0):
+            if slot is None:
+                slot = next(i for i in range(self.workers) if i not in slots and i not in retired)
+            warm_process = None
+            if slot not in slot_ports:
+                warm = self.browser_pool.take() if self.browser_pool is not None and not scouted else None
+                if scouted:
+                    slot_ports[slot], warm_process, from_pool = scouted.pop()
+                    if from_pool:
+                        pooled.add(slot)
+                elif warm is not None:
+                    slot_ports[slot], warm_process = warm
+                    pooled.add(slot)
+                else:
+                    try:
+                        slot_ports[slot] = self.ports.lease()
+                    except RuntimeError as e:
+                        print(f"⚠️  {e}")
+                        retired.add(slot)
+                        return
+            crawler_instance = self.crawler_class(port=slot_ports[slot])
+            crawler_instance.browser_process = warm_process
+            crawler_instance.delta = self.delta
+            feed = TaskFeed(queue, crawler_instance, ordered=True)
+            worker = {"crawler": crawler_instance, "feed": feed, "restarts": restarts, "crashed": False,
+                      "progress_at": time.time() + delay}
+            crawler_instance.listener = lambda event, fields: observe(worker, event, fields)
+
+            async def start():
+                if delay:
+                    await asyncio.sleep(delay)
+                await crawler_instance.crawl(feed, max_count, output_dir)
+
+            worker["task"] = asyncio.create_task(start())
+            slots[slot] = worker
+
+        async def release(slot, worker):
+            port = slot_ports.pop(slot)
+            if slot in pooled:
+                pooled.discard(slot)
+                await self.browser_pool.give(port, worker["crawler"].browser_process)
+            else:
+                self.ports.release(port)
+
+        async def reap(slot, worker):
+            """worker 协程结束: 判断是否异常退出，必要时放回在途关键词并重启；重启了返回 True"""
+            feed, crawler_instance, task = worker["feed"], worker["crawler"], worker["task"]
+            error = task.exception()
+            if error is not None:
+                print(f"❌ [Port {crawler_instance.port}] worker 异常退出: {error}")
+            died = (error is not None or worker["crashed"] or feed.current is not None
+                    or (bool(queue) and not feed.stopped))
+            if died or slot not in pooled:
+                await crawler_instance.kill_browser_async()
+            if not died:
+                return
+
+            requeued = None
+            if feed.current is not None:
+                keyword = feed.current
+                attempts[keyword[0]] = attempts.get(keyword[0], 0) + 1
+                if attempts[keyword[0]] >= self.MAX_KEYWORD_ATTEMPTS:
+                    stats["dropped"] += 1
+                    print(f"🚫 [Port {crawler_instance.port}] {keyword[0]} 已连续 {attempts[keyword[0]]} 次随浏览器崩溃，放弃")
+                    emit_event("keyword_done", port=crawler_instance.port, keyword=keyword[0], items=0,
+                               error="多次崩溃，已放弃")
+                else:
+                    stats["requeued"] += 1
+                    requeued = keyword[0]
+                    queue.insert(0, keyword)
+                    print(f"↩️  [Port {crawler_instance.port}] {keyword[0]} 放回队列")
+            if not queue or feed.stopped:
+                return
+
+            restarts = worker["restarts"] + 1
+            if restarts > self.MAX_RESTARTS:
+                retired.add(slot)
+                print(f"⛔ [Port {crawler_instance.port}] 已重启 {self.MAX_RESTARTS} 次，不再重启")
+                emit_event("worker_state", port=crawler_instance.port, state="retired")
+                return
+            delay = min(self.RESTART_BACKOFF * restarts, 60)
+            # 损失时间: 上一个完成的关键词之后做的无用功 + 重启等待
+            lost = max(time.time() - worker["progress_at"], 0) + delay
+            stats["restarts"] += 1
+            stats["lost_seconds"] += lost
+            print(f"🔁 [Port {crawler_instance.port}] {delay:g}s 后重启浏览器 (第 {restarts} 次)，"
+                  f"本次损失约 {lost:.0f}s，队列剩余 {len(queue)}")
+            emit_event("worker_restart", port=crawler_instance.port, restarts=restarts, lost_seconds=round(lost, 1),
+                       requeued=requeued)
+            emit_event("counter", port=crawler_instance.port, name="worker_restarts", value=1)
+            emit_event("counter", port=crawler_instance.port, name="worker_lost_seconds", value=round(lost))
+            spawn(slot, delay=delay, restarts=restarts)
+            return True
+
+        initial = scaler.min_workers if scaler is not None else self.workers
+        # 自动扩缩容时按起步的 worker 数预估 (偏保守)
+        try:
+            predicted = await self.plan(queue, max_count, ledger, min(initial, len(queue)), scouted)
+        except Exception as e:
+            print(f"⚠️  调度规划失败，按原顺序执行: {e}")
+            predicted = 0.0
+        crawl_started = time.time()
+        if scaler is not None:
+            print(f"\n🔥 自动扩缩容: 从 {scaler.min_workers} 个爬虫起步，上限 {self.workers}，"
+                  f"每 {scaler.interval}s 评估一次")
+        else:
+            print(f"\n🔥 启动 {min(self.workers, len(queue))} 个并发爬虫...")
+        emit_event("job_start", keywords_total=len(all_tasks), workers=min(initial, len(queue)),
+                   max_workers=self.workers, autoscale=scaler is not None)
+        for _ in range(min(initial, len(queue))):
+            spawn()
+
+        next_check = time.time() + (scaler.interval if scaler is not None else 0)
+        try:
+            while slots:
+                timeout = max(next_check - time.time(), 0) if scaler is not None else None
+                await asyncio.wait([w["task"] for w in slots.values()], timeout=timeout,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                for slot, worker in list(slots.items()):
+                    if worker["task"].done():
+                        del slots[slot]
+                        if not await reap(slot, worker) and slot in slot_ports:
+                            await release(slot, worker)
+                if not slots and queue:
+                    # 所有端口都已用完重启次数，自动扩缩容模式下还可以换一个端口
+                    if scaler is not None and len(retired) < self.workers:
+                        spawn()
+                        continue
+                    print(f"⚠️  所有爬虫都已退出，还有 {len(queue)} 个关键词未处理")
+                    break
+                if scaler is None or time.time() < next_check:
+                    continue
+                next_check = time.time() + scaler.interval
+
+                running = [slot for slot, worker in slots.items() if not worker["feed"].stopped]
+                action = scaler.decide(len(running), len(queue))
+                if action > 0 and len(slots) + len(retired) < self.workers:
+                    spawn()
+                elif action < 0 and running:
+                    # 停掉最后加入的 worker，做完当前关键词后自行关闭浏览器
+                    slots[max(running)]["feed"].stop()
+        finally:
+            # 正常结束、取消或异常退出都只结束本任务的浏览器
+            # 各浏览器的退出等待并行进行，且不阻塞事件循环
+            for worker in slots.values():
+                worker["task"].cancel()
+            await asyncio.gather(*(worker["crawler"].kill_browser_async() for worker in slots.values()),
+                                 return_exceptions=True)
+            for slot, worker in slots.items():
+                if slot in slot_ports:
+                    await release(slot, worker)
+            for port, process, from_pool in scouted:
+                if from_pool:
+                    await self.browser_pool.give(port, process)
+                else:
+                    await asyncio.to_thread(kill_process_tree, process.pid, process)
+                    browser_registry.unregister(port, process.pid)
+            self.ports.release_all()
+
+        print(f"🩺 监控汇总: 重启 {stats['restarts']} 次，损失约 {stats['lost_seconds']:.0f}s，"
+              f"放回队列 {stats['requeued']} 个关键词，放弃 {stats['dropped']} 个")
+        emit_event("supervisor_summary", restarts=stats["restarts"], lost_seconds=round(stats["lost_seconds"], 1),
+                   requeued=stats["requeued"], dropped=stats["dropped"], remaining=len(queue))
+        actual = time.time() - crawl_started
+        if predicted:
+            print(f"⏱️  预计 {predicted / 60:.1f} 分钟，实际 {actual / 60:.1f} 分钟 (偏差 {actual / predicted - 1:+.0%})")
+        emit_event("schedule_result", predicted_seconds=round(predicted, 1), actual_seconds=round(actual, 1))
+        print("\n✅ 所有任务完成")
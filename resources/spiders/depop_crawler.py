@@ -12,23 +12,51 @@ import os
 
 # 1. 优先尝试直接导入 (服务器平铺模式 / PYTHONPATH 已设置模式)
 try:
-    from crawler_base import BaseCrawler, MultiCrawlerManager
+    from crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
 except ImportError:
     # 2. 尝试从资源包导入 (本地打包 EXE 模式)
     try:
-        from resources.spiders.crawler_base import BaseCrawler, MultiCrawlerManager
+        from resources.spiders.crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
     except ImportError:
         # 3. 本地开发模式 (相对路径兜底)
         sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         try:
-            from crawler.spiders.crawler_base import BaseCrawler, MultiCrawlerManager
+            from crawler.spiders.crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
         except ImportError:
             # 最后的倔强：添加当前目录
             sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-            from crawler_base import BaseCrawler, MultiCrawlerManager
+            from crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
+
+try:
+    from record_schema import normalize_records, ProductRecord
+except ImportError:
+    try:
+        from resources.spiders.record_schema import normalize_records, ProductRecord
+    except ImportError:
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+        from record_schema import normalize_records, ProductRecord
+
+try:
+    from image_store import download_images
+except ImportError:
+    try:
+        from resources.spiders.image_store import download_images
+    except ImportError:
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+        from image_store import download_images
 # =========================================================
 
 class DepopCrawler(BaseCrawler):
+    site = "depop"
+    # 首页探测: 数首屏商品，不满一屏说明结果就这么多
+    probe_selector = 'li[class*="styles_listItem"]'
+    probe_page_size = 24
+    # 增量模式按最新上架排序
+    delta_sort = "&sort=newlyListed"
+
+    def search_url(self, keyword):
+        return f"https://www.depop.com/search/?q={keyword.strip().replace(' ', '+')}"
+
     def extract_products(self, html_content, skip_count=0):
         """
         Depop 专属的 HTML 解析逻辑
@@ -46,7 +74,7 @@ class DepopCrawler(BaseCrawler):
         for container in containers_to_process:
             try:
                 local_index += 1
-                product = {'index': local_index}
+                product = ProductRecord('depop', index=local_index)
 
                 # 提取图片
                 img_tag = container.select_one('img[class*="_mainImage"]')
@@ -113,76 +141,118 @@ class DepopCrawler(BaseCrawler):
             except:
                 pass
 
+            self.report("worker_state", state="running")
+
             # 3. 开始遍历任务
             for product_name, start_index in tasks:
+                # 关键词之间按页面处理量 / 内存决定是否回收页面或浏览器
+                await self.maybe_recycle(product_name)
                 print(f"\n{'=' * 40}\n[Port {self.port}] 正在爬取: {product_name} (Index {start_index})\n{'=' * 40}")
+                self.report("keyword_start", keyword=product_name)
+                cutoff = self.delta_cutoff(output_dir, product_name, start_index)
 
-                # 构造搜索URL
-                search_query = product_name.strip().replace(' ', '+')
-                search_url = f"https://www.depop.com/search/?q={search_query}"
+                # 构造搜索URL (增量模式按最新上架排序)
+                search_url = self.search_url(product_name)
+                if cutoff is not None:
+                    search_url += self.delta_sort
 
                 try:
-                    await self.page.goto(search_url)
-                    try:
-                        await self.page.wait_for_load_state('networkidle', timeout=15000)
-                    except:
-                        pass
+                    await self.throttle(product_name)
+                    with self.span("navigate", keyword=product_name):
+                        await self.page.goto(search_url)
+                        self.count("pages_fetched")
+                        try:
+                            await self.page.wait_for_load_state('networkidle', timeout=15000)
+                        except:
+                            pass
                     await asyncio.sleep(2)
                 except Exception as e:
                     print(f"❌ [Port {self.port}] 页面跳转失败: {e}")
+                    self.report("keyword_done", keyword=product_name, items=0, error=str(e))
                     continue
 
                 # --- 智能无限滚动 (Depop 需要) ---
                 current_count = 0
                 retry_count = 0
+                # 滚够数量或增量模式追上已知商品才算爬完；连续无新内容放弃的下次还要再爬
+                complete = False
                 item_selector = 'li[class*="styles_listItem"]'
 
-                while current_count < max_count:
-                    await self.page.keyboard.press("End")
-                    await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-
-                    # 等待新元素出现
-                    try:
-                        await self.page.wait_for_function(
-                            f"document.querySelectorAll('{item_selector}').length > {current_count}",
-                            timeout=20000
-                        )
-                        await asyncio.sleep(2)
-                    except:
-                        pass
-
-                    try:
-                        new_count = await self.page.evaluate(f"document.querySelectorAll('{item_selector}').length")
-                    except:
-                        new_count = current_count
+                with self.span("scroll", keyword=product_name) as scroll_span:
+                    while current_count < max_count:
+                        await self.page.keyboard.press("End")
+                        await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
 
-                    if new_count > current_count:
-                        current_count = new_count
-                        retry_count = 0
-                        print(f"  📉 [Port {self.port}] 滚动加载中... (当前: {current_count})", end='\r')
+                        # 等待新元素出现
+                        try:
+                            await self.page.wait_for_function(
+                                f"document.querySelectorAll('{item_selector}').length > {current_count}",
+                                timeout=20000
+                            )
+                            await asyncio.sleep(2)
+                        except:
+                            pass
+
+                        try:
+                            new_count = await self.page.evaluate(f"document.querySelectorAll('{item_selector}').length")
+                        except:
+                            new_count = current_count
+
+                        if new_count > current_count:
+                            batch_start, current_count = current_count, new_count
+                            retry_count = 0
+                            print(f"  📉 [Port {self.port}] 滚动加载中... (当前: {current_count})", end='\r')
+                            if cutoff is not None and cutoff.check(
+                                    await self.loaded_links(item_selector, 'a[href*="/products/"]', batch_start)):
+                                print(f"\n  🧭 [Port {self.port}] 本批 {current_count - batch_start} 条大多已爬过，停止滚动")
+                                complete = True
+                                break
+                        else:
+                            retry_count += 1
+                            print(f"  ⚠️ [Port {self.port}] 无新内容 ({retry_count}/5)...")
+                            await self.page.evaluate("window.scrollBy(0, -500)")
+                            await asyncio.sleep(2)
+                            await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                            if retry_count >= 5: break
                     else:
-                        retry_count += 1
-                        print(f"  ⚠️ [Port {self.port}] 无新内容 ({retry_count}/5)...")
-                        await self.page.evaluate("window.scrollBy(0, -500)")
-                        await asyncio.sleep(2)
-                        await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                        if retry_count >= 5: break
+                        complete = True
+                    scroll_span.items = current_count
 
                 # --- 提取与保存 ---
                 print(f"\n[Port {self.port}] 提取数据...")
+                saved = 0
+                error = None
                 try:
-                    html = await self.page.content()
-                    data = self.extract_products(html, skip_count=start_index)
+                    with self.span("content", keyword=product_name):
+                        html = await self.page.content()
+                    with self.span("extract", keyword=product_name) as span:
+                        data = self.extract_products(html, skip_count=start_index)
+                        span.items = len(data)
+                    fresh = len(data)
+                    if cutoff is not None:
+                        # 本次结果在前，旧数据接在后面；进度只统计新上架的商品
+                        fresh = len(cutoff.fresh(data))
+                        data = cutoff.merge(data, max_count)
+                        print(f"  🧭 [Port {self.port}] 新商品 {fresh} 条，合并后共 {len(data)} 条")
                     if data:
-                        self._save_data(product_name, data, start_index, output_dir)
+                        with self.span("save", keyword=product_name) as span:
+                            self._save_data(product_name, data, start_index, output_dir)
+                            span.items = len(data)
+                        saved = fresh
                         print(f"  ✓ [Port {self.port}] 保存成功: {len(data)} 条")
                     else:
                         print(f"  ⚠️ [Port {self.port}] 未提取到数据")
                 except Exception as e:
                     print(f"  ❌ [Port {self.port}] 处理失败: {e}")
+                    error = str(e)
+                self.report("keyword_done", keyword=product_name, items=saved, error=error, complete=complete,
+                            caught_up=cutoff is not None and cutoff.reached)
+
+            self.report("worker_state", state="finished")
 
         except Exception as e:
             print(f"❌ [Port {self.port}] 进程崩溃: {e}")
+            self.report("worker_state", state="crashed", error=str(e))
         finally:
             await self.close()  # 调用父类清理
 
@@ -226,6 +296,13 @@ class DepopCrawler(BaseCrawler):
                     print("   ⚠️ 未找到旧文件")
             except Exception as e:
                 print(f"   ❌ 合并出错: {e}")
+        else:
+            # 从 0 开始 (新关键词 / 过期重爬): 新结果取代该关键词的旧文件
+            from pathlib import Path
+            for f in Path(output_dir).glob('*_products_*.json'):
+                match = re.match(r'^(.+?)_products_\d{8}_\d{6}\.json$', f.name)
+                if match and match.group(1) == product_name:
+                    files_to_remove.append(f)
 
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         new_json_name = os.path.join(output_dir, f"{product_name}_products_{timestamp}.json")
@@ -233,6 +310,8 @@ class DepopCrawler(BaseCrawler):
 
         if not os.path.exists(output_dir): os.makedirs(output_dir)
 
+        # 统一字段结构 (数值价格 + 币种)，旧文件合并进来的记录一并规范化
+        final_data = normalize_records(final_data, platform="depop", keyword=product_name)
         with open(new_json_name, 'w', encoding='utf-8') as f:
             json.dump(final_data, f, ensure_ascii=False, indent=2)
         print(f"💾 JSON保存: {os.path.basename(new_json_name)}")
@@ -250,7 +329,7 @@ class DepopCrawler(BaseCrawler):
 
 
 # ==================== 核心工具: 任务获取与断点检测 ====================
-def get_tasks_from_file(name_file, max_count, data_dir):
+def get_tasks_from_file(name_file, max_count, data_dir, ttl_hours=None):
     """
     读取任务列表，并扫描数据目录，检查是否有已爬取的进度。
     返回格式: [(product_name, start_index), ...]
@@ -273,6 +352,7 @@ def get_tasks_from_file(name_file, max_count, data_dir):
 
     # 2. 扫描现有的 JSON 文件，获取进度
     tasks_progress = {name: 0 for name in product_names}
+    latest = {}  # 关键词 -> 最新数据文件的修改时间
     data_path = Path(data_dir)
 
     if data_path.exists():
@@ -289,6 +369,7 @@ def get_tasks_from_file(name_file, max_count, data_dir):
 
             # 如果这个商品在我们的任务列表中
             if p_name in tasks_progress:
+                latest[p_name] = max(latest.get(p_name, 0), json_file.stat().st_mtime)
                 try:
                     with open(json_file, 'r', encoding='utf-8') as f:
                         data = json.load(f)
@@ -307,18 +388,8 @@ def get_tasks_from_file(name_file, max_count, data_dir):
                     continue
 
     # 3. 生成最终任务列表
-    final_tasks = []
-    for name, progress in tasks_progress.items():
-        if progress < max_count:
-            if progress > 0:
-                print(f"  🔄 恢复任务: {name} (从 {progress} 开始)")
-            final_tasks.append((name, progress))
-        else:
-            # print(f"  ✅ 跳过已完成: {name}") # 可选：打印已完成的任务
-            pass
-
-    # 按名称排序，保证每次运行顺序一致
-    return sorted(final_tasks, key=lambda x: x[0])
+    # 3. 按新鲜度规划: TTL 内成功爬完的跳过，过期的从头重爬，没爬完的续爬
+    return plan_tasks(tasks_progress, max_count, CrawlLedger(data_dir), site_ttl("depop", ttl_hours), latest)
 
 
 
@@ -328,26 +399,35 @@ def get_tasks_from_file(name_file, max_count, data_dir):
 if __name__ == "__main__":
     # 1. 定义命令行参数 (与 backend_final.py 完美对接)
     parser = argparse.ArgumentParser(description="分布式爬虫节点")
-    parser.add_argument("--workers", type=int, default=2, help="并发窗口数")
-    parser.add_argument("--base_port", type=int, default=9222, help="起始端口")
+    parser.add_argument("--workers", type=int, default=2, help="并发窗口数 (--autoscale 时为上限)")
+    parser.add_argument("--autoscale", action="store_true", help="按吞吐/内存/负载/验证频率自动调整并发数")
+    parser.add_argument("--min_workers", type=int, default=1, help="自动扩缩容的起步并发数")
+    parser.add_argument("--base_port", type=int, default=9222, help="起始端口 (从这里往上申请空闲端口)")
     parser.add_argument("--max_count", type=int, default=100, help="爬取数量")
     parser.add_argument("--output_dir", type=str, required=True, help="数据保存绝对路径")
     parser.add_argument("--task_file", type=str, required=True, help="任务文件路径")
+    parser.add_argument("--ttl_hours", type=float, default=None,
+                        help="成功爬完多少小时内不再重爬 (默认按站点，<= 0 表示不过期)")
+    parser.add_argument("--delta", action="store_true",
+                        help="增量模式: 过期重爬的关键词翻到已爬过的商品就停，新商品合并进旧数据")
+    parser.add_argument("--no_probe", action="store_true",
+                        help="调度前不探测首页 (没有历史记录的关键词按 max_count 估计耗时)")
 
     # 接收额外参数 (如 cookies_file)
     parser.add_argument("--cookies_file", type=str, default=None, help="Cookie文件路径")
+    parser.add_argument("--image_store", type=str, default=None, help="爬完后下载图片到该目录 (按内容哈希去重存储)")
 
     args = parser.parse_args()
 
     print(f"🚀 启动爬虫任务 (PID: {os.getpid()}):")
-    print(f"   - Workers: {args.workers}")
-    print(f"   - Target: {args.max_count}")
+    print(f"   - Workers: {args.workers}" + (f" (自动扩缩容，起步 {args.min_workers})" if args.autoscale else ""))
+    print(f"   - Target: {args.max_count}" + (" (增量模式)" if args.delta else ""))
     print(f"   - Output: {args.output_dir}")
     print(f"   - Task File: {args.task_file}")
     print("=" * 60)
 
     # 2. 获取任务
-    all_tasks = get_tasks_from_file(args.task_file, args.max_count, args.output_dir)
+    all_tasks = get_tasks_from_file(args.task_file, args.max_count, args.output_dir, args.ttl_hours)
 
     if all_tasks:
         print(f"📦 任务总数: {len(all_tasks)}")
@@ -358,6 +438,10 @@ if __name__ == "__main__":
             crawler_class=DepopCrawler,  # <--- 修改这里！！！
             base_port=args.base_port,
             workers=args.workers,
+            autoscale=args.autoscale,
+            min_workers=args.min_workers,
+            delta=args.delta,
+            probe=not args.no_probe,
             cookies_file=args.cookies_file  # 传递 cookie 参数
         )
 
@@ -367,3 +451,7 @@ if __name__ == "__main__":
             print("\n🛑 用户停止")
     else:
         print("🎉 无待处理任务或任务文件为空")
+
+    # 4. 可选: 图片入库 (无待处理任务时也执行，补齐上次没下完的图片)
+    if args.image_store:
+        download_images([args.output_dir], args.image_store)
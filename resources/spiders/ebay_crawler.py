@@ -13,37 +13,67 @@ import os
 
 # 1. 优先尝试直接导入 (服务器平铺模式 / PYTHONPATH 已设置模式)
 try:
-    from crawler_base import BaseCrawler, MultiCrawlerManager
+    from crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
 except ImportError:
     # 2. 尝试从资源包导入 (本地打包 EXE 模式)
     try:
-        from resources.spiders.crawler_base import BaseCrawler, MultiCrawlerManager
+        from resources.spiders.crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
     except ImportError:
         # 3. 本地开发模式 (相对路径兜底)
         sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         try:
-            from crawler.spiders.crawler_base import BaseCrawler, MultiCrawlerManager
+            from crawler.spiders.crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
         except ImportError:
             # 最后的倔强：添加当前目录
             sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-            from crawler_base import BaseCrawler, MultiCrawlerManager
+            from crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
+
+try:
+    from record_schema import normalize_records, ProductRecord
+except ImportError:
+    try:
+        from resources.spiders.record_schema import normalize_records, ProductRecord
+    except ImportError:
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+        from record_schema import normalize_records, ProductRecord
+
+try:
+    from image_store import download_images
+except ImportError:
+    try:
+        from resources.spiders.image_store import download_images
+    except ImportError:
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+        from image_store import download_images
 # =========================================================
 
 # 尝试导入基类
 try:
-    from resources.spiders.crawler_base import BaseCrawler, MultiCrawlerManager
+    from resources.spiders.crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
 except ImportError:
     import sys
 
     # 如果在子目录，尝试添加父目录到路径
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from resources.spiders.crawler_base import BaseCrawler, MultiCrawlerManager
+    from resources.spiders.crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
 
 # eBay 基础配置
 EBAY_SEARCH_BASE = "https://www.ebay.com/sch/i.html"
 
 
 class EbayCrawler(BaseCrawler):
+    site = "ebay"
+    # 进度按页记录，每页约 60 条；首页探测直接读结果总数 ("1,234 results for ...")
+    progress_items = 60
+    probe_total_selector = ".srp-controls__count-heading"
+    probe_selector = "li.s-item"
+    probe_page_size = 60
+    # 增量模式按最新上架排序
+    delta_sort = "&_sop=10"
+
+    def search_url(self, keyword, page_num=1):
+        return f"{EBAY_SEARCH_BASE}?_nkw={quote(keyword)}&_sacat=0&_from=R40&_pgn={page_num}"
+
     def extract_products(self, html_content, keyword, page_num):
         """
         eBay 专属 HTML 解析逻辑
@@ -111,15 +141,15 @@ class EbayCrawler(BaseCrawler):
                     if image.startswith("//"): image = "https:" + image
 
                 # 6. 组装数据 (包含 page 字段)
-                record = {
-                    "title": title,
-                    "price": price,
-                    "image": image,
-                    "link": href,
-                    "keyword": keyword,
-                    "platform": "ebay",
-                    "page": page_num  # ✅ 关键：写入页码用于断点
-                }
+                record = ProductRecord(
+                    "ebay",
+                    title=title,
+                    price=price,
+                    image=image,
+                    link=href,
+                    keyword=keyword,
+                    page=page_num  # ✅ 关键：写入页码用于断点
+                )
 
                 if title or href:
                     products.append(record)
@@ -141,12 +171,22 @@ class EbayCrawler(BaseCrawler):
             await self.init_browser()
             if not self.page: return
 
+            self.report("worker_state", state="running")
+
             # 2. 遍历任务
             for keyword, start_page in tasks:
+                # 关键词之间按页面处理量 / 内存决定是否回收页面或浏览器
+                await self.maybe_recycle(keyword)
                 print(f"\n{'=' * 40}\n[Port {self.port}] 爬取: {keyword} (上次断点: Page {start_page})\n{'=' * 40}")
+                self.report("keyword_start", keyword=keyword)
+                # 增量模式按最新上架排序 (_sop=10)，翻到已知商品就停
+                cutoff = self.delta_cutoff(output_dir, keyword, start_page, re.sub(r'[<>:"/\\|?*]', "_", keyword)[:50])
+                sort_arg = self.delta_sort if cutoff is not None else ""
 
                 current_count = 0
                 keyword_products = []
+                # 翻到底 / 够数 / 到达翻页上限才算爬完；页面出错中途退出的下次还要再爬
+                complete = False
 
                 # ✅ 翻页逻辑：直接从下一页开始
                 page_num = start_page + 1
@@ -154,35 +194,46 @@ class EbayCrawler(BaseCrawler):
                 # 循环直到达到数量
                 while current_count < max_count:
                     # 构建搜索 URL
-                    encoded_kw = urllib.parse.quote(keyword)
-                    url = f"{EBAY_SEARCH_BASE}?_nkw={encoded_kw}&_sacat=0&_from=R40&_pgn={page_num}"
+                    url = self.search_url(keyword, page_num) + sort_arg
 
                     print(f"  🌍 [Port {self.port}] 访问第 {page_num} 页... (本轮已抓: {current_count})")
 
                     try:
-                        await self.page.goto(url)
-                        try:
-                            await self.page.wait_for_load_state('domcontentloaded', timeout=15000)
-                        except:
-                            pass
+                        await self.throttle(keyword)
+                        with self.span("navigate", keyword=keyword, page=page_num):
+                            await self.page.goto(url)
+                            self.count("pages_fetched")
+                            try:
+                                await self.page.wait_for_load_state('domcontentloaded', timeout=15000)
+                            except:
+                                pass
 
                         # 简单滚动触发懒加载
-                        await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight/2)")
-                        await asyncio.sleep(1)
-                        await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                        await asyncio.sleep(2)
+                        with self.span("scroll", keyword=keyword, page=page_num):
+                            await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight/2)")
+                            await asyncio.sleep(1)
+                            await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                            await asyncio.sleep(2)
 
                         # 提取数据
-                        html = await self.page.content()
-                        items = self.extract_products(html, keyword, page_num)
+                        with self.span("content", keyword=keyword, page=page_num):
+                            html = await self.page.content()
+                        with self.span("extract", keyword=keyword, page=page_num) as span:
+                            items = self.extract_products(html, keyword, page_num)
+                            span.items = len(items)
 
                         if not items:
                             print(f"  ⚠️ [Port {self.port}] 第 {page_num} 页无数据，结束当前关键词。")
+                            complete = True
                             break
 
                         keyword_products.extend(items)
                         current_count += len(items)
                         print(f"  ✓ [Port {self.port}] 本页提取 {len(items)} 条")
+                        if cutoff is not None and cutoff.check(items):
+                            print(f"  🧭 [Port {self.port}] 第 {page_num} 页大多已爬过，停止翻页")
+                            complete = True
+                            break
 
                         # 准备下一页
                         page_num += 1
@@ -193,16 +244,32 @@ class EbayCrawler(BaseCrawler):
                         break
 
                     # 安全阈值，防止无限翻页
-                    if page_num > 50: break
-
-                # 3. 保存数据 (start_page 用于合并)
+                    if page_num > 50:
+                        complete = True
+                        break
+                else:
+                    complete = True
+
+                # 3. 保存数据 (start_page 用于合并；增量模式本次结果在前，旧数据接在后面)
+                fresh = len(keyword_products)
+                if cutoff is not None:
+                    fresh = len(cutoff.fresh(keyword_products))
+                    keyword_products = cutoff.merge(keyword_products, max_count)
+                    print(f"  🧭 [Port {self.port}] 新商品 {fresh} 条，合并后共 {len(keyword_products)} 条")
                 if keyword_products:
-                    self._save_data(keyword, keyword_products, start_page, output_dir)
+                    with self.span("save", keyword=keyword) as span:
+                        self._save_data(keyword, keyword_products, start_page, output_dir)
+                        span.items = len(keyword_products)
                 else:
                     print(f"⚠️ [Port {self.port}] {keyword} 未提取到新数据")
+                self.report("keyword_done", keyword=keyword, items=fresh, complete=complete,
+                            caught_up=cutoff is not None and cutoff.reached)
+
+            self.report("worker_state", state="finished")
 
         except Exception as e:
             print(f"❌ [Port {self.port}] 进程错误: {e}")
+            self.report("worker_state", state="crashed", error=str(e))
         finally:
             await self.close()
 
@@ -242,11 +309,18 @@ class EbayCrawler(BaseCrawler):
 
             except Exception as e:
                 print(f"    ❌ 合并失败: {e}")
+        else:
+            # 从 0 开始 (新关键词 / 过期重爬): 新结果取代该关键词的旧文件
+            from pathlib import Path
+            files_to_remove.extend(Path(output_dir).glob(f'{safe_name}_products_*.json'))
 
         # 保存
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         if not os.path.exists(output_dir): os.makedirs(output_dir)
 
+        # 统一字段结构 (数值价格 + 币种)，旧文件合并进来的记录一并规范化
+        final_data = normalize_records(final_data, platform="ebay", keyword=product_name)
+
         json_path = os.path.join(output_dir, f"{safe_name}_products_{timestamp}.json")
         with open(json_path, 'w', encoding='utf-8') as f:
             json.dump(final_data, f, ensure_ascii=False, indent=2)
@@ -265,7 +339,7 @@ class EbayCrawler(BaseCrawler):
 
 
 # ==================== 标准任务获取逻辑 ====================
-def get_tasks_from_file(name_file, max_count, data_dir):
+def get_tasks_from_file(name_file, max_count, data_dir, ttl_hours=None):
     """
     任务初始化函数 (标准版)
     """
@@ -284,6 +358,7 @@ def get_tasks_from_file(name_file, max_count, data_dir):
         return []
 
     tasks_progress = {name: 0 for name in product_names}
+    latest = {}  # 关键词 -> 最新数据文件的修改时间
     data_path = Path(data_dir)
 
     if data_path.exists():
@@ -305,6 +380,7 @@ def get_tasks_from_file(name_file, max_count, data_dir):
                     break
 
             if target_task and target_task in tasks_progress:
+                latest[target_task] = max(latest.get(target_task, 0), json_file.stat().st_mtime)
                 try:
                     with open(json_file, 'r', encoding='utf-8') as f:
                         data = json.load(f)
@@ -320,13 +396,8 @@ def get_tasks_from_file(name_file, max_count, data_dir):
                 except:
                     pass
 
-    final_tasks = []
-    for name, progress in tasks_progress.items():
-        if progress > 0:
-            print(f"  🔄 恢复任务: {name} (从进度 {progress} 继续)")
-        final_tasks.append((name, progress))
-
-    return sorted(final_tasks, key=lambda x: x[0])
+    # 3. 按新鲜度规划: TTL 内成功爬完的跳过，过期的从头重爬，没爬完的续爬
+    return plan_tasks(tasks_progress, max_count, CrawlLedger(data_dir), site_ttl("ebay", ttl_hours), latest)
 
 
 # ==================== 主入口 ====================
@@ -338,26 +409,35 @@ def get_tasks_from_file(name_file, max_count, data_dir):
 if __name__ == "__main__":
     # 1. 定义命令行参数 (与 backend_final.py 完美对接)
     parser = argparse.ArgumentParser(description="分布式爬虫节点")
-    parser.add_argument("--workers", type=int, default=2, help="并发窗口数")
-    parser.add_argument("--base_port", type=int, default=9222, help="起始端口")
+    parser.add_argument("--workers", type=int, default=2, help="并发窗口数 (--autoscale 时为上限)")
+    parser.add_argument("--autoscale", action="store_true", help="按吞吐/内存/负载/验证频率自动调整并发数")
+    parser.add_argument("--min_workers", type=int, default=1, help="自动扩缩容的起步并发数")
+    parser.add_argument("--base_port", type=int, default=9222, help="起始端口 (从这里往上申请空闲端口)")
     parser.add_argument("--max_count", type=int, default=100, help="爬取数量")
     parser.add_argument("--output_dir", type=str, required=True, help="数据保存绝对路径")
     parser.add_argument("--task_file", type=str, required=True, help="任务文件路径")
+    parser.add_argument("--ttl_hours", type=float, default=None,
+                        help="成功爬完多少小时内不再重爬 (默认按站点，<= 0 表示不过期)")
+    parser.add_argument("--delta", action="store_true",
+                        help="增量模式: 过期重爬的关键词翻到已爬过的商品就停，新商品合并进旧数据")
+    parser.add_argument("--no_probe", action="store_true",
+                        help="调度前不探测首页 (没有历史记录的关键词按 max_count 估计耗时)")
 
     # 接收额外参数 (如 cookies_file)
     parser.add_argument("--cookies_file", type=str, default=None, help="Cookie文件路径")
+    parser.add_argument("--image_store", type=str, default=None, help="爬完后下载图片到该目录 (按内容哈希去重存储)")
 
     args = parser.parse_args()
 
     print(f"🚀 启动爬虫任务 (PID: {os.getpid()}):")
-    print(f"   - Workers: {args.workers}")
-    print(f"   - Target: {args.max_count}")
+    print(f"   - Workers: {args.workers}" + (f" (自动扩缩容，起步 {args.min_workers})" if args.autoscale else ""))
+    print(f"   - Target: {args.max_count}" + (" (增量模式)" if args.delta else ""))
     print(f"   - Output: {args.output_dir}")
     print(f"   - Task File: {args.task_file}")
     print("=" * 60)
 
     # 2. 获取任务
-    all_tasks = get_tasks_from_file(args.task_file, args.max_count, args.output_dir)
+    all_tasks = get_tasks_from_file(args.task_file, args.max_count, args.output_dir, args.ttl_hours)
 
     if all_tasks:
         print(f"📦 任务总数: {len(all_tasks)}")
@@ -368,6 +448,10 @@ if __name__ == "__main__":
             crawler_class=EbayCrawler,  # <--- 修改这里！！！
             base_port=args.base_port,
             workers=args.workers,
+            autoscale=args.autoscale,
+            min_workers=args.min_workers,
+            delta=args.delta,
+            probe=not args.no_probe,
             cookies_file=args.cookies_file  # 传递 cookie 参数
         )
 
@@ -376,4 +460,8 @@ if __name__ == "__main__":
         except KeyboardInterrupt:
             print("\n🛑 用户停止")
     else:
-        print("🎉 无待处理任务或任务文件为空")
\ No newline at end of file
+        print("🎉 无待处理任务或任务文件为空")
+
+    # 4. 可选: 图片入库 (无待处理任务时也执行，补齐上次没下完的图片)
+    if args.image_store:
+        download_images([args.output_dir], args.image_store)
@@ -11,12 +11,34 @@ from datetime import datetime
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 from bs4 import BeautifulSoup
 import re
-import pyautogui
-import pyperclip
+try:
+    import pyautogui
+    import pyperclip
+except Exception:
+    # 无图形界面 (服务器 / CI) 时导入会失败，此时只能使用解析功能 (extract_products)
+    pyautogui = None
+    pyperclip = None
+import sys
+
+try:
+    from record_schema import normalize_records, ProductRecord
+except ImportError:
+    try:
+        from resources.spiders.record_schema import normalize_records, ProductRecord
+    except ImportError:
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+        from record_schema import normalize_records, ProductRecord
+
+try:
+    from crawler_base import emit_event, rate_limiter, CrawlLedger, DeltaCutoff, fresh_keywords, site_ttl
+except ImportError:
+    from resources.spiders.crawler_base import emit_event, rate_limiter, CrawlLedger, DeltaCutoff, fresh_keywords, site_ttl
 
 
 class GoofishCrawler:
     """Goofish.com 爬虫类"""
+    # 增量模式按最新发布排序 (追加到搜索结果页地址)
+    delta_sort = "&sortField=create&sortValue=desc"
     
     def __init__(self, headless=True, save_html=False):
         """
@@ -147,6 +169,8 @@ class GoofishCrawler:
                 success: True表示成功重新打开且无需验证，False表示仍然需要验证
                 should_skip: True表示应该跳过当前商品，False表示继续当前商品
         """
+        emit_event("counter", name="verifications", value=1)
+        rate_limiter.penalize("goofish")
         print("\n" + "="*60)
         print(f"⚠️  检测到需要验证！")
         print("="*60)
@@ -278,10 +302,7 @@ class GoofishCrawler:
         
         for idx, container in enumerate(product_containers, 1):
             try:
-                product = {
-                    'page': page_num,
-                    'index': idx
-                }
+                product = ProductRecord('goofish', page=page_num, index=idx)
                 
                 # 1. 提取商品链接（从 a 标签的 href 属性）
                 href = container.get('href', '')
@@ -431,7 +452,8 @@ class GoofishCrawler:
 
 
 
-async def crawl_products_automated(products, num_pages_per_product, headless=False, save_html=False, output_dir='goofish_data'):
+async def crawl_products_automated(products, num_pages_per_product, headless=False, save_html=False, output_dir='goofish_data',
+                                   delta=False):
     """
     按照自动化流程爬取多个商品的多页数据
     
@@ -441,6 +463,7 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
         headless: 是否无头模式（默认False，需要显示浏览器进行鼠标操作）
         save_html: 是否保存HTML文件
         output_dir: 输出目录
+        delta: 增量模式，已有数据的商品翻到已爬过的商品就停，新商品合并进旧数据
     
     返回:
         all_products: 所有商品列表
@@ -454,9 +477,21 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
     
     crawler = GoofishCrawler(headless=headless, save_html=save_html)
     all_products = []
+    ledger = CrawlLedger(output_dir)
+
+    # 单浏览器串行爬取: 以固定的 worker 0 上报与 MultiCrawlerManager 相同格式的进度事件
+    def keyword_done(keyword, items, error=None, complete=False):
+        fields = {"error": error} if error else {}
+        if complete:
+            fields["complete"] = True
+        emit_event("keyword_done", port=0, keyword=keyword, items=items, **fields)
+
+    current_keyword = None
     
     try:
         await crawler.init_browser()
+        emit_event("job_start", keywords_total=len(products), workers=1, max_workers=1, autoscale=False)
+        emit_event("worker_state", port=0, state="running")
         
         # 打开首页
         url = "https://www.goofish.com"
@@ -542,11 +577,16 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
                 print(f"{'='*60}")
                 continue
             
+            current_keyword, keyword_error = product_name, None
+            emit_event("keyword_start", port=0, keyword=product_name)
             print(f"\n{'='*60}")
             print(f"商品 {product_idx}/{len(products)}: {product_name}")
             print(f"{'='*60}")
             
             product_products = []  # 当前商品的所有页面数据
+            cutoff = DeltaCutoff.for_keyword(output_dir, product_name) if delta else None
+            if cutoff is not None:
+                print(f"🧭 增量模式: {product_name} 已知 {len(cutoff.known)} 条，翻到已知商品即停")
             should_skip = False  # 初始化跳过标志
             
             # 3. 鼠标移动到搜索栏，点击并清空
@@ -571,7 +611,8 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
             await asyncio.sleep(0.1)
             print("✓ 商品名称已输入")
             
-            # 5. 鼠标移动到搜索按钮，点击搜索
+            # 5. 鼠标移动到搜索按钮，点击搜索 (先按站点限速取令牌)
+            await rate_limiter.acquire("goofish")
             print(f"点击搜索按钮 ({SEARCH_BUTTON_X}, {SEARCH_BUTTON_Y})...")
             pyautogui.moveTo(SEARCH_BUTTON_X, SEARCH_BUTTON_Y, duration=0.3)
             await asyncio.sleep(0.1)
@@ -600,6 +641,7 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
             
             # 如果检测到验证且需要跳过，跳出商品循环
             if should_skip:
+                keyword_done(product_name, 0, error="触发验证，跳过该商品")
                 continue
             
             print("✓ 搜索完成")
@@ -612,6 +654,15 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
             await asyncio.sleep(0.1)
             print("✓ 搜索弹窗已关闭")
             
+            # 增量模式: 搜索结果改为按最新发布排序，翻到已知商品才能说明后面都是旧的
+            if cutoff is not None:
+                try:
+                    await rate_limiter.acquire("goofish")
+                    await crawler.page.goto(crawler.page.url + crawler.delta_sort, wait_until='networkidle', timeout=30000)
+                except Exception as e:
+                    print(f"⚠️  切换到最新发布排序失败，本次不做增量: {e}")
+                    cutoff = None
+            
             # 等待页面加载
             try:
                 await crawler.page.wait_for_load_state('networkidle', timeout=10000)
@@ -641,6 +692,7 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
             
             # 如果检测到验证且需要跳过，跳出商品循环
             if should_skip:
+                keyword_done(product_name, 0, error="触发验证，跳过该商品")
                 continue
             
             # 遍历每个页面
@@ -737,18 +789,24 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
                         products_data = crawler.extract_products(html_content, page_num)
                         product_products.extend(products_data)
                         print(f"  ✓ 第 {page_num} 页完成，提取到 {len(products_data)} 个商品")
+                        if cutoff is not None and cutoff.check(products_data):
+                            print(f"  🧭 第 {page_num} 页大多已爬过，停止翻页")
+                            break
                         
                         # 成功爬取后，重置失败计数和等待时间
                         consecutive_failures = 0
                         current_wait_time = 127
                     else:
                         print(f"  ⚠️ 第 {page_num} 页无法获取HTML内容")
+                        keyword_error = f"第 {page_num} 页无法获取HTML内容"
                 
                 except Exception as e:
                     print(f"  ⚠️ 第 {page_num} 页爬取出错: {e}")
+                    keyword_error = f"第 {page_num} 页爬取出错: {e}"
                 
                 # 8. 如果不是最后一页，点击下一页
                 if page_num < num_pages_per_product:
+                    await rate_limiter.acquire("goofish")
                     print(f"  点击下一页 ({NEXT_PAGE_X}, {NEXT_PAGE_Y})...")
                     pyautogui.moveTo(NEXT_PAGE_X, NEXT_PAGE_Y, duration=0.3)
                     await asyncio.sleep(0.1)
@@ -782,8 +840,20 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
                     print("  ✓ 已跳转到下一页")
             
             # 保存当前商品的数据
+            if should_skip and keyword_error is None:
+                keyword_error = "触发验证，提前结束翻页"
+            items = len(product_products)
             if product_products:
+                for product in product_products:
+                    product.keyword = product_name
                 all_products.extend(product_products)
+                if cutoff is not None:
+                    # 本次结果在前，旧数据接在后面
+                    fresh = len(cutoff.fresh(product_products))
+                    product_products = cutoff.merge(product_products)
+                    print(f"🧭 {product_name} 新商品 {fresh} 条，合并后共 {len(product_products)} 条")
+                # 统一字段结构 (数值价格 + 币种)，写文件时才展开为 dict
+                product_products = normalize_records(product_products, platform="goofish")
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 
                 # 保存JSON
@@ -802,15 +872,29 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
                 print(f"✓ {product_name} 的CSV数据已保存: {csv_file}")
                 
                 print(f"✓ {product_name} 完成，共提取 {len(product_products)} 个商品")
+                # 新文件取代该关键词的旧文件 (过期重爬时不留重复数据)，并记账
+                for old_name in os.listdir(output_dir):
+                    if re.match(rf'^{re.escape(product_name)}_products_(?!{timestamp})\d{{8}}_\d{{6}}\.(json|csv)$', old_name):
+                        os.remove(os.path.join(output_dir, old_name))
+                # 所有页都正常爬完 (或翻到底 / 追上已知商品) 才记账，中途出错的下次还要再爬
+                if keyword_error is None:
+                    ledger.mark_success(product_name, len(product_products))
             else:
                 print(f"\n⚠️ {product_name} 未提取到任何商品")
+            if keyword_error is not None:
+                # 数据文件已经写了，记一笔尝试，免得下次按文件修改时间当成爬完跳过
+                ledger.mark_attempt(product_name)
+            keyword_done(product_name, items, error=keyword_error, complete=keyword_error is None)
+            current_keyword = None
+
+        emit_event("worker_state", port=0, state="finished")
         
         # 保存所有商品的总数据
         if all_products:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             all_json_file = os.path.join(output_dir, f"all_products_{timestamp}.json")
             with open(all_json_file, 'w', encoding='utf-8') as f:
-                json.dump(all_products, f, ensure_ascii=False, indent=2)
+                json.dump(normalize_records(all_products, platform="goofish"), f, ensure_ascii=False, indent=2)
             print(f"\n{'='*60}")
             print(f"✓ 所有商品数据已保存: {all_json_file}")
             print(f"总共爬取到 {len(all_products)} 个商品")
@@ -818,6 +902,10 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
         
     except Exception as e:
         print(f"❌ 爬取过程出错: {e}")
+        if current_keyword is not None:
+            ledger.mark_attempt(current_keyword)
+            keyword_done(current_keyword, 0, error=str(e))
+        emit_event("worker_state", port=0, state="crashed", error=str(e))
         import traceback
         traceback.print_exc()
     finally:
@@ -827,25 +915,26 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
 
 
 
-def get_crawled_products(data_dir='goofish_data', check_html=True):
+def get_crawled_products(data_dir='goofish_data', check_html=True, ttl_hours=None):
     """
     从数据目录中提取已爬取的商品名称
     
     参数:
         data_dir: 数据目录路径
+        ttl_hours: 重爬间隔 (小时)，默认按站点 TTL (crawler_base.SITE_TTL_HOURS)，超过 TTL 的不算已爬取
         check_html: 是否也检查 HTML 文件（如果有 HTML 文件但没有 products 文件，也算已爬取）
     
     返回:
-        set: 已爬取的商品名称集合
+        set: TTL 内爬取过的商品名称集合
     """
     import re
     from pathlib import Path
     
-    crawled_products = set()
+    crawled_at = {}  # 商品名称 -> 最新文件修改时间
     data_path = Path(data_dir)
     
     if not data_path.exists():
-        return crawled_products
+        return set()
     
     # 方法1: 查找所有 *_products_*.json 文件（排除 all_products）
     for json_file in data_path.glob('*_products_*.json'):
@@ -857,23 +946,19 @@ def get_crawled_products(data_dir='goofish_data', check_html=True):
         match = re.match(r'^(.+?)_products_\d{8}_\d{6}\.json$', json_file.name)
         if match:
             product_name = match.group(1)
-            crawled_products.add(product_name)
+            crawled_at[product_name] = max(crawled_at.get(product_name, 0), json_file.stat().st_mtime)
     
     # 方法2: 如果 check_html=True，也检查 HTML 文件
     # 如果有商品名_page_*.html 文件，说明该商品已经爬取过（即使没有生成 products 文件）
     if check_html:
-        html_products = set()
         for html_file in data_path.glob('*_page_*.html'):
             # 格式：商品名_page_页码.html
             match = re.match(r'^(.+?)_page_\d+\.html$', html_file.name)
             if match:
                 product_name = match.group(1)
-                html_products.add(product_name)
-        
-        # 合并结果
-        crawled_products.update(html_products)
+                crawled_at[product_name] = max(crawled_at.get(product_name, 0), html_file.stat().st_mtime)
     
-    return crawled_products
+    return fresh_keywords(crawled_at, CrawlLedger(data_dir), site_ttl("goofish", ttl_hours))
 
 
 def filter_products(products_list, crawled_products):
@@ -12,33 +12,62 @@ import os
 
 # 1. 优先尝试直接导入 (服务器平铺模式 / PYTHONPATH 已设置模式)
 try:
-    from crawler_base import BaseCrawler, MultiCrawlerManager
+    from crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
 except ImportError:
     # 2. 尝试从资源包导入 (本地打包 EXE 模式)
     try:
-        from resources.spiders.crawler_base import BaseCrawler, MultiCrawlerManager
+        from resources.spiders.crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
     except ImportError:
         # 3. 本地开发模式 (相对路径兜底)
         sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         try:
-            from crawler.spiders.crawler_base import BaseCrawler, MultiCrawlerManager
+            from crawler.spiders.crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
         except ImportError:
             # 最后的倔强：添加当前目录
             sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-            from crawler_base import BaseCrawler, MultiCrawlerManager
+            from crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
+
+try:
+    from record_schema import normalize_records, ProductRecord
+except ImportError:
+    try:
+        from resources.spiders.record_schema import normalize_records, ProductRecord
+    except ImportError:
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+        from record_schema import normalize_records, ProductRecord
+
+try:
+    from image_store import download_images
+except ImportError:
+    try:
+        from resources.spiders.image_store import download_images
+    except ImportError:
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+        from image_store import download_images
 # =========================================================
 
 # 尝试导入基类
 try:
-    from resources.spiders.crawler_base import BaseCrawler, MultiCrawlerManager
+    from resources.spiders.crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
 except ImportError:
     import sys
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from resources.spiders.crawler_base import BaseCrawler, MultiCrawlerManager
+    from resources.spiders.crawler_base import BaseCrawler, MultiCrawlerManager, CrawlLedger, plan_tasks, site_ttl
 
 GRAILED_SHOP_BASE = "https://www.grailed.com/shop"
 
 class GrailedCrawler(BaseCrawler):
+    site = "grailed"
+    # 首页探测: 数首屏商品，不满一屏说明结果就这么多
+    probe_selector = 'div[class*="UserItem_root"]'
+    probe_page_size = 40
+
+    # 增量模式按最新上架排序
+    delta_sort = "&sort=mostrecent"
+
+    def search_url(self, keyword):
+        return f"{GRAILED_SHOP_BASE}?query={quote(keyword)}"
+
     def extract_products(self, html_content, skip_count=0):
         """
         Grailed 专属解析逻辑 - 基于用户提供的 HTML 结构 (UserItem_root)
@@ -75,7 +104,7 @@ class GrailedCrawler(BaseCrawler):
         for container in containers_to_process:
             try:
                 local_index += 1
-                product = {'index': local_index}
+                product = ProductRecord('grailed', index=local_index)
 
                 # --- 1. 提取链接 ---
                 # HTML: <a href="/listings/..." ... class="UserItem_link__kgEWg">
@@ -172,70 +201,101 @@ class GrailedCrawler(BaseCrawler):
             await self.init_browser()
             if not self.page: return
 
+            self.report("worker_state", state="running")
+
             # 2. 遍历任务
             for keyword, start_index in tasks:
+                # 关键词之间按页面处理量 / 内存决定是否回收页面或浏览器
+                await self.maybe_recycle(keyword)
                 print(f"\n{'='*40}\n[Port {self.port}] 爬取: {keyword} (Index {start_index})\n{'='*40}")
+                self.report("keyword_start", keyword=keyword)
+                cutoff = self.delta_cutoff(output_dir, keyword, start_index, re.sub(r'[<>:"/\\|?*]', "_", keyword)[:50])
 
-                url = f"{GRAILED_SHOP_BASE}?query={quote(keyword)}"
+                url = self.search_url(keyword)
+                if cutoff is not None:
+                    url += self.delta_sort
 
                 try:
-                    await self.page.goto(url, timeout=60000)
-                    try:
-                        await self.page.wait_for_load_state('networkidle', timeout=15000)
-                    except: pass
+                    await self.throttle(keyword)
+                    with self.span("navigate", keyword=keyword):
+                        await self.page.goto(url, timeout=60000)
+                        self.count("pages_fetched")
+                        try:
+                            await self.page.wait_for_load_state('networkidle', timeout=15000)
+                        except: pass
                 except Exception as e:
                     print(f"❌ [Port {self.port}] 页面跳转失败: {e}")
+                    self.report("keyword_done", keyword=keyword, items=0, error=str(e))
                     continue
 
                 # --- 无限滚动逻辑 ---
                 current_count = 0
                 retry_count = 0
+                # 滚够数量或增量模式追上已知商品才算爬完；连续无新内容放弃的下次还要再爬
+                complete = False
 
-                while current_count < max_count:
-                    # 滚动到底部
-                    await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                    await asyncio.sleep(2)
-
-                    # 实时计算当前页面已加载的商品数
-                    # 使用与 extract_products 相同的逻辑计数
-                    item_count = await self.page.evaluate("""() => {
-                        return document.querySelectorAll('div[class*="UserItem_root"]').length
-                    }""")
-
-                    # 如果 js 计数失败，使用备用计数
-                    if item_count == 0:
-                         item_count = await self.page.evaluate("""() => {
-                            return document.querySelectorAll('a[href*="/listings/"]').length
-                        }""")
-
-                    if item_count > current_count:
-                        current_count = item_count
-                        retry_count = 0
-                        print(f"  📉 [Port {self.port}] 滚动加载中... (当前: {current_count})", end='\r')
-                    else:
-                        retry_count += 1
-                        print(f"  ⚠️ [Port {self.port}] 无新内容 ({retry_count}/5)...")
-                        # 尝试回滚触发懒加载
-                        await self.page.evaluate("window.scrollBy(0, -800)")
-                        await asyncio.sleep(1)
+                with self.span("scroll", keyword=keyword) as scroll_span:
+                    while current_count < max_count:
+                        # 滚动到底部
                         await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                        await asyncio.sleep(2)
 
-                        if retry_count >= 5:
-                            print(f"  🛑 [Port {self.port}] 已达底部，停止滚动")
-                            break
+                        # 实时计算当前页面已加载的商品数
+                        # 使用与 extract_products 相同的逻辑计数
+                        item_selector = 'div[class*="UserItem_root"]'
+                        item_count = await self.page.evaluate("""() => {
+                            return document.querySelectorAll('div[class*="UserItem_root"]').length
+                        }""")
 
-                    # 检查是否已经满足数量要求（加上之前的进度）
-                    # 注意：这里我们是重新跑的，所以只要当前页面的数量够了就行
-                    if current_count >= (max_count - start_index) + 20: # 多抓一点余量
-                        break
+                        # 如果 js 计数失败，使用备用计数
+                        if item_count == 0:
+                             item_selector = 'a[href*="/listings/"]'
+                             item_count = await self.page.evaluate("""() => {
+                                return document.querySelectorAll('a[href*="/listings/"]').length
+                            }""")
+
+                        if item_count > current_count:
+                            batch_start, current_count = current_count, item_count
+                            retry_count = 0
+                            print(f"  📉 [Port {self.port}] 滚动加载中... (当前: {current_count})", end='\r')
+                            if cutoff is not None and cutoff.check(
+                                    await self.loaded_links(item_selector, 'a[href*="/listings/"]', batch_start)):
+                                print(f"\n  🧭 [Port {self.port}] 本批 {current_count - batch_start} 条大多已爬过，停止滚动")
+                                complete = True
+                                break
+                        else:
+                            retry_count += 1
+                            print(f"  ⚠️ [Port {self.port}] 无新内容 ({retry_count}/5)...")
+                            # 尝试回滚触发懒加载
+                            await self.page.evaluate("window.scrollBy(0, -800)")
+                            await asyncio.sleep(1)
+                            await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+
+                            if retry_count >= 5:
+                                print(f"  🛑 [Port {self.port}] 已达底部，停止滚动")
+                                break
+
+                        # 检查是否已经满足数量要求（加上之前的进度）
+                        # 注意：这里我们是重新跑的，所以只要当前页面的数量够了就行
+                        if current_count >= (max_count - start_index) + 20: # 多抓一点余量
+                            complete = True
+                            break
 
-                    await asyncio.sleep(1)
+                        await asyncio.sleep(1)
+                    else:
+                        complete = True
+                    scroll_span.items = current_count
 
                 # --- 提取与保存 ---
                 print(f"\n[Port {self.port}] 开始提取数据...")
+                saved = 0
+                error = None
                 try:
-                    html = await self.page.content()
-                    data = self.extract_products(html, skip_count=start_index)
+                    with self.span("content", keyword=keyword):
+                        html = await self.page.content()
+                    with self.span("extract", keyword=keyword) as span:
+                        data = self.extract_products(html, skip_count=start_index)
+                        span.items = len(data)
 
                     if data:
                         # 截断到需要的数量
@@ -243,14 +303,29 @@ class GrailedCrawler(BaseCrawler):
                         if len(data) > needed:
                             data = data[:needed]
 
-                        self._save_data(keyword, data, start_index, output_dir)
+                        saved = len(data)
+                        if cutoff is not None:
+                            # 本次结果在前，旧数据接在后面；进度只统计新上架的商品
+                            saved = len(cutoff.fresh(data))
+                            data = cutoff.merge(data, max_count)
+                            print(f"  🧭 [Port {self.port}] 新商品 {saved} 条，合并后共 {len(data)} 条")
+
+                        with self.span("save", keyword=keyword) as span:
+                            self._save_data(keyword, data, start_index, output_dir)
+                            span.items = len(data)
                     else:
                         print(f"  ⚠️ [Port {self.port}] 未提取到有效数据")
                 except Exception as e:
                     print(f"  ❌ [Port {self.port}] 处理失败: {e}")
+                    error = str(e)
+                self.report("keyword_done", keyword=keyword, items=saved, error=error, complete=complete,
+                            caught_up=cutoff is not None and cutoff.reached)
+
+            self.report("worker_state", state="finished")
 
         except Exception as e:
             print(f"❌ [Port {self.port}] 进程崩溃: {e}")
+            self.report("worker_state", state="crashed", error=str(e))
         finally:
             await self.close()
 
@@ -286,11 +361,18 @@ class GrailedCrawler(BaseCrawler):
 
             except Exception as e:
                 print(f"    ❌ 合并失败: {e}")
+        else:
+            # 从 0 开始 (新关键词 / 过期重爬): 新结果取代该关键词的旧文件
+            from pathlib import Path
+            files_to_remove.extend(Path(output_dir).glob(f'{safe_name}_products_*.json'))
 
         # 保存
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         if not os.path.exists(output_dir): os.makedirs(output_dir)
 
+        # 统一字段结构 (数值价格 + 币种)，旧文件合并进来的记录一并规范化
+        final_data = normalize_records(final_data, platform="grailed", keyword=product_name)
+
         # 保存 JSON
         json_path = os.path.join(output_dir, f"{safe_name}_products_{timestamp}.json")
         try:
@@ -310,7 +392,7 @@ class GrailedCrawler(BaseCrawler):
                 except: pass
 
 # ==================== 标准任务获取逻辑 ====================
-def get_tasks_from_file(name_file, max_count, data_dir):
+def get_tasks_from_file(name_file, max_count, data_dir, ttl_hours=None):
     import json
     from pathlib import Path
     try:
@@ -323,6 +405,7 @@ def get_tasks_from_file(name_file, max_count, data_dir):
         return []
 
     tasks_progress = {name: 0 for name in product_names}
+    latest = {}  # 关键词 -> 最新数据文件的修改时间
     data_path = Path(data_dir)
 
     if data_path.exists():
@@ -340,6 +423,7 @@ def get_tasks_from_file(name_file, max_count, data_dir):
                     break
 
             if target_task and target_task in tasks_progress:
+                latest[target_task] = max(latest.get(target_task, 0), json_file.stat().st_mtime)
                 try:
                     with open(json_file, 'r', encoding='utf-8') as f:
                         data = json.load(f)
@@ -350,14 +434,8 @@ def get_tasks_from_file(name_file, max_count, data_dir):
                             tasks_progress[target_task] = current
                 except: pass
 
-    final_tasks = []
-    for name, progress in tasks_progress.items():
-        if progress < max_count:
-            if progress > 0:
-                print(f"  🔄 恢复任务: {name} (从 {progress} 继续)")
-            final_tasks.append((name, progress))
-
-    return sorted(final_tasks, key=lambda x: x[0])
+    # 3. 按新鲜度规划: TTL 内成功爬完的跳过，过期的从头重爬，没爬完的续爬
+    return plan_tasks(tasks_progress, max_count, CrawlLedger(data_dir), site_ttl("grailed", ttl_hours), latest)
 
 # ==================== 主入口 ====================
 # ... (get_tasks_from_file 函数保持不变) ...
@@ -365,26 +443,35 @@ def get_tasks_from_file(name_file, max_count, data_dir):
 if __name__ == "__main__":
     # 1. 定义命令行参数 (与 backend_final.py 完美对接)
     parser = argparse.ArgumentParser(description="分布式爬虫节点")
-    parser.add_argument("--workers", type=int, default=2, help="并发窗口数")
-    parser.add_argument("--base_port", type=int, default=9222, help="起始端口")
+    parser.add_argument("--workers", type=int, default=2, help="并发窗口数 (--autoscale 时为上限)")
+    parser.add_argument("--autoscale", action="store_true", help="按吞吐/内存/负载/验证频率自动调整并发数")
+    parser.add_argument("--min_workers", type=int, default=1, help="自动扩缩容的起步并发数")
+    parser.add_argument("--base_port", type=int, default=9222, help="起始端口 (从这里往上申请空闲端口)")
     parser.add_argument("--max_count", type=int, default=100, help="爬取数量")
     parser.add_argument("--output_dir", type=str, required=True, help="数据保存绝对路径")
     parser.add_argument("--task_file", type=str, required=True, help="任务文件路径")
+    parser.add_argument("--ttl_hours", type=float, default=None,
+                        help="成功爬完多少小时内不再重爬 (默认按站点，<= 0 表示不过期)")
+    parser.add_argument("--delta", action="store_true",
+                        help="增量模式: 过期重爬的关键词翻到已爬过的商品就停，新商品合并进旧数据")
+    parser.add_argument("--no_probe", action="store_true",
+                        help="调度前不探测首页 (没有历史记录的关键词按 max_count 估计耗时)")
 
     # 接收额外参数 (如 cookies_file)
     parser.add_argument("--cookies_file", type=str, default=None, help="Cookie文件路径")
+    parser.add_argument("--image_store", type=str, default=None, help="爬完后下载图片到该目录 (按内容哈希去重存储)")
 
     args = parser.parse_args()
 
     print(f"🚀 启动爬虫任务 (PID: {os.getpid()}):")
-    print(f"   - Workers: {args.workers}")
-    print(f"   - Target: {args.max_count}")
+    print(f"   - Workers: {args.workers}" + (f" (自动扩缩容，起步 {args.min_workers})" if args.autoscale else ""))
+    print(f"   - Target: {args.max_count}" + (" (增量模式)" if args.delta else ""))
     print(f"   - Output: {args.output_dir}")
     print(f"   - Task File: {args.task_file}")
     print("=" * 60)
 
     # 2. 获取任务
-    all_tasks = get_tasks_from_file(args.task_file, args.max_count, args.output_dir)
+    all_tasks = get_tasks_from_file(args.task_file, args.max_count, args.output_dir, args.ttl_hours)
 
     if all_tasks:
         print(f"📦 任务总数: {len(all_tasks)}")
@@ -395,6 +482,10 @@ if __name__ == "__main__":
             crawler_class=GrailedCrawler,  # <--- 修改这里！！！
             base_port=args.base_port,
             workers=args.workers,
+            autoscale=args.autoscale,
+            min_workers=args.min_workers,
+            delta=args.delta,
+            probe=not args.no_probe,
             cookies_file=args.cookies_file  # 传递 cookie 参数
         )
 
@@ -404,3 +495,7 @@ if __name__ == "__main__":
             print("\n🛑 用户停止")
     else:
         print("🎉 无待处理任务或任务文件为空")
+
+    # 4. 可选: 图片入库 (无待处理任务时也执行，补齐上次没下完的图片)
+    if args.image_store:
+        download_images([args.output_dir], args.image_store)
@@ -0,0 +1,421 @@
+"""
+商品图片下载 + 内容寻址存储 (可选的后处理阶段，替代零散的下载脚本)
+- 各爬虫只记录图片 URL (record["image"])，这里统一并发下载
+- 连接池: 每个主机复用 keep-alive 连接；每个主机同时最多 --per_host 个请求，避免被 CDN 限流
+- 失败重试 (指数退避，尊重 Retry-After)；404 / 非图片内容不重试
+- 断点续传: 已入库的 URL 查清单 (manifest.jsonl) 直接跳过；下载一半的 .part 用 Range 接着下
+- 按内容 sha256 存储: objects/ab/cd/<sha256>.<ext>，不同关键词 / 平台的同一张图只存一份
+- 结果回写到记录: image_hash (sha256) / image_file (相对存储根目录的路径)
+
+用法 (爬取结束后运行，会原地改写 *_products_*.json):
+    python3 image_store.py /root/depop_data /root/grailed_data --store /root/image_store
+"""
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+
+try:
+    from record_schema import DIR_PLATFORMS, FILE_PATTERN
+except ImportError:
+    try:
+        from resources.spiders.record_schema import DIR_PLATFORMS, FILE_PATTERN
+    except ImportError:
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+        from record_schema import DIR_PLATFORMS, FILE_PATTERN
+
+# ==================== 下载参数 ====================
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+ACCEPT = "image/avif,image/webp,image/apng,image/*,*/*;q=0.8"
+# 国内站的图床校验 Referer，不带会返回占位图或 403
+REFERERS = {
+    "goofish": "https://www.goofish.com/",
+    "vips": "https://www.vip.com/",
+    "xiaomi": "https://www.xiaomiyoupin.com/",
+}
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+REDIRECT_STATUS = {301, 302, 303, 307, 308}
+MAX_REDIRECTS = 5
+CHUNK_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+    "image/pjpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/gif": "gif",
+    "image/avif": "avif",
+    "image/bmp": "bmp",
+}
+
+
+class ImageError(Exception):
+    """不可重试的失败 (404、不是图片...)"""
+
+
+class RetryableError(ImageError):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def normalize_url(url):
+    """协议相对地址补 https，非 http(s) (data: / 空) 返回 None"""
+    url = (url or "").strip()
+    if url.startswith("//"):
+        url = "https:" + url
+    return url if url.startswith(("http://", "https://")) else None
+
+
+def sniff_ext(head, content_type=""):
+    """先看文件头，再看 Content-Type；都不像图片返回 None (多半是验证页 / 错误页)"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return "avif"
+    if head.startswith(b"BM"):
+        return "bmp"
+    return CONTENT_TYPES.get((content_type or "").split(";")[0].strip().lower())
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ==================== 内容寻址存储 ====================
+class ImageStore:
+    """
+    root/
+      objects/ab/cd/<sha256>.<ext>   图片本体，同内容只存一份
+      partial/<sha1(url)>.part       下载中的文件 (中断后续传)
+      manifest.jsonl                 url -> hash 清单，只追加
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.partial = self.root / "partial"
+        self.manifest_path = self.root / "manifest.jsonl"
+        self.partial.mkdir(parents=True, exist_ok=True)
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.manifest_path.exists():
+            return
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # 中断时可能只写了半行
+                # 对象文件被手动删掉的条目作废，重新下载
+                if (self.root / entry["file"]).exists():
+                    self.entries[entry["url"]] = entry
+
+    def get(self, url):
+        return self.entries.get(url)
+
+    def part_path(self, url):
+        return self.partial / (hashlib.sha1(url.encode("utf-8")).hexdigest() + ".part")
+
+    def commit(self, url, part, ext):
+        """把下载完的 .part 按内容哈希入库，返回 (清单条目, 是否与已有图片重复)"""
+        digest = file_sha256(part)
+        rel = f"objects/{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+        target = self.root / rel
+        size = part.stat().st_size
+        with self._lock:
+            deduped = target.exists()
+            if deduped:
+                part.unlink()
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(part, target)
+            entry = {"url": url, "hash": digest, "file": rel, "size": size}
+            self.entries[url] = entry
+            with open(self.manifest_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return entry, deduped
+
+
+# ==================== 连接池 ====================
+class HostPool:
+    """每个 (协议, 主机) 一组空闲 keep-alive 连接 + 一个并发信号量"""
+
+    def __init__(self, per_host=4, timeout=20):
+        self.per_host = per_host
+        self.timeout = timeout
+        self._idle = defaultdict(list)
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def slot(self, key):
+        with self._lock:
+            if key not in self._slots:
+                self._slots[key] = threading.BoundedSemaphore(self.per_host)
+            return self._slots[key]
+
+    def acquire(self, key):
+        with self._lock:
+            if self._idle[key]:
+                return self._idle[key].pop()
+        scheme, host = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, timeout=self.timeout)
+        return http.client.HTTPConnection(host, timeout=self.timeout)
+
+    def release(self, key, conn, reusable):
+        if not reusable:
+            conn.close()
+            return
+        with self._lock:
+            self._idle[key].append(conn)
+
+    def close(self):
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+
+# ==================== 并发下载 ====================
+def interleave_by_host(urls):
+    """按主机轮流排列，避免前面一长串同主机 URL 把线程都堵在同一个信号量上"""
+    by_host = defaultdict(deque)
+    for url in urls:
+        by_host[urlsplit(url).netloc].append(url)
+    queues = list(by_host.values())
+    ordered = []
+    while queues:
+        for q in queues:
+            ordered.append(q.popleft())
+        queues = [q for q in queues if q]
+    return ordered
+
+
+class ImageDownloader:
+    def __init__(self, store, workers=16, per_host=4, retries=3, timeout=20):
+        self.store = store
+        self.workers = workers
+        self.retries = retries
+        self.pool = HostPool(per_host, timeout)
+
+    def _get(self, url, headers, part):
+        """发一次 GET；200 覆盖写入 part，206 追加；返回 (状态码, 响应)"""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        with self.pool.slot(key):
+            conn = self.pool.acquire(key)
+            reusable = False
+            try:
+                conn.request("GET", path, headers=headers)
+                resp = conn.getresponse()
+                if resp.status in (200, 206):
+                    with open(part, "ab" if resp.status == 206 else "wb") as f:
+                        for chunk in iter(lambda: resp.read(CHUNK_SIZE), b""):
+                            f.write(chunk)
+                    # 对端提前断开时 http.client 不报错，只是读不满 Content-Length；已写入的部分留给下次续传
+                    if resp.length:
+                        raise http.client.IncompleteRead(b"", resp.length)
+                else:
+                    resp.read()
+                reusable = not resp.will_close
+                return resp.status, resp
+            finally:
+                self.pool.release(key, conn, reusable)
+
+    def _download(self, url, referer=None):
+        part = self.store.part_path(url)
+        target = url
+        for _ in range(MAX_REDIRECTS + 1):
+            offset = part.stat().st_size if part.exists() else 0
+            headers = {"User-Agent": USER_AGENT, "Accept": ACCEPT}
+            if referer:
+                headers["Referer"] = referer
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+            status, resp = self._get(target, headers, part)
+            if status in REDIRECT_STATUS and resp.getheader("Location"):
+                target = urljoin(target, resp.getheader("Location"))
+                continue
+            if status == 416:
+                # 续传位置无效 (服务器上的文件变了)，丢掉 .part 从头下
+                part.unlink(missing_ok=True)
+                raise RetryableError("HTTP 416")
+            if status in RETRY_STATUS:
+                retry_after = resp.getheader("Retry-After")
+                raise RetryableError(f"HTTP {status}",
+                                     int(retry_after) if retry_after and retry_after.isdigit() else None)
+            if status not in (200, 206):
+                raise ImageError(f"HTTP {status}")
+            break
+        else:
+            raise ImageError("重定向次数过多")
+
+        with open(part, "rb") as f:
+            head = f.read(16)
+        ext = sniff_ext(head, resp.getheader("Content-Type"))
+        if ext is None:
+            part.unlink(missing_ok=True)
+            raise ImageError(f"不是图片 ({resp.getheader('Content-Type')})")
+        return self.store.commit(url, part, ext)
+
+    def fetch(self, url, referer=None):
+        """下载单个 URL，返回 (清单条目, 状态)；状态: cached / stored / deduped"""
+        entry = self.store.get(url)
+        if entry:
+            return entry, "cached"
+        for attempt in range(self.retries + 1):
+            try:
+                entry, deduped = self._download(url, referer)
+                return entry, "deduped" if deduped else "stored"
+            except RetryableError as e:
+                error, delay = e, e.retry_after
+            except ImageError:
+                raise
+            except (OSError, http.client.HTTPException) as e:
+                error, delay = e, None
+            if attempt < self.retries:
+                time.sleep(min(delay or 2 ** attempt + random.random(), 60))
+        raise ImageError(f"重试 {self.retries} 次后仍失败: {error}")
+
+    def run(self, urls):
+        """
+        urls: {url: referer}
+        返回统计 {total, cached, stored, deduped, failed, bytes, seconds}
+        """
+        stats = {"total": len(urls), "cached": 0, "stored": 0, "deduped": 0, "failed": 0, "bytes": 0}
+        pending = [url for url in urls if self.store.get(url) is None]
+        stats["cached"] = len(urls) - len(pending)
+        started = time.time()
+        print(f"🖼️  图片共 {len(urls)} 张，已入库 {stats['cached']}，待下载 {len(pending)} "
+              f"({self.workers} 线程，每主机 {self.pool.per_host} 并发)")
+        failures = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(self.fetch, url, urls[url]): url for url in interleave_by_host(pending)}
+                for done, future in enumerate(as_completed(futures), 1):
+                    try:
+                        entry, status = future.result()
+                        stats[status] += 1
+                        if status == "stored":
+                            stats["bytes"] += entry["size"]
+                    except Exception as e:
+                        stats["failed"] += 1
+                        failures.append((futures[future], e))
+                    if done % 200 == 0:
+                        print(f"  ⏳ {done}/{len(pending)} (失败 {stats['failed']})")
+        finally:
+            self.pool.close()
+        stats["seconds"] = round(time.time() - started, 2)
+        for url, e in failures[:10]:
+            print(f"  ⚠️ {url}: {e}")
+        if len(failures) > 10:
+            print(f"  ⚠️ ... 另有 {len(failures) - 10} 张失败 (重跑即可续传)")
+        return stats
+
+
+# ==================== 记录回写 ====================
+def record_files(data_dirs):
+    files = []
+    for data_dir in data_dirs:
+        platform = DIR_PLATFORMS.get(Path(data_dir).name)
+        for path in sorted(Path(data_dir).glob('*_products_*.json')):
+            if FILE_PATTERN.match(path.name):
+                files.append((path, platform))
+    return files
+
+
+def load_records(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"⚠️ 跳过 {path}: {e}")
+        return None
+    return data if isinstance(data, list) else None
+
+
+def _write_back(path, data, store):
+    """给记录填上 image_hash / image_file，有变化才改写文件"""
+    changed = 0
+    for record in data:
+        if not isinstance(record, dict):
+            continue
+        entry = store.get(normalize_url(record.get("image")) or "")
+        if entry and (record.get("image_hash") != entry["hash"] or record.get("image_file") != entry["file"]):
+            record["image_hash"] = entry["hash"]
+            record["image_file"] = entry["file"]
+            changed += 1
+    if changed:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    return changed
+
+
+def download_images(data_dirs, store_dir, workers=16, per_host=4, retries=3, timeout=20):
+    """
+    扫描数据目录里的记录 -> 并发下载图片入库 -> 把哈希和路径写回记录
+    应在爬取结束后运行 (爬虫保存时会整体改写同一个文件)
+    """
+    files = record_files(data_dirs)
+    urls = {}
+    for path, platform in files:
+        for record in load_records(path) or []:
+            if isinstance(record, dict):
+                url = normalize_url(record.get("image"))
+                if url:
+                    urls.setdefault(url, REFERERS.get(record.get("platform") or platform))
+
+    store = ImageStore(store_dir)
+    stats = ImageDownloader(store, workers, per_host, retries, timeout).run(urls)
+
+    stats["records"] = 0
+    for path, _ in files:
+        data = load_records(path)
+        if data:
+            stats["records"] += _write_back(path, data, store)
+    stats["files"] = len(files)
+    print(f"✅ 图片入库完成: 新增 {stats['stored']} 张 ({stats['bytes'] / 1024 / 1024:.1f} MB)，"
+          f"重复内容 {stats['deduped']}，已存在 {stats['cached']}，失败 {stats['failed']}，"
+          f"回写 {stats['records']} 条记录，耗时 {stats['seconds']}s")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="下载商品图片到内容寻址存储")
+    parser.add_argument("data_dirs", nargs="+", help="数据目录 (如 /root/depop_data)")
+    parser.add_argument("--store", type=str, required=True, help="图片存储根目录")
+    parser.add_argument("--workers", type=int, default=16, help="下载线程数")
+    parser.add_argument("--per_host", type=int, default=4, help="每个主机的并发上限")
+    parser.add_argument("--retries", type=int, default=3, help="失败重试次数")
+    parser.add_argument("--timeout", type=float, default=20, help="单次请求超时 (秒)")
+    args = parser.parse_args()
+
+    download_images(args.data_dirs, args.store, args.workers, args.per_host, args.retries, args.timeout)
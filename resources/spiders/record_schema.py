@@ -0,0 +1,512 @@
+"""
+统一商品记录结构
+- 各爬虫字段名不一致 (Platform / platform、Category ...)，价格是 "$250" / "236" / "¥1,299" / "N/A" 这样的字符串
+- 保存时统一映射为同一套字段：数值价格 + 币种，原始价格文本保留在 price_raw
+- 批量向量化转换 (pandas)；节点未安装 pandas 时退化为逐条转换，结果一致
+- 已规范化的数据再次转换结果不变，可直接对历史文件回填:
+    python3 record_schema.py --backfill /root/depop_data /root/ebay_data ...
+- 校验向量化与逐条两条路径结果一致:
+    python3 record_schema.py --check /root/depop_data ...
+"""
+import argparse
+import json
+import math
+import os
+import re
+import time
+from pathlib import Path
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+# ==================== 字段定义 ====================
+# (字段名, 类型)；未列出的平台专有字段收进 extra，不丢数据
+SCHEMA_FIELDS = [
+    ("platform", str),
+    ("keyword", str),
+    ("title", str),
+    ("price", float),
+    ("currency", str),
+    ("original_price", float),
+    ("discount", str),
+    ("discount_rate", float),  # 实付 / 原价，例如 2.8折 -> 0.28
+    ("link", str),
+    ("image", str),
+    ("image_hash", str),  # 图片内容 sha256，由 image_store.py 回写
+    ("image_file", str),  # 图片在存储根目录下的相对路径
+    ("seller", str),
+    ("seller_location", str),
+    ("brand", str),
+    ("category", str),
+    ("sales", str),
+    ("price_raw", str),
+]
+# 续传逻辑依赖这两个字段 "是否存在" (翻页模式 / 滚动模式)，来源数据没有时不补
+POSITION_FIELDS = ("page", "index")
+FIELD_NAMES = [name for name, _ in SCHEMA_FIELDS]
+KNOWN_FIELDS = set(FIELD_NAMES) | set(POSITION_FIELDS) | {"extra"}
+# 原样保留的文本字段 (platform / keyword 另有默认值逻辑)
+TEXT_FIELDS = ("title", "link", "image", "image_hash", "image_file", "seller", "seller_location",
+               "brand", "category", "sales", "discount")
+
+# 旧字段名 -> 统一字段名
+FIELD_ALIASES = {
+    "Platform": "platform",
+    "Category": "category",
+}
+
+# 没有币种符号时按平台默认
+PLATFORM_CURRENCY = {
+    "depop": "USD",
+    "ebay": "USD",
+    "grailed": "USD",
+    "goofish": "CNY",
+    "vips": "CNY",
+    "xiaomi": "CNY",
+}
+
+# 长的符号放前面，保证 "US $" 不被 "$" 抢先匹配
+CURRENCY_SYMBOLS = [
+    ("US $", "USD"), ("C $", "CAD"), ("AU $", "AUD"), ("HK$", "HKD"),
+    ("£", "GBP"), ("€", "EUR"), ("￥", "CNY"), ("¥", "CNY"), ("$", "USD"),
+]
+CURRENCY_PATTERN = "(" + "|".join(re.escape(sym) for sym, _ in CURRENCY_SYMBOLS) + ")"
+CURRENCY_BY_SYMBOL = dict(CURRENCY_SYMBOLS)
+NUMBER_PATTERN = r"(\d+(?:\.\d+)?)"
+ZHE_PATTERN = r"(\d+(?:\.\d+)?)\s*折"
+PERCENT_PATTERN = r"(\d+(?:\.\d+)?)\s*%"
+# 这些价格文本代表 "没取到价格"
+MISSING_PRICES = {"", "0", "N/A", "n/a", "None", "nan"}
+
+
+# ==================== 抓取阶段的商品记录 ====================
+# 各平台在公共字段之外额外解析的字段
+PLATFORM_FIELDS = {
+    "depop": ("seller",),
+    "ebay": (),
+    "grailed": ("category",),
+    "goofish": ("seller_location", "seller_avatar"),
+    "vips": ("product_id", "original_price", "discount", "brand"),
+    "xiaomi": ("product_id", "original_price", "discount", "sales"),
+}
+
+
+class ProductRecord:
+    """
+    解析阶段使用的紧凑商品记录 (__slots__，无逐条 __dict__)
+    - ProductRecord('depop', ...) 返回该平台的子类，只带公共字段 + 平台字段；platform 是类属性，不占实例空间
+    - 兼容原来的 dict 写法: product['price'] = ...、product.get('title')，旧键名 Platform / Category 自动映射
+    - 未赋值的字段序列化时省略
+    """
+    __slots__ = ("page", "index", "keyword", "title", "price", "link", "image")
+    platform = None
+    _fields = __slots__
+    _types = {}
+
+    def __new__(cls, platform=None, **fields):
+        if cls is ProductRecord and platform in PLATFORM_FIELDS:
+            cls = cls.for_platform(platform)
+        return object.__new__(cls)
+
+    def __init__(self, platform=None, **fields):
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def for_platform(cls, platform):
+        record_type = cls._types.get(platform)
+        if record_type is None:
+            extra = PLATFORM_FIELDS[platform]
+            record_type = type(f"{platform.capitalize()}Record", (cls,), {
+                "__slots__": extra,
+                "platform": platform,
+                "_fields": cls.__slots__ + extra,
+            })
+            cls._types[platform] = record_type
+        return record_type
+
+    def __setitem__(self, key, value):
+        key = FIELD_ALIASES.get(key, key)
+        if key == "platform":
+            # 平台由记录类型决定，兼容 product['Platform'] = 'depop' 的旧写法
+            return
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __getitem__(self, key):
+        value = getattr(self, FIELD_ALIASES.get(key, key), None)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return getattr(self, FIELD_ALIASES.get(key, key), None) is not None
+
+    def get(self, key, default=None):
+        value = getattr(self, FIELD_ALIASES.get(key, key), None)
+        return default if value is None else value
+
+    def keys(self):
+        return list(self.to_dict())
+
+    def to_dict(self):
+        data = {"platform": self.platform} if self.platform else {}
+        for name in self._fields:
+            value = getattr(self, name, None)
+            if value is not None:
+                data[name] = value
+        return data
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+def _as_dict(item):
+    return item.to_dict() if isinstance(item, ProductRecord) else item
+
+
+# ==================== 逐条转换 (无 pandas 时) ====================
+def _parse_number(text):
+    match = re.search(NUMBER_PATTERN, text.replace(",", ""))
+    return float(match.group(1)) if match else None
+
+
+def _parse_discount_rate(text):
+    match = re.search(ZHE_PATTERN, text)
+    if match:
+        return float(match.group(1)) / 10
+    match = re.search(PERCENT_PATTERN, text)
+    if match:
+        return 1 - float(match.group(1)) / 100
+    return None
+
+
+def _text(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return str(value)
+
+
+def _normalize_one(item, platform=None, keyword=None):
+    src = dict(item)
+    for old, new in FIELD_ALIASES.items():
+        if old in src:
+            value = src.pop(old)
+            if not _text(src.get(new)):
+                src[new] = value
+
+    record = {}
+    record["platform"] = _text(src.get("platform")).strip() or platform or ""
+    record["keyword"] = _text(src.get("keyword")).strip() or keyword or ""
+    for name in TEXT_FIELDS:
+        record[name] = _text(src.get(name))
+
+    # 已规范化的记录以 price_raw 为准，保证重复转换结果不变
+    price_raw = _text(src["price_raw"] if "price_raw" in src else src.get("price"))
+    record["price_raw"] = price_raw
+    record["price"] = None if price_raw.strip() in MISSING_PRICES else _parse_number(price_raw)
+
+    original_raw = _text(src.get("original_price"))
+    record["original_price"] = None if original_raw.strip() in MISSING_PRICES else _parse_number(original_raw)
+
+    match = re.search(CURRENCY_PATTERN, price_raw)
+    record["currency"] = (CURRENCY_BY_SYMBOL[match.group(1)] if match else
+                          _text(src.get("currency")).strip() or PLATFORM_CURRENCY.get(record["platform"], ""))
+
+    rate = _parse_discount_rate(record["discount"])
+    if rate is None and record["price"] is not None and record["original_price"]:
+        rate = record["price"] / record["original_price"]
+    record["discount_rate"] = None if rate is None else round(rate, 4)
+
+    for name in POSITION_FIELDS:
+        if _text(src.get(name)).strip():
+            try:
+                record[name] = int(float(src[name]))
+            except ValueError:
+                pass
+
+    # 空值不收进 extra: 与向量化路径一致 (DataFrame 里缺失的键和 None 都是 NaN，无法区分)
+    extra = dict(src.get("extra") or {})
+    extra.update({k: v for k, v in src.items()
+                  if k not in KNOWN_FIELDS and k not in FIELD_ALIASES and not _is_missing(v)})
+    record["extra"] = extra
+    return record
+
+
+def _normalize_python(records, platform=None, keyword=None):
+    return [_normalize_one(_as_dict(item), platform, keyword) for item in records
+            if isinstance(item, (dict, ProductRecord))]
+
+
+# ==================== 向量化转换 ====================
+def _str_column(df, name):
+    if name not in df:
+        return pd.Series("", index=df.index, dtype=object)
+    col = df[name]
+    return col.where(col.notna(), "").astype(str)
+
+
+def _by_unique(text, func):
+    """
+    价格 / 折扣 / 币种文本重复度很高 (百万条通常只有几千种取值)
+    只对去重后的取值做字符串解析，再按编码广播回整列
+    """
+    codes, uniques = pd.factorize(text, sort=False)
+    parsed = func(pd.Series(uniques, dtype=object)).to_numpy()
+    return pd.Series(parsed[codes], index=text.index)
+
+
+def _parse_numbers(uniques):
+    numbers = uniques.str.replace(",", "", regex=False).str.extract(NUMBER_PATTERN, expand=False)
+    return pd.to_numeric(numbers, errors="coerce").where(~uniques.str.strip().isin(MISSING_PRICES))
+
+
+def _parse_number_series(text):
+    return _by_unique(text, _parse_numbers).astype(float)
+
+
+def _parse_currency(uniques):
+    return uniques.str.extract(CURRENCY_PATTERN, expand=False).map(CURRENCY_BY_SYMBOL)
+
+
+def _parse_discount(uniques):
+    zhe = pd.to_numeric(uniques.str.extract(ZHE_PATTERN, expand=False), errors="coerce") / 10
+    pct = 1 - pd.to_numeric(uniques.str.extract(PERCENT_PATTERN, expand=False), errors="coerce") / 100
+    return zhe.fillna(pct)
+
+
+def _normalize_frame(df, platform=None, keyword=None):
+    for old, new in FIELD_ALIASES.items():
+        if old in df:
+            df[new] = _str_column(df, new).where(_str_column(df, new) != "", df[old]) if new in df else df[old]
+            df = df.drop(columns=[old])
+
+    out = pd.DataFrame(index=df.index)
+    out["platform"] = _str_column(df, "platform").str.strip().replace("", platform or "")
+    out["keyword"] = _str_column(df, "keyword").str.strip().replace("", keyword or "")
+    for name in TEXT_FIELDS:
+        out[name] = _str_column(df, name)
+
+    if "price_raw" in df:
+        price_raw = _str_column(df, "price_raw").where(df["price_raw"].notna(), _str_column(df, "price"))
+    else:
+        price_raw = _str_column(df, "price")
+    out["price_raw"] = price_raw
+    out["price"] = _parse_number_series(price_raw)
+    out["original_price"] = _parse_number_series(_str_column(df, "original_price"))
+
+    symbol = _by_unique(price_raw, _parse_currency)
+    fallback = _str_column(df, "currency").str.strip()
+    fallback = fallback.where(fallback != "", out["platform"].map(PLATFORM_CURRENCY)).fillna("")
+    out["currency"] = symbol.where(symbol.notna(), fallback)
+
+    ratio = out["price"] / out["original_price"].where(out["original_price"] > 0)
+    out["discount_rate"] = _by_unique(out["discount"], _parse_discount).astype(float).fillna(ratio).round(4)
+
+    for name in POSITION_FIELDS:
+        if name in df:
+            out[name] = pd.to_numeric(df[name], errors="coerce").astype("Int64")
+
+    extra_cols = [c for c in df.columns if c not in KNOWN_FIELDS]
+    base = df["extra"].tolist() if "extra" in df else None
+    if not extra_cols and base is None:
+        out["extra"] = [{} for _ in range(len(df))]
+        return out
+    extras = df[extra_cols].to_dict("records") if extra_cols else [{}] * len(df)
+    merged = []
+    for old, new in zip(base or [None] * len(df), extras):
+        item = dict(old) if isinstance(old, dict) else {}
+        item.update({k: v for k, v in new.items() if not _is_missing(v)})
+        merged.append(item)
+    out["extra"] = merged
+    return out
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _column_values(series):
+    values = series.tolist()
+    if series.dtype.kind == "f":
+        return [None if v != v else v for v in values]
+    if series.dtype.kind in "iu" or str(series.dtype) == "Int64":
+        return [None if v is pd.NA else int(v) for v in values]
+    return values
+
+
+def _frame_to_records(out):
+    # 按列转成 Python 列表再拼 dict，比 DataFrame.to_dict 快数倍
+    names = list(out.columns)
+    columns = [_column_values(out[name]) for name in names]
+    records = [dict(zip(names, row)) for row in zip(*columns)]
+    # 空的 page / index 不写入 (只处理含空值的列，通常一条都没有)
+    for name in POSITION_FIELDS:
+        if name in out and out[name].isna().any():
+            for pos in out[name].isna().to_numpy().nonzero()[0]:
+                records[pos].pop(name, None)
+    return records
+
+
+def normalize_records(records, platform=None, keyword=None):
+    """
+    把一批原始商品 (dict 或 ProductRecord) 转为统一结构 (保持原顺序)
+    platform / keyword: 记录本身没有该字段时使用的默认值
+    """
+    records = [_as_dict(item) for item in records if isinstance(item, (dict, ProductRecord))]
+    if not records:
+        return []
+    if pd is None:
+        return _normalize_python(records, platform, keyword)
+    df = pd.DataFrame.from_records(records)
+    return _frame_to_records(_normalize_frame(df, platform, keyword))
+
+
+# ==================== 历史文件回填 ====================
+FILE_PATTERN = re.compile(r'^(.+?)_products_\d{8}_\d{6}\.json$')
+DIR_PLATFORMS = {
+    "depop_data": "depop",
+    "ebay_data": "ebay",
+    "grailed_data": "grailed",
+    "goofish_data": "goofish",
+    "vips_data": "vips",
+    "xiaomiyoupin_data": "xiaomi",
+}
+
+
+def backfill(data_dirs, chunk_records=200000):
+    """
+    原地规范化历史 *_products_*.json
+    多个文件拼成一个 DataFrame 一次转换 (约 chunk_records 条一批)，再按文件拆回写入
+    """
+    files = []
+    for data_dir in data_dirs:
+        platform = DIR_PLATFORMS.get(Path(data_dir).name)
+        for path in sorted(Path(data_dir).glob('*_products_*.json')):
+            match = FILE_PATTERN.match(path.name)
+            if match:
+                files.append((path, platform, match.group(1)))
+
+    stats = {"files": 0, "records": 0, "seconds": 0.0}
+    started = time.time()
+    batch, batch_size = [], 0
+    for path, platform, keyword in files:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"⚠️ 跳过 {path}: {e}")
+            continue
+        if not isinstance(data, list):
+            continue
+        batch.append((path, platform, keyword, data))
+        batch_size += len(data)
+        if batch_size >= chunk_records:
+            _backfill_batch(batch, stats)
+            batch, batch_size = [], 0
+    if batch:
+        _backfill_batch(batch, stats)
+
+    stats["seconds"] = round(time.time() - started, 2)
+    return stats
+
+
+def _backfill_batch(batch, stats):
+    if pd is None:
+        results = [_normalize_python(data, platform, keyword) for _, platform, keyword, data in batch]
+    else:
+        frames = []
+        for file_no, (_, platform, keyword, data) in enumerate(batch):
+            rows = [item for item in data if isinstance(item, dict)]
+            if not rows:
+                continue
+            frame = pd.DataFrame.from_records(rows)
+            # 文件级默认值先填进列里，合并后一次转换
+            for name, default in (("platform", platform), ("keyword", keyword)):
+                if default:
+                    frame[name] = _str_column(frame, name).replace("", default)
+            frame["_file"] = file_no
+            frames.append(frame)
+        results = [[] for _ in batch]
+        if frames:
+            df = pd.concat(frames, ignore_index=True, sort=False)
+            file_no = df.pop("_file")
+            out = _normalize_frame(df)
+            # 拼接后其他文件的 page/index 为空值，_frame_to_records 会跳过，不影响续传判断
+            for no, part in out.groupby(file_no.values, sort=False):
+                results[no] = _frame_to_records(part)
+
+    for (path, _, _, _), records in zip(batch, results):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        stats["files"] += 1
+        stats["records"] += len(records)
+
+
+# ==================== 两条路径一致性校验 ====================
+def parity_diff(records, platform=None, keyword=None):
+    """
+    同一批记录分别走 pandas 与逐条转换，返回不一致的 [(序号, 字段, pandas 结果, 逐条结果)]
+    未安装 pandas 时无从比较，返回空列表
+    """
+    records = [_as_dict(item) for item in records if isinstance(item, (dict, ProductRecord))]
+    if pd is None or not records:
+        return []
+    vectorized = _frame_to_records(_normalize_frame(pd.DataFrame.from_records(records), platform, keyword))
+    python = _normalize_python(records, platform, keyword)
+    diffs = []
+    for no, (left, right) in enumerate(zip(vectorized, python)):
+        for name in sorted(set(left) | set(right)):
+            a, b = left.get(name), right.get(name)
+            if a != b and not (_is_missing(a) and _is_missing(b)):
+                diffs.append((no, name, a, b))
+    return diffs
+
+
+def check_parity(data_dirs, limit=20):
+    """对数据目录下的 *_products_*.json 逐个做一致性校验，返回 (文件数, 不一致条数)"""
+    files, mismatches = 0, 0
+    for data_dir in data_dirs:
+        platform = DIR_PLATFORMS.get(Path(data_dir).name)
+        for path in sorted(Path(data_dir).glob('*_products_*.json')):
+            match = FILE_PATTERN.match(path.name)
+            if not match:
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"⚠️ 跳过 {path}: {e}")
+                continue
+            files += 1
+            for no, name, a, b in parity_diff(data if isinstance(data, list) else [], platform, match.group(1)):
+                mismatches += 1
+                if mismatches <= limit:
+                    print(f"❌ {path.name} #{no} {name}: pandas={a!r} python={b!r}")
+    return files, mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="规范化历史爬取结果")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--backfill", nargs="+", help="数据目录 (如 /root/depop_data)")
+    mode.add_argument("--check", nargs="+", help="校验 pandas 与逐条转换结果一致的数据目录")
+    parser.add_argument("--chunk", type=int, default=200000, help="每批转换的记录数")
+    args = parser.parse_args()
+
+    if args.check:
+        if pd is None:
+            raise SystemExit("❌ 未安装 pandas，无法对比两条转换路径")
+        files, mismatches = check_parity(args.check)
+        if mismatches:
+            raise SystemExit(f"❌ {files} 个文件中有 {mismatches} 处不一致")
+        print(f"✅ {files} 个文件两条路径结果一致")
+    else:
+        result = backfill(args.backfill, chunk_records=args.chunk)
+        print(f"✅ 回填完成: {result['files']} 个文件, {result['records']} 条记录, 耗时 {result['seconds']}s")
@@ -12,8 +12,30 @@ from pathlib import Path
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 from bs4 import BeautifulSoup
 import re
-import pyautogui
-import pyperclip
+try:
+    import pyautogui
+    import pyperclip
+except Exception:
+    # 无图形界面 (服务器 / CI) 时导入会失败，此时只能使用解析功能 (extract_products)
+    pyautogui = None
+    pyperclip = None
+import sys
+
+try:
+    from record_schema import normalize_records, ProductRecord
+except ImportError:
+    try:
+        from resources.spiders.record_schema import normalize_records, ProductRecord
+    except ImportError:
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+        from record_schema import normalize_records, ProductRecord
+
+try:
+    from crawler_base import (install_site_overrides, emit_event, rate_limiter, CrawlLedger, DeltaCutoff,
+                              fresh_keywords, site_ttl)
+except ImportError:
+    from resources.spiders.crawler_base import (install_site_overrides, emit_event, rate_limiter, CrawlLedger,
+                                                DeltaCutoff, fresh_keywords, site_ttl)
 
 
 # Cookies 文件路径
@@ -22,6 +44,8 @@ COOKIES_FILE = Path(__file__).parent / 'vips_cookies.json'
 
 class VipsCrawler:
     """唯品会 VIP.com 爬虫类"""
+    # 增量模式按上新时间排序
+    delta_sort = "&sort=new"
     
     def __init__(self, headless=True, save_html=False, cookies_file=None):
         """
@@ -237,7 +261,8 @@ class VipsCrawler:
         
         self.browser = await self.playwright.chromium.launch(
             headless=self.headless,
-            channel='msedge',
+            # 默认使用 Edge；CRAWLER_BROWSER_CHANNEL 为空时使用 Playwright 自带的 Chromium
+            channel=os.environ.get("CRAWLER_BROWSER_CHANNEL", "msedge") or None,
             args=[
                 '--disable-blink-features=AutomationControlled',
                 '--disable-dev-shm-usage',
@@ -259,6 +284,7 @@ class VipsCrawler:
             except Exception as e:
                 print(f"⚠️ 应用 cookies 失败: {e}")
         
+        await install_site_overrides(self.context)
         self.page = await self.context.new_page()
         
         # 隐藏webdriver特征
@@ -376,6 +402,8 @@ class VipsCrawler:
         返回:
             tuple: (success: bool, should_skip: bool)
         """
+        emit_event("counter", name="verifications", value=1)
+        rate_limiter.penalize("vips")
         print("\n" + "="*60)
         print("⚠️  检测到需要验证！")
         print("="*60)
@@ -566,10 +594,7 @@ class VipsCrawler:
         
         for idx, container in enumerate(product_containers, 1):
             try:
-                product = {
-                    'page': page_num,
-                    'index': idx
-                }
+                product = ProductRecord('vips', page=page_num, index=idx)
                 
                 # 1. 提取商品ID（从 data-product-id 属性）
                 product_id = container.get('data-product-id', '')
@@ -718,7 +743,8 @@ class VipsCrawler:
         return products
 
 
-async def crawl_products_automated(products, num_pages_per_product, headless=False, save_html=False, output_dir='vips_data'):
+async def crawl_products_automated(products, num_pages_per_product, headless=False, save_html=False, output_dir='vips_data',
+                                   delta=False):
     """
     按照自动化流程爬取多个商品的多页数据
     
@@ -728,6 +754,7 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
         headless: 是否无头模式（默认False）
         save_html: 是否保存HTML文件
         output_dir: 输出目录
+        delta: 增量模式，已有数据的商品翻到已爬过的商品就停，新商品合并进旧数据
     
     返回:
         all_products: 所有商品列表
@@ -743,9 +770,21 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
     
     crawler = VipsCrawler(headless=headless, save_html=save_html)
     all_products = []
+    ledger = CrawlLedger(output_dir)
+
+    # 单浏览器串行爬取: 以固定的 worker 0 上报与 MultiCrawlerManager 相同格式的进度事件
+    def keyword_done(keyword, items, error=None, complete=False):
+        fields = {"error": error} if error else {}
+        if complete:
+            fields["complete"] = True
+        emit_event("keyword_done", port=0, keyword=keyword, items=items, **fields)
+
+    current_keyword = None
     
     try:
         await crawler.init_browser()
+        emit_event("job_start", keywords_total=len(products), workers=1, max_workers=1, autoscale=False)
+        emit_event("worker_state", port=0, state="running")
         
         # 打开首页
         url = "https://www.vip.com"
@@ -799,18 +838,26 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
                 print(f"{'='*60}")
                 continue
             
+            current_keyword, keyword_error = product_name, None
+            emit_event("keyword_start", port=0, keyword=product_name)
             print(f"\n{'='*60}")
             print(f"商品 {product_idx}/{len(products)}: {product_name}")
             print(f"{'='*60}")
             
             product_products = []
+            cutoff = DeltaCutoff.for_keyword(output_dir, product_name) if delta else None
+            if cutoff is not None:
+                print(f"🧭 增量模式: {product_name} 已知 {len(cutoff.known)} 条，翻到已知商品即停")
             should_skip = False
             
             # 使用URL直接搜索（更可靠的方式）
             search_url = f"https://category.vip.com/suggest.php?keyword={product_name}&ff=search|home|head|input"
+            if cutoff is not None:
+                search_url += crawler.delta_sort
             print(f"\n打开搜索页面: {search_url}")
             
             try:
+                await rate_limiter.acquire("vips")
                 await crawler.page.goto(search_url, wait_until='domcontentloaded', timeout=60000)
                 await asyncio.sleep(2)
                 
@@ -833,10 +880,12 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
                         current_wait_time = 127 + (consecutive_failures * 10)
                 
                 if should_skip:
+                    keyword_done(product_name, 0, error="触发验证，跳过该商品")
                     continue
                 
             except Exception as e:
                 print(f"⚠️ 打开搜索页面失败: {e}")
+                keyword_done(product_name, 0, error=f"打开搜索页面失败: {e}")
                 continue
             
             # 遍历每个页面
@@ -883,6 +932,7 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
                     for attempt in range(max_retries):
                         try:
                             html_content = await crawler.page.content()
+                            emit_event("counter", name="pages_fetched", value=1)
                             break
                         except Exception as e:
                             if attempt < max_retries - 1:
@@ -902,19 +952,25 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
                         products_data = crawler.extract_products(html_content, page_num)
                         product_products.extend(products_data)
                         print(f"  ✓ 第 {page_num} 页完成，提取到 {len(products_data)} 个商品")
+                        if cutoff is not None and cutoff.check(products_data):
+                            print(f"  🧭 第 {page_num} 页大多已爬过，停止翻页")
+                            break
                         
                         consecutive_failures = 0
                         current_wait_time = 127
                     else:
                         print(f"  ⚠️ 第 {page_num} 页无法获取HTML内容")
+                        keyword_error = f"第 {page_num} 页无法获取HTML内容"
                 
                 except Exception as e:
                     print(f"  ⚠️ 第 {page_num} 页爬取出错: {e}")
+                    keyword_error = f"第 {page_num} 页爬取出错: {e}"
                 
                 # 如果不是最后一页，点击下一页
                 if page_num < num_pages_per_product:
                     print(f"  点击下一页...")
                     try:
+                        await rate_limiter.acquire("vips")
                         # 尝试使用选择器点击下一页
                         next_page_selectors = [
                             '.J-page-item.page-next-txt',
@@ -957,11 +1013,24 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
                         
                     except Exception as e:
                         print(f"  ⚠️ 翻页失败: {e}")
+                        keyword_error = f"第 {page_num} 页翻页失败: {e}"
                         break
             
             # 保存当前商品的数据
+            if should_skip and keyword_error is None:
+                keyword_error = "触发验证，提前结束翻页"
+            items = len(product_products)
             if product_products:
+                for product in product_products:
+                    product.keyword = product_name
                 all_products.extend(product_products)
+                if cutoff is not None:
+                    # 本次结果在前，旧数据接在后面
+                    fresh = len(cutoff.fresh(product_products))
+                    product_products = cutoff.merge(product_products)
+                    print(f"🧭 {product_name} 新商品 {fresh} 条，合并后共 {len(product_products)} 条")
+                # 统一字段结构 (数值价格 + 币种)，写文件时才展开为 dict
+                product_products = normalize_records(product_products, platform="vips")
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 
                 # 保存JSON
@@ -971,15 +1040,29 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
                 print(f"\n✓ {product_name} 的JSON数据已保存: {json_file}")
                 
                 print(f"✓ {product_name} 完成，共提取 {len(product_products)} 个商品")
+                # 新文件取代该关键词的旧文件 (过期重爬时不留重复数据)，并记账
+                for old_name in os.listdir(output_dir):
+                    if re.match(rf'^{re.escape(product_name)}_products_(?!{timestamp})\d{{8}}_\d{{6}}\.(json|csv)$', old_name):
+                        os.remove(os.path.join(output_dir, old_name))
+                # 所有页都正常爬完 (或翻到底 / 追上已知商品) 才记账，中途出错的下次还要再爬
+                if keyword_error is None:
+                    ledger.mark_success(product_name, len(product_products))
             else:
                 print(f"\n⚠️ {product_name} 未提取到任何商品")
+            if keyword_error is not None:
+                # 数据文件已经写了，记一笔尝试，免得下次按文件修改时间当成爬完跳过
+                ledger.mark_attempt(product_name)
+            keyword_done(product_name, items, error=keyword_error, complete=keyword_error is None)
+            current_keyword = None
+
+        emit_event("worker_state", port=0, state="finished")
         
         # 保存所有商品的总数据
         if all_products:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             all_json_file = os.path.join(output_dir, f"all_products_{timestamp}.json")
             with open(all_json_file, 'w', encoding='utf-8') as f:
-                json.dump(all_products, f, ensure_ascii=False, indent=2)
+                json.dump(normalize_records(all_products, platform="vips"), f, ensure_ascii=False, indent=2)
             print(f"\n{'='*60}")
             print(f"✓ 所有商品数据已保存: {all_json_file}")
             print(f"总共爬取到 {len(all_products)} 个商品")
@@ -987,6 +1070,10 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
         
     except Exception as e:
         print(f"❌ 爬取过程出错: {e}")
+        if current_keyword is not None:
+            ledger.mark_attempt(current_keyword)
+            keyword_done(current_keyword, 0, error=str(e))
+        emit_event("worker_state", port=0, state="crashed", error=str(e))
         import traceback
         traceback.print_exc()
     finally:
@@ -995,24 +1082,25 @@ async def crawl_products_automated(products, num_pages_per_product, headless=Fal
     return all_products
 
 
-def get_crawled_products(data_dir='vips_data', check_html=True):
+def get_crawled_products(data_dir='vips_data', check_html=True, ttl_hours=None):
     """
     从数据目录中提取已爬取的商品名称
     
     参数:
         data_dir: 数据目录路径
+        ttl_hours: 重爬间隔 (小时)，默认按站点 TTL (crawler_base.SITE_TTL_HOURS)，超过 TTL 的不算已爬取
         check_html: 是否也检查 HTML 文件
     
     返回:
-        set: 已爬取的商品名称集合
+        set: TTL 内爬取过的商品名称集合
     """
     from pathlib import Path
     
-    crawled_products = set()
+    crawled_at = {}  # 商品名称 -> 最新文件修改时间
     data_path = Path(data_dir)
     
     if not data_path.exists():
-        return crawled_products
+        return set()
     
     # 查找所有 *_products_*.json 文件
     for json_file in data_path.glob('*_products_*.json'):
@@ -1021,16 +1109,16 @@ def get_crawled_products(data_dir='vips_data', check_html=True):
         match = re.match(r'^(.+?)_products_\d{8}_\d{6}\.json$', json_file.name)
         if match:
             product_name = match.group(1)
-            crawled_products.add(product_name)
+            crawled_at[product_name] = max(crawled_at.get(product_name, 0), json_file.stat().st_mtime)
     
     if check_html:
         for html_file in data_path.glob('*_page_*.html'):
             match = re.match(r'^(.+?)_page_\d+\.html$', html_file.name)
             if match:
                 product_name = match.group(1)
-                crawled_products.add(product_name)
+                crawled_at[product_name] = max(crawled_at.get(product_name, 0), html_file.stat().st_mtime)
     
-    return crawled_products
+    return fresh_keywords(crawled_at, CrawlLedger(data_dir), site_ttl("vips", ttl_hours))
 
 
 def filter_products(products_list, crawled_products):